@@ -1,26 +1,32 @@
-import azure.cognitiveservices.speech as speechsdk
+# Heavy SDKs (azure.cognitiveservices.speech, openai, azure.identity, numpy and the VAD backends) are imported on first use,
+# so the worker starts fast and the routes which don't use them (e.g. '/', '/about', '/team', '/records') don't pay for them
 import base64
+import collections
 import datetime
+import hashlib
 import html
 import json
-import numpy as np
 import os
+import platform
 import pytz
 import random
 import re
 import requests
+import stat
+import tempfile
 import threading
 import time
-import torch
 import traceback
 import uuid
 from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 # import uvicorn
 # import pyodbc
 from flask_socketio import SocketIO, join_room
-from azure.identity import DefaultAzureCredential
-from openai import AzureOpenAI
-from vad_iterator import VADIterator, int2float
+from chat_history import ChatHistory
+from client_context import ClientContext
+from metrics import LatencyRecorder
+from sentence_segmenter import SentenceSegmenter
+from token_provider import TokenProvider
 from utils import load_env_variables, load_scenario_profile, load_background_image, initialize_database, insert_train_record
 import logging
 import gunicorn
@@ -40,20 +46,57 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__, template_folder='.')
 app.secret_key = 'dh8dh329dj30dj'  # Replace with a secure random key in production
 
-# Create the SocketIO instance
-socketio = SocketIO(app)
-
 # Const variables
 is_custom_avatar = False # Flag to indicate if the avatar is a custom avatar
 enable_websockets = True # Enable websockets between client and server for real-time communication optimization
+enable_binary_audio = True # Send microphone audio as binary websocket frames instead of base64 encoded JSON, only when websockets are enabled
 enable_vad = False # Enable voice activity detection (VAD) for interrupting the avatar speaking
+vad_backend_name = 'onnx' # VAD backend, 'onnx' runs the local model file with ONNX Runtime, 'torch' downloads the model with torch.hub
+vad_onnx_model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'silero_vad.onnx') # Silero VAD ONNX model shipped with the app
+vad_torch_fallback = False # Use the torch backend (torch.hub download) if the VAD ONNX model is missing, instead of failing at startup
 enable_token_auth_for_speech = False # Enable token authentication for speech service
+token_cache_dir = os.path.join(tempfile.gettempdir(), f'avatar_token_cache_{os.getuid()}') if os.name == 'posix' else None # Directory of the token files shared by the worker processes of a host, so the tokens are fetched once per host. None to fetch them in every process
+token_wait_timeout_seconds = 10 # Maximum time a request waits for the speech token or the ICE token to be fetched
 # default_tts_voice = 'en-US-JennyMultilingualV2Neural' # Default TTS voice
 sentence_level_punctuations = [ '.', '?', '!', ':', ';', '。', '？', '！', '：', '；' ] # Punctuations that indicate the end of a sentence
+sentence_max_chars = 200 # Send a sentence without punctuation to TTS at a word boundary once it is longer than this, 0 to disable
 enable_quick_reply = False # Enable quick reply for certain chat models which take longer time to respond
 quick_replies = [ 'Let me take a look.', 'Let me check.', 'One moment, please.' ] # Quick reply reponses
 oyd_doc_regex = re.compile(r'\[doc(\d+)\]') # Regex to match the OYD (on-your-data) document reference
 repeat_speaking_sentence_after_reconnection = True # Repeat the speaking sentence after reconnection
+speech_scheduler_workers = 16 # Number of shared speaking threads, which submit the sentences to TTS without waiting for the audio
+stt_pool_size = 1 # Number of speech recognizers built ahead per STT endpoint, 0 to disable
+stt_pause_flush_ms = 1000 # Silence written to the recognizer when the microphone is stopped, to end the utterance in progress
+avatar_pool_size = 1 # Number of speech synthesizers built ahead per (voice, character, style), so connectAvatar doesn't build them, 0 to disable
+teardown_timeout_seconds = 2 # Maximum time to wait for the speaking to stop and for the avatar connection to close, on disconnect
+chat_history_max_tokens = 6000 # Token budget of the chat prompt (system prompt, summary and latest turns), the older turns are left out, 0 for no limit
+chat_history_summary = False # Fold the turns left out of the chat prompt into a running summary, with an extra chat completion per fold
+chat_history_summary_prompt = 'Update the summary of the conversation with the new messages. Keep the facts, names, decisions and open questions, in at most 150 words. Reply with the summary only.' # Instructions of the chat history summary
+chat_max_concurrency = 32 # Maximum number of chat completions streamed at the same time by a worker process, more wait for a slot
+chat_max_buffered_chunks = 64 # Maximum number of chat completion chunks read ahead of the reply consumer, per reply
+tts_max_queued_sentences = 8 # Pause reading the chat reply while more sentences than this wait to be spoken, 0 to disable
+tts_queue_wait_timeout_seconds = 30 # Maximum time the chat reply is paused for the speaking to catch up
+session_store_path = None # SQLite file of the server side sessions, to share them between worker processes, None to keep them in memory
+session_max_idle_seconds = 12 * 60 * 60 # Time after which a server side session not used by any client is removed
+client_idle_timeout_seconds = 30 * 60 # Time without requests, socket messages or speaking after which a client context is released, e.g. of a closed tab
+client_eviction_interval_seconds = 60 # Time between two checks for idle client contexts
+tts_lookahead = 2 # Number of sentences submitted to the avatar connection ahead of the speaking one, so they are synthesized without a gap, 0 to submit one sentence at a time
+socketio_async_mode = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading') # Concurrency mode, 'threading' (supported) or 'eventlet' / 'gevent', which must match the gunicorn worker class, see gunicorn.conf.py
+background_task_workers = 32 # Threads running the replies to the recognized utterances and the chat history folds, off the speech SDK callback threads (threading mode)
+interrupt_task_workers = 4 # Threads running the barge-in stops, apart from the background tasks so a stop doesn't wait behind the replies it interrupts (threading mode)
+socketio_message_queue = os.environ.get('SOCKETIO_MESSAGE_QUEUE') # Message queue sharing the Socket.IO rooms between workers and hosts, e.g. redis://host:6379/0, or tcp://127.0.0.1:5556 for the local broker of message_queue.py. None for a single worker
+max_session_clients = 4 # Clients (chat pages) of a browser session kept in its cookie, which the worker receiving their first request takes over, see claimClient()
+max_released_clients = 10000 # Ids of the released clients remembered per worker, so their late requests get 410 instead of a new context, see claimClient()
+enable_response_cache = False # Reuse the chat reply of the same question at the same point of the same scenario conversation (e.g. the opening questions), instead of a chat completion
+response_cache_max_entries = 1000 # Maximum number of cached chat replies per worker process, the least recently used ones are evicted
+response_cache_ttl_seconds = 60 * 60 # Time after which a cached chat reply is not used any more, e.g. after the search index was updated
+
+# Create the SocketIO instance, with several workers the rooms are shared through the message queue
+if socketio_message_queue and socketio_message_queue.startswith('tcp://'):
+    from message_queue import TcpPubSubManager
+    socketio = SocketIO(app, async_mode=socketio_async_mode, client_manager=TcpPubSubManager(socketio_message_queue))
+else:
+    socketio = SocketIO(app, async_mode=socketio_async_mode, message_queue=socketio_message_queue)
 
 # Load environment variables
 env_vars = load_env_variables()
@@ -107,20 +150,24 @@ logger.info(f"sql_password: {sql_password}")
 # sql_conn = initialize_database(server=sql_server, database=sql_database, username=sql_username, password=sql_password)
 
 # Global variables
-client_contexts = {} # Client contexts
-speech_token = None # Speech token
-ice_token = None # ICE token
-if azure_openai_endpoint and azure_openai_api_key:
-    azure_openai = AzureOpenAI(
-        azure_endpoint=azure_openai_endpoint,
-        api_version='2025-01-01-preview',
-        api_key=azure_openai_api_key)
-
-# VAD
-vad_iterator = None
-if enable_vad and enable_websockets:
-    vad_model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
-    vad_iterator = VADIterator(model=vad_model, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=150, speech_pad_ms=100)
+worker_id = f'{platform.node()}:{os.getpid()}' # This worker process, which owns the client contexts it created, see claimClient()
+client_contexts = {} # Client contexts owned by this worker
+released_client_ids = collections.OrderedDict() # Clients released by this worker with several workers, the oldest first, see claimClient()
+speech_token_provider = None # Speech token, refreshed every 9 minutes, see fetchSpeechToken()
+ice_token_provider = None # ICE token, refreshed every 24 hours, see fetchIceToken()
+chat_engine = None # Chat completion streams of all clients, created on the first chat, see getChatEngine()
+vad_engine = None # VAD engine shared by all clients, created on the first VAD frame, see getVadEngine()
+stt_recognizer_pool = None # Pre-built speech recognizers, created on the first STT connection, see getSttRecognizerPool()
+stt_stats = { 'recognizersCreated': 0, 'connects': 0, 'connectTotalMs': 0, 'resumes': 0, 'resumeTotalMs': 0 } # STT session counters, see getPoolStats()
+avatar_synthesizer_pool = None # Pre-built avatar speech synthesizers, created on the first chat session, see getAvatarSynthesizerPool()
+speech_scheduler = None # Speaking workers shared by all clients, created on the first speech, see getSpeechScheduler()
+client_evictor = None # Releases the idle client contexts, see releaseClientInternal()
+session_store = None # Server side session data, the cookie only keeps the session id, see getSessionStore()
+latency_recorder = None # Latency histograms of the voice turns, exported on /metrics, see recordLatency()
+background_executor = None # Runs the background tasks in threading mode, created on the first task, see startBackgroundTask()
+interrupt_executor = None # Runs the barge-in stops in threading mode, created on the first stop, see startInterruptTask()
+response_cache = None # Chat replies of the repeated questions, created on the first chat if enabled, see getResponseCache()
+lazy_init_lock = threading.Lock() # Lock for the lazily created global objects
 
 # # The default route, which shows the default web page (basic.html)
 # @app.route("/")
@@ -157,23 +204,26 @@ def process_input():
 
     # insert_train_record(conn=sql_conn, name=name, student_id=student_id, diploma=diploma, date=date, scenario=scenario)
 
-    # Store in session
-    session['name'] = name
-    session['student_id'] = student_id
-    session['diploma'] = diploma
-    session['date'] = date
-    session['scenario'] = scenario
-    session['scenario_num'] = scenario_num
+    # Store in the server side session
+    startSession({
+        'name': name,
+        'student_id': student_id,
+        'diploma': diploma,
+        'date': date,
+        'scenario': scenario,
+        'scenario_num': scenario_num
+    })
     return redirect(url_for('chat_session'))
 
 @app.route('/chat_session')
 def chat_session():
-    name = session.get('name')
-    student_id = session.get('student_id')
-    diploma = session.get('diploma')
-    date = session.get('date')
-    scenario = session.get('scenario')
-    scenario_num = session.get('scenario_num', 1)
+    session_data = getSessionData()
+    name = session_data.get('name')
+    student_id = session_data.get('student_id')
+    diploma = session_data.get('diploma')
+    date = session_data.get('date')
+    scenario = session_data.get('scenario')
+    scenario_num = session_data.get('scenario_num', 1)
 
     avatar_name, avatar_character, avatar_style, tts_voice, cognitive_search_index_name, system_prompt = load_scenario_profile(scenario_num, cognitive_search_index_base_name)
     background_image_url = load_background_image(
@@ -183,13 +233,13 @@ def chat_session():
         container_name=storage_account_container_name
     )
 
-    session['avatar_name'] = avatar_name
-    session['avatar_character'] = avatar_character
-    session['avatar_style'] = avatar_style
-    session['tts_voice'] = tts_voice
-    session['background_image_url'] = background_image_url
-    session['system_prompt'] = system_prompt
-    session['cognitive_search_index_name'] = cognitive_search_index_name
+    # The scenario profile is kept in the client context, instead of the cookie session
+    scenario_profile = buildScenarioProfile(scenario_num)
+
+    # Build the avatar speech synthesizer while the page loads, in the worker which will serve the client (single worker)
+    avatar_synthesizer_pool = getAvatarSynthesizerPool()
+    if avatar_synthesizer_pool and not socketio_message_queue:
+        avatar_synthesizer_pool.warm(None) # The standard voices, see getAvatarSynthesizerPool()
 
     return render_template(
         "templates/chat.html",
@@ -204,8 +254,9 @@ def chat_session():
         avatar_style=avatar_style,
         tts_voice=tts_voice,
         background_image_url=background_image_url,
-        client_id=initializeClient(),
-        enable_websockets=enable_websockets
+        client_id=initializeClient(scenario_profile),
+        enable_websockets=enable_websockets,
+        enable_binary_audio=enable_binary_audio
     )
 
 # # Set default scenario/profile for initial load (not user-specific)
@@ -241,7 +292,10 @@ def records():
 # The API route to get the speech token
 @app.route("/api/getSpeechToken", methods=["GET"])
 def getSpeechToken() -> Response:
-    global speech_token
+    try:
+        speech_token = speech_token_provider.get(token_wait_timeout_seconds)
+    except TimeoutError as e:
+        return Response(f"Speech token is not available. Error message: {e}", status=503)
     response = Response(speech_token, status=200)
     response.headers['SpeechRegion'] = speech_region
     if speech_private_endpoint:
@@ -259,7 +313,10 @@ def getIceToken() -> Response:
             'Password': ice_server_password
         })
         return Response(custom_ice_token, status=200)
-    return Response(ice_token, status=200)
+    try:
+        return Response(ice_token_provider.get(token_wait_timeout_seconds), status=200)
+    except TimeoutError as e:
+        return Response(f"ICE token is not available. Error message: {e}", status=503)
 
 # The API route to get the status of server
 @app.route("/api/getStatus", methods=["GET"])
@@ -268,58 +325,78 @@ def getStatus() -> Response:
     client_id = uuid.UUID(request.headers.get('ClientId'))
     client_context = client_contexts[client_id]
     status = {
-        'speechSynthesizerConnected': client_context['speech_synthesizer_connected']
+        'speechSynthesizerConnected': client_context.speech_synthesizer_connected,
+        'speaking': speech_scheduler.stats(client_id) if speech_scheduler else None,
+        'chatHistory': client_context.chat_history.stats() if client_context.chat_history else None
     }
     return Response(json.dumps(status), status=200)
 
+# The API route to get the hit rate and the connect time of the avatar synthesizer and STT recognizer pools, and the chat engine load
+@app.route("/api/getPoolStats", methods=["GET"])
+def getPoolStats() -> Response:
+    stats = {
+        'avatarSynthesizerPool': avatar_synthesizer_pool.stats() if avatar_synthesizer_pool else None,
+        'worker': worker_id,
+        'chatEngine': chat_engine.stats() if chat_engine else None,
+        'responseCache': response_cache.stats() if response_cache else None,
+        'latency': latency_recorder.summary(),
+        'clientContexts': client_evictor.stats() if client_evictor else None,
+        'sttRecognizerPool': stt_recognizer_pool.stats() if stt_recognizer_pool else None,
+        'sttSessions': {
+            'recognizersCreated': stt_stats['recognizersCreated'],
+            'connects': stt_stats['connects'],
+            'connectLatencyAvgMs': round(stt_stats['connectTotalMs'] / stt_stats['connects']) if stt_stats['connects'] else 0,
+            'resumes': stt_stats['resumes'],
+            'resumeLatencyAvgMs': round(stt_stats['resumeTotalMs'] / stt_stats['resumes'], 1) if stt_stats['resumes'] else 0
+        }
+    }
+    return Response(json.dumps(stats), status=200)
+
+# The route to export the latency histograms of the voice turns and the response cache counters, in the Prometheus text format
+@app.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    text = latency_recorder.render() + (response_cache.render() if response_cache else '')
+    return Response(text, mimetype='text/plain; version=0.0.4', status=200)
+
 # The API route to connect the TTS avatar
 @app.route("/api/connectAvatar", methods=["POST"])
 def connectAvatar() -> Response:
     global client_contexts
+    connect_start_time = time.perf_counter()
     client_id = uuid.UUID(request.headers.get('ClientId'))
     isReconnecting = request.headers.get('Reconnect') and request.headers.get('Reconnect').lower() == 'true'
+    import azure.cognitiveservices.speech as speechsdk
     # disconnect avatar if already connected
     disconnectAvatarInternal(client_id, isReconnecting)
     client_context = client_contexts[client_id]
 
     # Override default values with client provided values
-    # client_context['azure_openai_deployment_name'] = request.headers.get('AoaiDeploymentName') if request.headers.get('AoaiDeploymentName') else azure_openai_deployment_name
-    # client_context['cognitive_search_index_name'] = request.headers.get('CognitiveSearchIndexName') if request.headers.get('CognitiveSearchIndexName') else cognitive_search_index_name
-    # client_context['tts_voice'] = request.headers.get('TtsVoice') if request.headers.get('TtsVoice') else default_tts_voice
-    # client_context['custom_voice_endpoint_id'] = request.headers.get('CustomVoiceEndpointId')
-    # client_context['personal_voice_speaker_profile_id'] = request.headers.get('PersonalVoiceSpeakerProfileId')
+    # client_context.azure_openai_deployment_name = request.headers.get('AoaiDeploymentName') if request.headers.get('AoaiDeploymentName') else azure_openai_deployment_name
+    # client_context.cognitive_search_index_name = request.headers.get('CognitiveSearchIndexName') if request.headers.get('CognitiveSearchIndexName') else cognitive_search_index_name
+    # client_context.tts_voice = request.headers.get('TtsVoice') if request.headers.get('TtsVoice') else default_tts_voice
+    # client_context.custom_voice_endpoint_id = request.headers.get('CustomVoiceEndpointId')
+    # client_context.personal_voice_speaker_profile_id = request.headers.get('PersonalVoiceSpeakerProfileId')
 
     # No need to overide
-    client_context['azure_openai_deployment_name'] = azure_openai_deployment_name
-    client_context['cognitive_search_index_name'] = session.get("cognitive_search_index_name")
-    client_context['tts_voice'] = session.get("tts_voice")
+    client_context.azure_openai_deployment_name = azure_openai_deployment_name
+
+    custom_voice_endpoint_id = client_context.custom_voice_endpoint_id
 
-    custom_voice_endpoint_id = client_context['custom_voice_endpoint_id']
+    try:
+        speech_token = speech_token_provider.get(token_wait_timeout_seconds) if enable_token_auth_for_speech else None
+        ice_token = ice_token_provider.get(token_wait_timeout_seconds)
+    except TimeoutError as e:
+        return Response(f"Avatar connection failed. Error message: {e}", status=503)
 
     try:
-        if speech_private_endpoint:
-            speech_private_endpoint_wss = speech_private_endpoint.replace('https://', 'wss://')
+        # The WebRTC handshake needs the SDP of this client, so only the synthesizer can be built ahead
+        avatar_synthesizer_pool = getAvatarSynthesizerPool()
+        if avatar_synthesizer_pool and not custom_voice_endpoint_id:
+            speech_synthesizer, pool_hit = avatar_synthesizer_pool.acquire(custom_voice_endpoint_id)
             if enable_token_auth_for_speech:
-                while not speech_token:
-                    time.sleep(0.2)
-                speech_config = speechsdk.SpeechConfig(endpoint=f'{speech_private_endpoint_wss}/tts/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
-                speech_config.authorization_token = speech_token
-            else:
-                speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=f'{speech_private_endpoint_wss}/tts/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
+                speech_synthesizer.authorization_token = speech_token
         else:
-            if enable_token_auth_for_speech:
-                while not speech_token:
-                    time.sleep(0.2)
-                speech_config = speechsdk.SpeechConfig(endpoint=f'wss://{speech_region}.tts.speech.microsoft.com/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
-                speech_config.authorization_token = speech_token
-            else:
-                speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=f'wss://{speech_region}.tts.speech.microsoft.com/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
-
-        if custom_voice_endpoint_id:
-            speech_config.endpoint_id = custom_voice_endpoint_id
-
-        client_context['speech_synthesizer'] = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
-        speech_synthesizer = client_context['speech_synthesizer']
+            speech_synthesizer, pool_hit = createAvatarSynthesizer(custom_voice_endpoint_id), False
         
         ice_token_obj = json.loads(ice_token)
         # Apply customized ICE server if provided
@@ -330,6 +407,12 @@ def connectAvatar() -> Response:
                 'Password': ice_server_password
             }
         local_sdp = request.data.decode('utf-8')
+        background_image_url = load_background_image(
+            client_context.scenario_num,
+            account_name=storage_account_name,
+            account_key=storage_account_key,
+            container_name=storage_account_container_name
+        ) # Cached, and renewed before it expires, so a reconnection after a long session gets a valid URL
         # avatar_character = request.headers.get('AvatarCharacter')
         # avatar_style = request.headers.get('AvatarStyle')
         background_color = '#FFFFFFFF' if request.headers.get('BackgroundColor') is None else request.headers.get('BackgroundColor')
@@ -340,9 +423,9 @@ def connectAvatar() -> Response:
         logger.info(f"isReconnecting: {isReconnecting}")
         logger.info(f"client_id: {client_id}")
         logger.info(f"local_sdp: {local_sdp}")
-        logger.info(f"avatar_character: {session.get('avatar_character')}")
-        logger.info(f"avatar_style: {session.get('avatar_style')}")
-        logger.info(f"background_image_url: {session.get('background_image_url')}")
+        logger.info(f"avatar_character: {client_context.avatar_character}")
+        logger.info(f"avatar_style: {client_context.avatar_style}")
+        logger.info(f"background_image_url: {background_image_url}")
         transparent_background = 'false' if request.headers.get('TransparentBackground') is None else request.headers.get('TransparentBackground')
         video_crop = 'false' if request.headers.get('VideoCrop') is None else request.headers.get('VideoCrop')
         avatar_config = {
@@ -375,12 +458,12 @@ def connectAvatar() -> Response:
                     'talkingAvatar': {
                         # 'customized': is_custom_avatar.lower() == 'true',
                         'customized': is_custom_avatar,
-                        'character': session.get('avatar_character'),
-                        'style': session.get('avatar_style'),
+                        'character': client_context.avatar_character,
+                        'style': client_context.avatar_style,
                         'background': {
                             'color': '#00FF00FF' if transparent_background.lower() == 'true' else background_color,
                             'image': {
-                                'url': session.get('background_image_url')
+                                'url': background_image_url
                             }
                         }
                     }
@@ -392,18 +475,19 @@ def connectAvatar() -> Response:
         connection.connected.connect(lambda evt: print(f'TTS Avatar service connected.'))
         def tts_disconnected_cb(evt):
             print(f'TTS Avatar service disconnected.')
-            client_context['speech_synthesizer_connection'] = None
-            client_context['speech_synthesizer_connected'] = False
+            client_context.avatar_disconnected(speech_synthesizer_disconnected)
             if enable_websockets:
                 socketio.emit("response", { 'path': 'api.event', 'eventType': 'SPEECH_SYNTHESIZER_DISCONNECTED' }, room=client_id)
         connection.disconnected.connect(tts_disconnected_cb)
+        speech_synthesizer.synthesis_started.connect(lambda evt: handleSynthesisStarted(client_id, evt))
+        speech_synthesizer.synthesis_completed.connect(lambda evt: handleSynthesisCompleted(client_id, evt))
+        speech_synthesizer.synthesis_canceled.connect(lambda evt: handleSynthesisCanceled(client_id, evt))
         connection.set_message_property('speech.config', 'context', json.dumps(avatar_config))
-        client_context['speech_synthesizer_connection'] = connection
-        client_context['speech_synthesizer_connected'] = True
+        speech_synthesizer_disconnected = client_context.connect_avatar(speech_synthesizer, connection)
         if enable_websockets:
             socketio.emit("response", { 'path': 'api.event', 'eventType': 'SPEECH_SYNTHESIZER_CONNECTED' }, room=client_id)
 
-        speech_sythesis_result = speech_synthesizer.speak_text_async('').get()
+        speech_sythesis_result = runBlocking(speech_synthesizer.speak_text_async('').get)
         print(f'Result id for avatar connection: {speech_sythesis_result.result_id}')
         if speech_sythesis_result.reason == speechsdk.ResultReason.Canceled:
             cancellation_details = speech_sythesis_result.cancellation_details
@@ -414,6 +498,12 @@ def connectAvatar() -> Response:
         turn_start_message = speech_synthesizer.properties.get_property_by_name('SpeechSDKInternal-ExtraTurnStartMessage')
         remoteSdp = json.loads(turn_start_message)['webrtc']['connectionString']
 
+        connect_time_ms = round((time.perf_counter() - connect_start_time) * 1000)
+        print(f"Avatar connect time: {connect_time_ms}ms (synthesizer pool {'hit' if pool_hit else 'miss'})")
+        if avatar_synthesizer_pool:
+            avatar_synthesizer_pool.record_latency(pool_hit, connect_time_ms)
+        recordLatency(client_id, 'avatar_connect', connect_time_ms)
+
         return Response(remoteSdp, status=200)
 
     except Exception as e:
@@ -424,6 +514,17 @@ def connectAvatar() -> Response:
 def connectSTT() -> Response:
     global client_contexts
     client_id = uuid.UUID(request.headers.get('ClientId'))
+    connect_start_time = time.perf_counter()
+    client_context = client_contexts[client_id]
+    # Resume the paused recognizer of the client, if it is still connected
+    if client_context.speech_recognizer and client_context.stt_paused_time is not None and not client_context.stt_canceled:
+        resumeSttInternal(client_id)
+        resume_time_ms = (time.perf_counter() - connect_start_time) * 1000
+        stt_stats['resumes'] += 1
+        stt_stats['resumeTotalMs'] += resume_time_ms
+        print(f"STT resumed in {resume_time_ms:.1f}ms for client {client_id}.")
+        return Response(status=200)
+    import azure.cognitiveservices.speech as speechsdk
     # disconnect STT if already connected
     disconnectSttInternal(client_id)
     # system_prompt = request.headers.get('SystemPrompt')
@@ -432,38 +533,22 @@ def connectSTT() -> Response:
     logger.info(f"Connecting STT for client {client_id} with system prompt: {system_prompt}")
     logger.info(f"request.headers (1): {request.headers}")
     logger.info(f"request.headers (1) type: {type(request.headers)}")
-    client_context = client_contexts[client_id]
     try:
-        if speech_private_endpoint:
-            speech_private_endpoint_wss = speech_private_endpoint.replace('https://', 'wss://')
+        speech_token = speech_token_provider.get(token_wait_timeout_seconds) if enable_token_auth_for_speech else None
+    except TimeoutError as e:
+        return Response(f"STT connection failed. Error message: {e}", status=503)
+    try:
+        stt_recognizer_pool = getSttRecognizerPool()
+        if stt_recognizer_pool:
+            (audio_input_stream, speech_recognizer), pool_hit = stt_recognizer_pool.acquire(getSttEndpoint())
             if enable_token_auth_for_speech:
-                while not speech_token:
-                    time.sleep(0.2)
-                speech_config = speechsdk.SpeechConfig(endpoint=f'{speech_private_endpoint_wss}/stt/speech/universal/v2')
-                speech_config.authorization_token = speech_token
-            else:
-                speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=f'{speech_private_endpoint_wss}/stt/speech/universal/v2')
+                speech_recognizer.authorization_token = speech_token
         else:
-            if enable_token_auth_for_speech:
-                while not speech_token:
-                    time.sleep(0.2)
-                speech_config = speechsdk.SpeechConfig(endpoint=f'wss://{speech_region}.stt.speech.microsoft.com/speech/universal/v2')
-                speech_config.authorization_token = speech_token
-            else:
-                speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=f'wss://{speech_region}.stt.speech.microsoft.com/speech/universal/v2')
-
-        audio_input_stream = speechsdk.audio.PushAudioInputStream()
-        client_context['audio_input_stream'] = audio_input_stream
-
-        audio_config = speechsdk.audio.AudioConfig(stream=audio_input_stream)
-        speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
-        client_context['speech_recognizer'] = speech_recognizer
-
+            audio_input_stream, speech_recognizer = createSttRecognizer(getSttEndpoint())
+            pool_hit = False
         speech_recognizer.session_started.connect(lambda evt: print(f'STT session started - session id: {evt.session_id}'))
         speech_recognizer.session_stopped.connect(lambda evt: print(f'STT session stopped.'))
 
-        speech_recognition_start_time = datetime.datetime.now(pytz.UTC)
-
         def stt_recognized_cb(evt):
             if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech:
                 try:
@@ -476,46 +561,62 @@ def connectSTT() -> Response:
                     # socketio.emit("response", { 'path': 'api.chat', 'chatResponse': f'\n\n{session.get("name", "User")}: ' + user_query + '\n\n' }, room=client_id)
                     recognition_result_received_time = datetime.datetime.now(pytz.UTC)
                     speech_finished_offset = (evt.result.offset + evt.result.duration) / 10000
-                    stt_latency = round((recognition_result_received_time - speech_recognition_start_time).total_seconds() * 1000 - speech_finished_offset)
+                    stt_latency = round((recognition_result_received_time - client_context.stt_start_time).total_seconds() * 1000 - speech_finished_offset)
                     print(f'STT latency: {stt_latency}ms')
-                    socketio.emit("response", { 'path': 'api.chat', 'chatResponse': f"<STTL>{stt_latency}</STTL>" }, room=client_id)
-                    chat_initiated = client_context['chat_initiated']
+                    # Reply off the SDK callback thread, so the recognizer keeps delivering its events (e.g. the barge-in) meanwhile
+                    startBackgroundTask(stt_reply, user_query, stt_latency)
+                except Exception as e:
+                    print(f"Error in handling user query: {e}")
+        speech_recognizer.recognized.connect(stt_recognized_cb)
+
+        def stt_reply(user_query, stt_latency):
+            try:
+                with client_context.reply_lock: # One reply at a time, as when they ran on the SDK callback thread
+                    chat_initiated = client_context.chat_initiated
                     if not chat_initiated:
-                        initializeChatContext(session.get("system_prompt"), client_id)
-                        client_context['chat_initiated'] = True
+                        initializeChatContext(client_context.system_prompt, client_id)
+                        client_context.chat_initiated = True
                     first_response_chunk = True
-                    for chat_response in handleUserQuery(user_query, client_id):
+                    for chat_response in handleUserQuery(user_query, client_id, stt_latency):
                         if first_response_chunk:
                             # socketio.emit("response", { 'path': 'api.chat', 'chatResponse': 'Assistant: ' }, room=client_id)
                             socketio.emit("response", { 'path': 'api.chat', 'chatResponse': '' }, room=client_id)
                             first_response_chunk = False
                         socketio.emit("response", { 'path': 'api.chat', 'chatResponse': chat_response }, room=client_id)
-                except Exception as e:
-                    print(f"Error in handling user query: {e}")
-        speech_recognizer.recognized.connect(stt_recognized_cb)
+            except Exception as e:
+                print(f"Error in handling user query: {e}")
 
         def stt_recognizing_cb(evt):
-            if not vad_iterator:
+            if not (enable_vad and enable_websockets):
                 stopSpeakingInternal(client_id, False)
         speech_recognizer.recognizing.connect(stt_recognizing_cb)
 
         def stt_canceled_cb(evt):
             cancellation_details = speechsdk.CancellationDetails(evt.result)
             print(f'STT connection canceled. Error message: {cancellation_details.error_details}')
+            client_context.stt_canceled = True # Connect a new recognizer on the next resume
         speech_recognizer.canceled.connect(stt_canceled_cb)
 
-        speech_recognizer.start_continuous_recognition()
+        client_context.connect_stt(audio_input_stream, speech_recognizer, datetime.datetime.now(pytz.UTC))
+        runBlocking(speech_recognizer.start_continuous_recognition)
+        connect_time_ms = round((time.perf_counter() - connect_start_time) * 1000)
+        stt_stats['connects'] += 1
+        stt_stats['connectTotalMs'] += connect_time_ms
+        print(f"STT connect time: {connect_time_ms}ms (recognizer pool {'hit' if pool_hit else 'miss'})")
+        if stt_recognizer_pool:
+            stt_recognizer_pool.record_latency(pool_hit, connect_time_ms)
         return Response(status=200)
 
     except Exception as e:
         return Response(f"STT connection failed. Error message: {e}", status=400)
 
-# The API route to disconnect the STT service
+# The API route to disconnect the STT service, which pauses the recognizer of the client
 @app.route("/api/disconnectSTT", methods=["POST"])
 def disconnectSTT() -> Response:
     client_id = uuid.UUID(request.headers.get('ClientId'))
     try:
-        disconnectSttInternal(client_id)
+        # Keep the recognizer connected, so the next connectSTT only resumes it
+        pauseSttInternal(client_id)
         return Response('STT Disconnected.', status=200)
     except Exception as e:
         return Response(f"STT disconnection failed. Error message: {e}", status=400)
@@ -547,12 +648,12 @@ def chat() -> Response:
     global client_contexts
     client_id = uuid.UUID(request.headers.get('ClientId'))
     client_context = client_contexts[client_id]
-    chat_initiated = client_context['chat_initiated']
+    chat_initiated = client_context.chat_initiated
     if not chat_initiated:
         logger.info(f"request.headers (2): {request.headers}")
         logger.info(f"request.headers (2) type: {type(request.headers)}")
-        initializeChatContext(session.get("system_prompt"), client_id)
-        client_context['chat_initiated'] = True
+        initializeChatContext(client_context.system_prompt, client_id)
+        client_context.chat_initiated = True
     user_query = request.data.decode('utf-8')
     return Response(handleUserQuery(user_query, client_id), mimetype='text/plain', status=200)
 
@@ -562,11 +663,11 @@ def continueSpeaking() -> Response:
     global client_contexts
     client_id = uuid.UUID(request.headers.get('ClientId'))
     client_context = client_contexts[client_id]
-    spoken_text_queue = client_context['spoken_text_queue']
-    speaking_text = client_context['speaking_text']
+    speech_scheduler = getSpeechScheduler()
+    speaking_text = client_context.speaking_text
     if speaking_text and repeat_speaking_sentence_after_reconnection:
-        spoken_text_queue.insert(0, speaking_text)
-    if len(spoken_text_queue) > 0:
+        speech_scheduler.enqueue_front(client_id, [ (speaking_text, 0) ])
+    if speech_scheduler.depth(client_id) > 0:
         speakWithQueue(None, 0, client_id)
     return Response('Request sent.', status=200)
 
@@ -577,8 +678,8 @@ def clearChatHistory() -> Response:
     client_context = client_contexts[client_id]
     logger.info(f"request.headers (3): {request.headers}")
     logger.info(f"request.headers (3) type: {type(request.headers)}")
-    initializeChatContext(session.get("system_prompt"), client_id)
-    client_context['chat_initiated'] = True
+    initializeChatContext(client_context.system_prompt, client_id)
+    client_context.chat_initiated = True
     return Response('Chat history cleared.', status=200)
 
 # The API route to disconnect the TTS avatar
@@ -595,139 +696,443 @@ def disconnectAvatar() -> Response:
 @app.route("/api/releaseClient", methods=["POST"])
 def releaseClient() -> Response:
     global client_contexts
-    client_id = uuid.UUID(json.loads(request.data)['clientId'])
+    client_id = uuid.UUID(request.args.get('clientId') or json.loads(request.data)['clientId'])
     try:
-        disconnectAvatarInternal(client_id, False)
-        disconnectSttInternal(client_id)
-        time.sleep(2) # Wait some time for the connection to close
-        client_contexts.pop(client_id)
+        if socketio_message_queue:
+            session['clients'] = [ session_client for session_client in session.get('clients', []) if session_client[0] != str(client_id) ]
+        releaseClientInternal(client_id)
         print(f"Client context released for client {client_id}.")
         return Response('Client context released.', status=200)
     except Exception as e:
         print(f"Client context release failed. Error message: {e}")
         return Response(f"Client context release failed. Error message: {e}", status=400)
 
+# Record the activity of the client of an API request, so its context is not released as idle.
+# With several workers, the worker receiving the first request of a client takes it over, see claimClient().
+# The requests of a released client (e.g. idle for too long) get 410, and the page reloads to start a new client.
+# /api/releaseClient only releases an existing context, it doesn't take the client over.
+@app.before_request
+def touchRequestClient() -> Response:
+    client_id = request.headers.get('ClientId') or request.args.get('clientId')
+    if client_id and request.endpoint != 'releaseClient':
+        try:
+            client_id = uuid.UUID(client_id)
+        except ValueError:
+            return None
+        client_context = claimClient(client_id)
+        if client_context is not None:
+            client_context.touch()
+        elif socketio_message_queue and client_id not in released_client_ids:
+            return Response(f"Client {client_id} is not served by worker {worker_id}, the requests of a client must be routed by its client id.", status=421)
+        else:
+            return Response(f"Client {client_id} was released, reload the page.", status=410)
+    return None
+
 @socketio.on("connect")
 def handleWsConnection():
     client_id = uuid.UUID(request.args.get('clientId'))
+    client_context = claimClient(client_id)
+    if client_context is None:
+        if socketio_message_queue and client_id not in released_client_ids:
+            print(f"WebSocket rejected for client {client_id}, not served by worker {worker_id}.")
+            return False
+        print(f"WebSocket rejected for client {client_id}, which was released.")
+        raise ConnectionRefusedError('released') # The page reloads to start a new client
+    client_context.socket_connected()
     join_room(client_id)
     print(f"WebSocket connected for client {client_id}.")
 
+# The open WebSocket keeps the client active, see ClientContext.last_active_time()
+@socketio.on("disconnect")
+def handleWsDisconnection(reason=None):
+    client_id = uuid.UUID(request.args.get('clientId'))
+    client_context = client_contexts.get(client_id)
+    if client_context is not None:
+        client_context.socket_disconnected()
+    print(f"WebSocket disconnected for client {client_id}.")
+
 @socketio.on("message")
 def handleWsMessage(message):
     global client_contexts
     client_id = uuid.UUID(message.get('clientId'))
     path = message.get('path')
-    client_context = client_contexts[client_id]
+    client_context = client_contexts.get(client_id)
+    if client_context is None:
+        print(f"WebSocket message ignored for client {client_id}, which was released.")
+        return
+    client_context.touch()
     if path == 'api.audio':
-        chat_initiated = client_context['chat_initiated']
+        # Fallback path for clients sending base64 encoded audio in JSON messages
         audio_chunk = message.get('audioChunk')
-        audio_chunk_binary = base64.b64decode(audio_chunk)
-        audio_input_stream = client_context['audio_input_stream']
-        if audio_input_stream:
-            audio_input_stream.write(audio_chunk_binary)
-        if vad_iterator:
-            audio_buffer = client_context['vad_audio_buffer']
-            audio_buffer.extend(audio_chunk_binary)
-            if len(audio_buffer) >= 1024:
-                audio_chunk_int = np.frombuffer(bytes(audio_buffer[:1024]), dtype=np.int16)
-                audio_buffer.clear()
-                audio_chunk_float = int2float(audio_chunk_int)
-                vad_detected = vad_iterator(torch.from_numpy(audio_chunk_float))
-                if vad_detected:
-                    print("Voice activity detected.")
-                    stopSpeakingInternal(client_id, False)
+        handleAudioChunk(client_id, base64.b64decode(audio_chunk))
     elif path == 'api.chat':
-        chat_initiated = client_context['chat_initiated']
+        chat_initiated = client_context.chat_initiated
         if not chat_initiated:
             logger.info(f"request.headers (4): {request.headers}")
             logger.info(f"request.headers (4) type: {type(request.headers)}")
-            initializeChatContext(session.get("system_prompt"), client_id)
-            client_context['chat_initiated'] = True
+            initializeChatContext(client_context.system_prompt, client_id)
+            client_context.chat_initiated = True
         user_query = message.get('userQuery')
         for chat_response in handleUserQuery(user_query, client_id):
             socketio.emit("response", { 'path': 'api.chat', 'chatResponse': chat_response }, room=client_id)
     elif path == 'api.stopSpeaking':
         stopSpeakingInternal(client_id, False)
 
-# Initialize the client by creating a client id and an initial context
-def initializeClient() -> uuid.UUID:
-    client_id = uuid.uuid4()
-    client_contexts[client_id] = {
-        'audio_input_stream': None, # Audio input stream for speech recognition
-        'vad_audio_buffer': [], # Audio input buffer for VAD
-        'speech_recognizer': None, # Speech recognizer for user speech
-        'azure_openai_deployment_name': azure_openai_deployment_name, # Azure OpenAI deployment name
-        'cognitive_search_index_name': session.get("cognitive_search_index_name"), # Cognitive search index name
-        # 'tts_voice': default_tts_voice, # TTS voice
-        'tts_voice': None, # TTS voice
-        'custom_voice_endpoint_id': None, # Endpoint ID (deployment ID) for custom voice
-        'personal_voice_speaker_profile_id': None, # Speaker profile ID for personal voice
-        'speech_synthesizer': None, # Speech synthesizer for avatar
-        'speech_synthesizer_connection': None, # Speech synthesizer connection for avatar
-        'speech_synthesizer_connected': False, # Flag to indicate if the speech synthesizer is connected
-        'speech_token': None, # Speech token for client side authentication with speech service
-        'ice_token': None, # ICE token for ICE/TURN/Relay server connection
-        'chat_initiated': False, # Flag to indicate if the chat context is initiated
-        'messages': [], # Chat messages (history)
-        'data_sources': [], # Data sources for 'on your data' scenario
-        'is_speaking': False, # Flag to indicate if the avatar is speaking
-        'speaking_text': None, # The text that the avatar is speaking
-        'spoken_text_queue': [], # Queue to store the spoken text
-        'speaking_thread': None, # The thread to speak the spoken text
-        'last_speak_time': None # The last time the avatar spoke
+# Binary audio path, the audio chunk arrives as raw PCM bytes (16 kHz, 16 bit, mono) without base64 encoding
+@socketio.on("audio")
+def handleWsAudio(client_id, audio_chunk):
+    handleAudioChunk(uuid.UUID(client_id), audio_chunk)
+
+# Push the audio chunk to the speech recognizer stream and the VAD buffer
+def handleAudioChunk(client_id: uuid.UUID, audio_chunk_binary: bytes) -> None:
+    global client_contexts
+    client_context = client_contexts.get(client_id)
+    if client_context is None:
+        return # Released, the page reloads on its next request
+    client_context.touch()
+    if client_context.stt_paused_time is not None:
+        return # Audio still in flight after the microphone was stopped
+    audio_input_stream = client_context.audio_input_stream
+    if audio_input_stream:
+        audio_input_stream.write(audio_chunk_binary)
+    vad_engine = getVadEngine()
+    if vad_engine:
+        from vad_iterator import int2float
+        if client_context.vad_iterator is None:
+            initializeClientVad(client_id)
+        audio_buffer = client_context.vad_audio_buffer
+        audio_buffer.write(audio_chunk_binary)
+        # Every complete 512 samples window is handed out as a view on the buffer, int2float makes the copy for the model
+        for audio_chunk_int in audio_buffer.windows():
+            audio_chunk_float = int2float(audio_chunk_int)
+            # The window is queued to the shared VAD engine, and batched with the windows of other clients
+            vad_engine.submit(client_id, client_context.vad_iterator, audio_chunk_float, handleVoiceActivity)
+
+# Handle the end of a user utterance detected by VAD, which interrupts the avatar speaking
+def handleVoiceActivity(client_id: uuid.UUID) -> None:
+    if client_id not in client_contexts:
+        return
+    print("Voice activity detected.")
+    # Stop speaking off the VAD engine worker, on the interrupt threads which the replies don't hold
+    startInterruptTask(stopSpeakingInternal, client_id, False)
+
+# Build the scenario profile of a client context from the scenario number
+def buildScenarioProfile(scenario_num: int) -> dict:
+    avatar_name, avatar_character, avatar_style, tts_voice, cognitive_search_index_name, system_prompt = load_scenario_profile(scenario_num, cognitive_search_index_base_name)
+    return {
+        'scenario_num': scenario_num,
+        'avatar_character': avatar_character,
+        'avatar_style': avatar_style,
+        'tts_voice': tts_voice,
+        'cognitive_search_index_name': cognitive_search_index_name,
+        'system_prompt': system_prompt
     }
+
+# Initialize the client by creating a client id and an initial context.
+# With several workers (socketio_message_queue), the client id and scenario are kept in the cookie session instead, and
+# the context is created by the worker which receives the first request of the client, see claimClient().
+def initializeClient(scenario_profile: dict) -> uuid.UUID:
+    client_id = uuid.uuid4()
+    if socketio_message_queue:
+        session['clients'] = (session.get('clients', []) + [ [ str(client_id), scenario_profile['scenario_num'] ] ])[-max_session_clients:]
+    else:
+        client_contexts[client_id] = ClientContext(client_id, scenario_profile, azure_openai_deployment_name, session_id=session.get('sid'))
     return client_id
 
-# Refresh the ICE token every 24 hours
-def refreshIceToken() -> None:
-    global ice_token
-    while True:
-        ice_token_response = None
-        if speech_private_endpoint:
-            if enable_token_auth_for_speech:
-                while not speech_token:
-                    time.sleep(0.2)
-                ice_token_response = requests.get(f'{speech_private_endpoint}/tts/cognitiveservices/avatar/relay/token/v1', headers={'Authorization': f'Bearer {speech_token}'})
-            else:
-                ice_token_response = requests.get(f'{speech_private_endpoint}/tts/cognitiveservices/avatar/relay/token/v1', headers={'Ocp-Apim-Subscription-Key': speech_key})
-        else:
-            if enable_token_auth_for_speech:
-                while not speech_token:
-                    time.sleep(0.2)
-                ice_token_response = requests.get(f'https://{speech_region}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1', headers={'Authorization': f'Bearer {speech_token}'})
-            else:
-                ice_token_response = requests.get(f'https://{speech_region}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1', headers={'Ocp-Apim-Subscription-Key': speech_key})
-        if ice_token_response.status_code == 200:
-            ice_token = ice_token_response.text
+# Get the context of the client. With several workers, the first worker which receives a request or the WebSocket
+# connection of a client creates its context and owns it: the load balancer routes all the requests of a client to the
+# same worker, by the ClientId header or clientId query parameter (see README). Returns None if the client is not
+# owned by this worker and is not one of the clients of the cookie session, which could be taken over, or if it was
+# released by this worker (released_client_ids), as the cookie still lists the clients which were evicted.
+def claimClient(client_id: uuid.UUID):
+    client_context = client_contexts.get(client_id)
+    if client_context is not None or not socketio_message_queue:
+        return client_context
+    scenario_num = next((num for session_client_id, num in session.get('clients', []) if session_client_id == str(client_id)), None)
+    if scenario_num is None:
+        return None
+    with lazy_init_lock:
+        client_context = client_contexts.get(client_id)
+        if client_context is None:
+            if client_id in released_client_ids:
+                return None
+            client_context = ClientContext(client_id, buildScenarioProfile(scenario_num), azure_openai_deployment_name, session_id=session.get('sid'))
+            client_contexts[client_id] = client_context
+            logger.info(f"Client {client_id} is served by worker {worker_id}")
+    return client_context
+
+# Get the server side session store, which is created on the first call
+def getSessionStore():
+    global session_store
+    if session_store is None:
+        with lazy_init_lock:
+            if session_store is None:
+                from session_store import SessionStore
+                session_store = SessionStore(path=session_store_path, max_idle_seconds=session_max_idle_seconds)
+    return session_store
+
+# Start a new server side session with the given data. The cookie session only keeps its id.
+def startSession(session_data: dict) -> None:
+    session_store = getSessionStore()
+    # Remove the idle sessions, except the ones of the current clients, which live as long as their client contexts
+    session_store.expire(in_use={ client_context.session_id for client_context in list(client_contexts.values()) })
+    session.clear() # Also drops the data of cookies written before the server side sessions
+    session['sid'] = session_store.create(session_data)
+
+# Get the data of the server side session of the request, {} if there is none (e.g. expired)
+def getSessionData() -> dict:
+    sid = session.get('sid')
+    session_data = getSessionStore().get(sid) if sid else None
+    return session_data or {}
+
+# Record the activity of the client, so its context is not released as idle
+def touchClient(client_id: uuid.UUID) -> None:
+    client_context = client_contexts.get(client_id)
+    if client_context is not None:
+        client_context.touch()
+
+# Close the avatar and STT connections of the client, and remove its context.
+# Called by /api/releaseClient, and by the client evictor for clients which are idle (e.g. closed without release).
+def releaseClientInternal(client_id: uuid.UUID) -> None:
+    global client_contexts
+    if client_id not in client_contexts:
+        return
+    if socketio_message_queue:
+        with lazy_init_lock: # Before the context is removed, so claimClient() can't take the client over again
+            released_client_ids[client_id] = True
+            while len(released_client_ids) > max_released_clients:
+                released_client_ids.popitem(last=False)
+    disconnectAvatarInternal(client_id, False)
+    disconnectSttInternal(client_id)
+    if vad_engine:
+        vad_engine.remove(client_id)
+    if speech_scheduler:
+        speech_scheduler.remove(client_id)
+    client_context = client_contexts.pop(client_id, None)
+    if client_context is not None:
+        client_context.release()
+
+# Initialize the VAD state of the client, on its first VAD frame
+def initializeClientVad(client_id: uuid.UUID) -> None:
+    from audio_ring_buffer import AudioRingBuffer
+    from vad_iterator import VADIterator
+    client_context = client_contexts[client_id]
+    client_context.vad_audio_buffer = AudioRingBuffer(window_samples=512)
+    client_context.vad_iterator = VADIterator(backend=None, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=150, speech_pad_ms=100)
+
+# Get the VAD engine, the VAD backend (model) is loaded on the first call. Returns None if VAD is disabled.
+def getVadEngine():
+    global vad_engine
+    if not (enable_vad and enable_websockets):
+        return None
+    if vad_engine is None:
+        with lazy_init_lock:
+            if vad_engine is None:
+                from vad_backend import load_vad_backend
+                from vad_engine import VADInferenceEngine
+                vad_backend = load_vad_backend(vad_backend_name, vad_onnx_model_path, sampling_rate=16000, torch_fallback=vad_torch_fallback)
+                vad_engine = VADInferenceEngine(backend=vad_backend, sampling_rate=16000)
+    return vad_engine
+
+# Create the speech synthesizer of an avatar connection
+def createAvatarSynthesizer(custom_voice_endpoint_id: str = None):
+    import azure.cognitiveservices.speech as speechsdk
+    speech_token = speech_token_provider.get(token_wait_timeout_seconds) if enable_token_auth_for_speech else None
+    if speech_private_endpoint:
+        speech_private_endpoint_wss = speech_private_endpoint.replace('https://', 'wss://')
+        if enable_token_auth_for_speech:
+            speech_config = speechsdk.SpeechConfig(endpoint=f'{speech_private_endpoint_wss}/tts/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
+            speech_config.authorization_token = speech_token
         else:
-            raise Exception(f"Failed to get ICE token. Status code: {ice_token_response.status_code}")
-        time.sleep(60 * 60 * 24) # Refresh the ICE token every 24 hours
-
-# Refresh the speech token every 9 minutes
-def refreshSpeechToken() -> None:
-    global speech_token
-    while True:
-        # Refresh the speech token every 9 minutes
-        if speech_private_endpoint:
-            credential = DefaultAzureCredential(managed_identity_client_id=user_assigned_managed_identity_client_id)
-            token = credential.get_token('https://cognitiveservices.azure.com/.default')
-            speech_token = f'aad#{speech_resource_url}#{token.token}'
+            speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=f'{speech_private_endpoint_wss}/tts/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
+    else:
+        if enable_token_auth_for_speech:
+            speech_config = speechsdk.SpeechConfig(endpoint=f'wss://{speech_region}.tts.speech.microsoft.com/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
+            speech_config.authorization_token = speech_token
         else:
-            speech_token = requests.post(f'https://{speech_region}.api.cognitive.microsoft.com/sts/v1.0/issueToken', headers={'Ocp-Apim-Subscription-Key': speech_key}).text
-        time.sleep(60 * 9)
+            speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=f'wss://{speech_region}.tts.speech.microsoft.com/cognitiveservices/websocket/v1?enableTalkingAvatar=true')
+
+    if custom_voice_endpoint_id:
+        speech_config.endpoint_id = custom_voice_endpoint_id
+
+    return speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+
+# Get the STT endpoint of the speech resource
+def getSttEndpoint() -> str:
+    if speech_private_endpoint:
+        return f"{speech_private_endpoint.replace('https://', 'wss://')}/stt/speech/universal/v2"
+    return f'wss://{speech_region}.stt.speech.microsoft.com/speech/universal/v2'
+
+# Create a speech recognizer, which recognizes the audio pushed to its input stream
+def createSttRecognizer(stt_endpoint: str):
+    import azure.cognitiveservices.speech as speechsdk
+    if enable_token_auth_for_speech:
+        speech_config = speechsdk.SpeechConfig(endpoint=stt_endpoint)
+        speech_config.authorization_token = speech_token_provider.get(token_wait_timeout_seconds)
+    else:
+        speech_config = speechsdk.SpeechConfig(subscription=speech_key, endpoint=stt_endpoint)
+    audio_input_stream = speechsdk.audio.PushAudioInputStream()
+    audio_config = speechsdk.audio.AudioConfig(stream=audio_input_stream)
+    speech_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
+    stt_stats['recognizersCreated'] += 1
+    return audio_input_stream, speech_recognizer
+
+# Get the pool of speech recognizers per STT endpoint, which is created on the first call
+def getSttRecognizerPool():
+    global stt_recognizer_pool
+    if stt_pool_size <= 0:
+        return None
+    if stt_recognizer_pool is None:
+        with lazy_init_lock:
+            if stt_recognizer_pool is None:
+                from warm_pool import WarmPool
+                stt_recognizer_pool = WarmPool(createSttRecognizer, name='STT recognizer', size_per_key=stt_pool_size)
+    return stt_recognizer_pool
+
+# Get the pool of avatar speech synthesizers, which is created on the first call. The voice, character and style are only
+# set on the avatar connection, so the synthesizers only differ by their custom voice endpoint, the pool key. Only the
+# standard voices (key None) are pooled, as the custom voice endpoint id comes from the request.
+def getAvatarSynthesizerPool():
+    global avatar_synthesizer_pool
+    if avatar_pool_size <= 0:
+        return None
+    if avatar_synthesizer_pool is None:
+        with lazy_init_lock:
+            if avatar_synthesizer_pool is None:
+                from warm_pool import WarmPool
+                avatar_synthesizer_pool = WarmPool(createAvatarSynthesizer, name='avatar synthesizer', size_per_key=avatar_pool_size)
+    return avatar_synthesizer_pool
+
+# Get the speech scheduler, which is created on the first speech
+def getSpeechScheduler():
+    global speech_scheduler
+    if speech_scheduler is None:
+        with lazy_init_lock:
+            if speech_scheduler is None:
+                from speech_scheduler import SpeechScheduler
+                speech_scheduler = SpeechScheduler(process=speakNextSentence, num_workers=speech_scheduler_workers)
+    return speech_scheduler
+
+# Get the executor of the background tasks in threading mode, which is created on the first task
+def getBackgroundExecutor():
+    global background_executor
+    if background_executor is None:
+        with lazy_init_lock:
+            if background_executor is None:
+                import concurrent.futures
+                background_executor = concurrent.futures.ThreadPoolExecutor(max_workers=background_task_workers, thread_name_prefix='BackgroundTask')
+    return background_executor
+
+# Start a task off the calling thread, e.g. a speech SDK callback thread which must return to deliver the next events.
+# In threading mode it runs on the bounded background executor, in eventlet / gevent mode on a green thread.
+def startBackgroundTask(task, *args) -> None:
+    if socketio_async_mode == 'threading':
+        getBackgroundExecutor().submit(runBackgroundTask, task, *args)
+    else:
+        socketio.start_background_task(runBackgroundTask, task, *args)
+
+# Get the executor of the interrupt tasks in threading mode, which is created on the first interrupt
+def getInterruptExecutor():
+    global interrupt_executor
+    if interrupt_executor is None:
+        with lazy_init_lock:
+            if interrupt_executor is None:
+                import concurrent.futures
+                interrupt_executor = concurrent.futures.ThreadPoolExecutor(max_workers=interrupt_task_workers, thread_name_prefix='InterruptTask')
+    return interrupt_executor
+
+# Start a short task which interrupts a reply, e.g. the stop on voice activity. The background executor can be full of
+# replies, each held for the whole reply (reply_lock, waitForSpeakingQueue()), so the interrupts have their own threads.
+def startInterruptTask(task, *args) -> None:
+    if socketio_async_mode == 'threading':
+        getInterruptExecutor().submit(runBackgroundTask, task, *args)
+    else:
+        socketio.start_background_task(runBackgroundTask, task, *args)
+
+def runBackgroundTask(task, *args) -> None:
+    try:
+        task(*args)
+    except Exception:
+        logger.exception(f"Background task {getattr(task, '__name__', task)} failed")
+
+# Run a blocking call of the speech SDK, e.g. the .get() of a result future, which waits on a native thread.
+# In eventlet / gevent mode it runs on the native thread pool of the event loop, so the other clients are served
+# meanwhile. In threading mode each request, socket event and speaking worker has its own thread, so it is called directly.
+def runBlocking(call, *args):
+    if socketio_async_mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(call, *args)
+    if socketio_async_mode == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(call, args)
+    return call(*args)
+
+# Get the chat engine, which streams the chat completions with the async Azure OpenAI client, created on the first call
+def getChatEngine():
+    global chat_engine
+    if chat_engine is None:
+        with lazy_init_lock:
+            if chat_engine is None:
+                from openai import AsyncAzureOpenAI
+                from chat_engine import ChatEngine
+                chat_engine = ChatEngine(
+                    lambda: AsyncAzureOpenAI(
+                        azure_endpoint=azure_openai_endpoint,
+                        api_version='2025-01-01-preview',
+                        api_key=azure_openai_api_key),
+                    max_concurrency=chat_max_concurrency,
+                    max_buffered_chunks=chat_max_buffered_chunks)
+    return chat_engine
+
+# Get the response cache, which is created on the first chat, None if it is disabled
+def getResponseCache():
+    global response_cache
+    if not enable_response_cache:
+        return None
+    if response_cache is None:
+        with lazy_init_lock:
+            if response_cache is None:
+                from response_cache import ResponseCache
+                response_cache = ResponseCache(max_entries=response_cache_max_entries, ttl_seconds=response_cache_ttl_seconds)
+    return response_cache
+
+# Fetch the ICE token, which is refreshed every 24 hours
+def fetchIceToken():
+    if enable_token_auth_for_speech:
+        headers = { 'Authorization': f'Bearer {speech_token_provider.get(token_wait_timeout_seconds)}' }
+    else:
+        headers = { 'Ocp-Apim-Subscription-Key': speech_key }
+    if speech_private_endpoint:
+        ice_token_response = requests.get(f'{speech_private_endpoint}/tts/cognitiveservices/avatar/relay/token/v1', headers=headers)
+    else:
+        ice_token_response = requests.get(f'https://{speech_region}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1', headers=headers)
+    if ice_token_response.status_code != 200:
+        raise Exception(f"Failed to get ICE token. Status code: {ice_token_response.status_code}")
+    return ice_token_response.text, 60 * 60 * 24 / ice_token_provider.refresh_ratio # Refreshed after 24 hours
+
+# Fetch the speech token, which is refreshed every 9 minutes
+def fetchSpeechToken():
+    if speech_private_endpoint:
+        from azure.identity import DefaultAzureCredential
+        credential = DefaultAzureCredential(managed_identity_client_id=user_assigned_managed_identity_client_id)
+        token = credential.get_token('https://cognitiveservices.azure.com/.default')
+        return f'aad#{speech_resource_url}#{token.token}', min(token.expires_on - time.time(), 60 * 10)
+    speech_token_response = requests.post(f'https://{speech_region}.api.cognitive.microsoft.com/sts/v1.0/issueToken', headers={'Ocp-Apim-Subscription-Key': speech_key})
+    if speech_token_response.status_code != 200:
+        raise Exception(f"Failed to get speech token. Status code: {speech_token_response.status_code}")
+    return speech_token_response.text, 60 * 10 # The speech token is valid for 10 minutes
 
 # Initialize the chat context, e.g. chat history (messages), data sources, etc. For chat scenario.
 def initializeChatContext(system_prompt: str, client_id: uuid.UUID) -> None:
     global client_contexts
     client_context = client_contexts[client_id]
-    cognitive_search_index_name = client_context['cognitive_search_index_name']
-    messages = client_context['messages']
-    data_sources = client_context['data_sources']
+    cognitive_search_index_name = client_context.cognitive_search_index_name
+    chat_history = client_context.chat_history
+    data_sources = client_context.data_sources
     logger.info(f"Initializing chat context for client {client_id} with client_contexts: {client_contexts}")
     logger.info(f"Initializing chat context for client {client_id} with client_context: {client_context}")
     logger.info(f"Initializing chat context for client {client_id} with cognitive_search_index_name: {cognitive_search_index_name}")
-    logger.info(f"Initializing chat context for client {client_id} with messages: {messages}")
+    logger.info(f"Initializing chat context for client {client_id} with chat history: {chat_history.stats() if chat_history else None}")
     logger.info(f"Initializing chat context for client {client_id} with data_sources: {data_sources}")
     logger.info(f"Initializing chat context for client {client_id} with system_prompt: {system_prompt}")
 
@@ -762,7 +1167,9 @@ def initializeChatContext(system_prompt: str, client_id: uuid.UUID) -> None:
         # logger.info(f"Data source: {data_source}")    
 
     # Initialize messages
-    messages.clear()
+    if chat_history is None:
+        summarize = (lambda summary, messages: summarizeChatHistory(summary, messages, client_id)) if chat_history_summary else None
+        chat_history = client_context.chat_history = ChatHistory(max_prompt_tokens=chat_history_max_tokens, summarize=summarize)
     # if len(data_sources) == 0:
     #     system_message = {
     #         'role': 'system',
@@ -774,167 +1181,286 @@ def initializeChatContext(system_prompt: str, client_id: uuid.UUID) -> None:
     #     logger.info(f"(1) Chat context initialized for client {client_id} with data_sources: {data_sources} ---> {type(data_sources)}")
 
     # Pass the system prompt whether or not the data sources are available
-    system_message = {
-        'role': 'system',
-        'content': system_prompt
-    }
-    messages.append(system_message)
-    logger.info(f"(2) Chat context initialized for client {client_id} with messages: {messages} ---> {type(messages)}")
+    chat_history.reset(system_prompt)
+    logger.info(f"(2) Chat context initialized for client {client_id} with system prompt: {system_prompt}")
     logger.info(f"(2) Chat context initialized for client {client_id} with data_sources: {data_sources} ---> {type(data_sources)}")
 
 
 # Handle the user query and return the assistant reply. For chat scenario.
 # The function is a generator, which yields the assistant reply in chunks.
-def handleUserQuery(user_query: str, client_id: uuid.UUID):
+# stt_latency_ms is the STT latency of a spoken query, recorded as the first span of the turn.
+def handleUserQuery(user_query: str, client_id: uuid.UUID, stt_latency_ms: int = None):
     global client_contexts
     client_context = client_contexts[client_id]
-    azure_openai_deployment_name = client_context['azure_openai_deployment_name']
-    messages = client_context['messages']
-    data_sources = client_context['data_sources']
+    client_context.start_turn()
+    if stt_latency_ms is not None:
+        recordLatency(client_id, 'stt_final', stt_latency_ms)
+    azure_openai_deployment_name = client_context.azure_openai_deployment_name
+    chat_history = client_context.chat_history
+    data_sources = client_context.data_sources
 
-    chat_message = {
-        'role': 'user',
-        'content': user_query
-    }
     logger.info(f"handleUserQuery --> user_query: {user_query}")
 
-    messages.append(chat_message)
+    chat_history.add_user_message(user_query)
+    prompt_messages = chat_history.prompt_messages()
+
+    # The reply of the same question at the same point of the conversation is replayed from the cache, if enabled
+    response_cache = getResponseCache()
+    cache_key = None
+    cached_tokens = None
+    if response_cache:
+        scenario_key = (client_context.scenario_num, azure_openai_deployment_name, client_context.cognitive_search_index_name)
+        cache_key = response_cache.key(scenario_key, prompt_messages[:-1], user_query)
+        cached_tokens = response_cache.get(cache_key)
 
     # For 'on your data' scenario, chat API currently has long (4s+) latency
     # We return some quick reply here before the chat API returns to mitigate.
-    if len(data_sources) > 0 and enable_quick_reply:
+    if len(data_sources) > 0 and enable_quick_reply and cached_tokens is None:
         speakWithQueue(random.choice(quick_replies), 2000)
 
     assistant_reply = ''
+    reply_tokens = []
     tool_content = ''
-    spoken_sentence = ''
+    sentence_segmenter = SentenceSegmenter(punctuations=sentence_level_punctuations, max_chars=sentence_max_chars)
+
+    # Report the prompt tokens of the turn in the last chunk (not for 'on your data', which doesn't support it)
+    completion_options = { 'stream_options': { 'include_usage': True } } if len(data_sources) == 0 else {}
 
     aoai_start_time = datetime.datetime.now(pytz.UTC)
-    response = azure_openai.chat.completions.create(
-        model=azure_openai_deployment_name,
-        messages=messages,
-        extra_body={ 'data_sources' : data_sources } if len(data_sources) > 0 else None,
-        stream=True)
-    # logger.info(f"AOAI response (messages): {messages}")
-    # logger.info(f"AOAI response (data_sources): {data_sources}")
+    if cached_tokens is not None:
+        print(f"Response cache hit for client {client_id}")
+        response_tokens = iter(cached_tokens)
+    else:
+        response = getChatEngine().stream(
+            model=azure_openai_deployment_name,
+            messages=prompt_messages,
+            extra_body={ 'data_sources' : data_sources } if len(data_sources) > 0 else None,
+            **completion_options)
+        # logger.info(f"AOAI response (messages): {messages}")
+        # logger.info(f"AOAI response (data_sources): {data_sources}")
+        response_tokens = readResponseTokens(response, chat_history)
 
     is_first_chunk = True
     is_first_sentence = True
+    for response_token in response_tokens:
+        # Log response_token here if need debug
+        if is_first_chunk:
+            first_token_latency_ms = round((datetime.datetime.now(pytz.UTC) - aoai_start_time).total_seconds() * 1000)
+            print(f"AOAI first token latency: {first_token_latency_ms}ms")
+            recordLatency(client_id, 'llm_first_token', first_token_latency_ms)
+            is_first_chunk = False
+        yield response_token # yield response token to client as display text
+        assistant_reply += response_token  # build up the assistant message
+        reply_tokens.append(response_token)
+        for spoken_sentence in sentence_segmenter.feed(response_token): # sentences completed by this token, wherever the punctuation is in it
+            if is_first_sentence:
+                first_sentence_latency_ms = round((datetime.datetime.now(pytz.UTC) - aoai_start_time).total_seconds() * 1000)
+                print(f"AOAI first sentence latency: {first_sentence_latency_ms}ms")
+                recordLatency(client_id, 'llm_first_sentence', first_sentence_latency_ms)
+                is_first_sentence = False
+            waitForSpeakingQueue(client_id)
+            speakWithQueue(spoken_sentence, 0, client_id)
+
+    for spoken_sentence in sentence_segmenter.flush():
+        speakWithQueue(spoken_sentence, 0, client_id)
+
+    # Only a complete reply is cached, the generator is closed before this point if the reply is interrupted
+    if cache_key is not None and cached_tokens is None and assistant_reply:
+        response_cache.put(cache_key, reply_tokens)
+
+    if len(data_sources) > 0:
+        chat_history.add_message('tool', tool_content) # Dropped if empty
+        logger.info(f"handleUserQuery --> tool_content: {tool_content}")
+
+    chat_history.add_message('assistant', assistant_reply)
+    logger.info(f"handleUserQuery --> assistant_reply: {assistant_reply}")
+
+    # Fold the turns left out of the prompt into the summary in the background, off the reply path
+    if chat_history.needs_fold():
+        startBackgroundTask(chat_history.fold)
+
+# Read the display tokens of a streamed chat completion, and record its prompt token count. For chat scenario.
+def readResponseTokens(response, chat_history: ChatHistory):
     for chunk in response:
+        if getattr(chunk, 'usage', None) is not None:
+            chat_history.record_prompt_tokens(chunk.usage.prompt_tokens) # The last chunk, with stream_options include_usage
         if len(chunk.choices) > 0:
             response_token = chunk.choices[0].delta.content
             if response_token is not None:
-                # Log response_token here if need debug
-                if is_first_chunk:
-                    first_token_latency_ms = round((datetime.datetime.now(pytz.UTC) - aoai_start_time).total_seconds() * 1000)
-                    print(f"AOAI first token latency: {first_token_latency_ms}ms")
-                    yield f"<FTL>{first_token_latency_ms}</FTL>"
-                    is_first_chunk = False
                 if oyd_doc_regex.search(response_token):
                     response_token = oyd_doc_regex.sub('', response_token).strip()
-                yield response_token # yield response token to client as display text
-                assistant_reply += response_token  # build up the assistant message
-                if response_token == '\n' or response_token == '\n\n':
-                    if is_first_sentence:
-                        first_sentence_latency_ms = round((datetime.datetime.now(pytz.UTC) - aoai_start_time).total_seconds() * 1000)
-                        print(f"AOAI first sentence latency: {first_sentence_latency_ms}ms")
-                        yield f"<FSL>{first_sentence_latency_ms}</FSL>"
-                        is_first_sentence = False
-                    speakWithQueue(spoken_sentence.strip(), 0, client_id)
-                    spoken_sentence = ''
-                else:
-                    response_token = response_token.replace('\n', '')
-                    spoken_sentence += response_token  # build up the spoken sentence
-                    if len(response_token) == 1 or len(response_token) == 2:
-                        for punctuation in sentence_level_punctuations:
-                            if response_token.startswith(punctuation):
-                                if is_first_sentence:
-                                    first_sentence_latency_ms = round((datetime.datetime.now(pytz.UTC) - aoai_start_time).total_seconds() * 1000)
-                                    print(f"AOAI first sentence latency: {first_sentence_latency_ms}ms")
-                                    yield f"<FSL>{first_sentence_latency_ms}</FSL>"
-                                    is_first_sentence = False
-                                speakWithQueue(spoken_sentence.strip(), 0, client_id)
-                                spoken_sentence = ''
-                                break
-
-    if spoken_sentence != '':
-        speakWithQueue(spoken_sentence.strip(), 0, client_id)
-        spoken_sentence = ''
-
-    if len(data_sources) > 0:
-        tool_message = {
-            'role': 'tool',
-            'content': tool_content
-        }
-        messages.append(tool_message)
-        logger.info(f"handleUserQuery --> tool_message: {tool_message}")
-
+                yield response_token
 
-    assistant_message = {
-        'role': 'assistant',
-        'content': assistant_reply
-    }
-    messages.append(assistant_message)
-    logger.info(f"handleUserQuery --> assistant_message: {assistant_message}")
+# Update the summary of the chat history with the given messages (the turns left out of the chat prompt). For chat scenario.
+def summarizeChatHistory(summary: str, messages: list, client_id: uuid.UUID) -> str:
+    client_context = client_contexts[client_id]
+    conversation = '\n'.join(f"{message['role']}: {message['content']}" for message in messages)
+    response = getChatEngine().stream(
+        model=client_context.azure_openai_deployment_name,
+        messages=[
+            { 'role': 'system', 'content': chat_history_summary_prompt },
+            { 'role': 'user', 'content': f"Summary so far: {summary or '(none)'}\n\nNew messages:\n{conversation}" }
+        ])
+    return ''.join(chunk.choices[0].delta.content or '' for chunk in response if len(chunk.choices) > 0).strip()
+
+# Wait while the client has more than tts_max_queued_sentences sentences waiting to be spoken, so a long reply is not
+# read from the chat completion much faster than it is spoken. The completion stream pauses while its buffer is full.
+def waitForSpeakingQueue(client_id: uuid.UUID) -> None:
+    if tts_max_queued_sentences <= 0 or speech_scheduler is None:
+        return
+    if not speech_scheduler.wait_depth(client_id, tts_max_queued_sentences - 1, tts_queue_wait_timeout_seconds):
+        logger.warning(f"Speaking queue of client {client_id} still full after {tts_queue_wait_timeout_seconds}s, queueing anyway")
 
 # Speak the given text. If there is already a speaking in progress, add the text to the queue. For chat scenario.
 def speakWithQueue(text: str, ending_silence_ms: int, client_id: uuid.UUID) -> None:
     global client_contexts
-    client_context = client_contexts[client_id]
-    spoken_text_queue = client_context['spoken_text_queue']
-    is_speaking = client_context['is_speaking']
-    if text:
-        spoken_text_queue.append(text)
-    if not is_speaking:
-        def speakThread():
-            nonlocal client_context
-            nonlocal spoken_text_queue
-            nonlocal ending_silence_ms
-            tts_voice = client_context['tts_voice']
-            personal_voice_speaker_profile_id = client_context['personal_voice_speaker_profile_id']
-            client_context['is_speaking'] = True
-            while len(spoken_text_queue) > 0:
-                text = spoken_text_queue.pop(0)
-                client_context['speaking_text'] = text
-                try:
-                    speakText(text, tts_voice, personal_voice_speaker_profile_id, ending_silence_ms, client_id)
-                except Exception as e:
-                    print(f"Error in speaking text: {e}")
-                    break
-                client_context['last_speak_time'] = datetime.datetime.now(pytz.UTC)
-            client_context['is_speaking'] = False
-            client_context['speaking_text'] = None
-            print(f"Speaking thread stopped.")
-        client_context['speaking_thread'] = threading.Thread(target=speakThread)
-        client_context['speaking_thread'].start()
-
-# Speak the given text.
-def speakText(text: str, voice: str, speaker_profile_id: str, ending_silence_ms: int, client_id: uuid.UUID) -> str:
-    ssml = f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
+    client_contexts[client_id].start_speaking()
+    getSpeechScheduler().enqueue(client_id, (text, ending_silence_ms) if text else None)
+
+# One speaking step of the client, run by a speech scheduler worker.
+# Returns True if the client still has sentences to speak, so it is scheduled again.
+def speakNextSentence(client_id: uuid.UUID) -> bool:
+    client_context = client_contexts.get(client_id)
+    if client_context is None:
+        return False
+    speaking_in_flight = client_context.speaking_in_flight
+    speaking_futures = client_context.speaking_futures
+    speaking_submit_times = client_context.speaking_submit_times
+    queue_waits = [] # Recorded once speaking_condition is released, recordLatency() emits to the browser
+    with client_context.speaking_condition:
+        if not client_context.is_speaking:
+            return False
+        # Keep up to tts_lookahead sentences in flight behind the speaking one, so the service synthesizes
+        # the next sentence as soon as the current one ends, instead of waiting for a round trip from here
+        while len(speaking_futures) <= tts_lookahead:
+            spoken_text, queue_wait = speech_scheduler.popleft(client_id)
+            if spoken_text is None:
+                break
+            queue_waits.append(queue_wait)
+            text, ending_silence_ms = spoken_text
+            ssml = buildSpeakSsml(text, client_context.tts_voice, client_context.personal_voice_speaker_profile_id, ending_silence_ms)
+            speaking_futures.append(client_context.speech_synthesizer.speak_ssml_async(ssml))
+            speaking_in_flight.append(spoken_text)
+            speaking_submit_times.append(time.perf_counter())
+            if client_context.turn_start_time is not None and client_context.turn_first_audio_submit_time is None:
+                client_context.turn_first_audio_submit_time = speaking_submit_times[-1] # The first sentence of the turn
+        if len(speaking_futures) == 0:
+            client_context.speaking_stopped()
+            print(f"Speaking stopped.")
+            return False
+        client_context.speaking_text = speaking_in_flight[0][0]
+    for queue_wait in queue_waits:
+        recordLatency(client_id, 'tts_queue_wait', queue_wait * 1000)
+    return False # Scheduled again by handleSynthesisCompleted() when a sentence ends, or by the next enqueued sentence
+
+# Take the sentence which finished speaking out of the in-flight sentences, and schedule the client to submit the next ones.
+# The sentences are spoken in the order they were submitted, so the finished one is the first of speaking_in_flight.
+def handleSynthesisCompleted(client_id: uuid.UUID, evt) -> None:
+    client_context = client_contexts.get(client_id)
+    if client_context is None:
+        return
+    end_time = time.perf_counter() # The end of the audio of the sentence
+    speaking_futures = client_context.speaking_futures
+    with client_context.speaking_condition:
+        if evt.result.result_id not in client_context.speaking_result_ids:
+            return # The empty synthesis which opens the avatar connection, or a sentence of a stopped reply
+        client_context.speaking_result_ids.discard(evt.result.result_id)
+        speaking_futures.pop(0)
+        client_context.speaking_in_flight.pop(0)
+        tts_request_ms = (end_time - client_context.speaking_submit_times.pop(0)) * 1000
+        client_context.last_speak_time = datetime.datetime.now(pytz.UTC)
+        speaking_gap = client_context.sentence_ended(end_time, len(speaking_futures) > 0 or speech_scheduler.depth(client_id) > 0)
+    recordLatency(client_id, 'tts_request', tts_request_ms) # From the submission to the end of the sentence
+    if speaking_gap is not None:
+        recordSpeakingGap(client_id, speaking_gap)
+    speech_scheduler.enqueue(client_id)
+
+# Stop speaking when a sentence fails. The sentences canceled by stopSpeakingInternal() are already out of the speaking state.
+def handleSynthesisCanceled(client_id: uuid.UUID, evt) -> None:
+    import azure.cognitiveservices.speech as speechsdk
+    client_context = client_contexts.get(client_id)
+    if client_context is None:
+        return
+    with client_context.speaking_condition:
+        is_error = evt.result.cancellation_details.reason == speechsdk.CancellationReason.Error
+        if len(client_context.speaking_futures) == 0:
+            return # The empty synthesis which opens the avatar connection, or a sentence of a stopped reply
+        if evt.result.result_id not in client_context.speaking_result_ids and not is_error:
+            return
+        try:
+            checkSpeechSynthesisResult(evt.result)
+        except Exception as e:
+            print(f"Error in speaking text: {e}")
+        if speech_scheduler:
+            speech_scheduler.clear(client_id)
+        client_context.speaking_stopped()
+
+# Record the first audio of a turn, and the silence between two sentences of the same reply, when a sentence starts to synthesize.
+# The silence is measured from the end of the previous sentence, paired in order by sentence_started() / sentence_ended(),
+# as with tts_lookahead the next sentence may start before the speaking worker sees the previous one end.
+def handleSynthesisStarted(client_id: uuid.UUID, evt) -> None:
+    client_context = client_contexts.get(client_id)
+    if client_context is None:
+        return
+    now = time.perf_counter()
+    speaking_gap = None
+    with client_context.speaking_condition:
+        turn_start_time, first_audio_submit_time = client_context.turn_start_time, client_context.turn_first_audio_submit_time
+        if first_audio_submit_time is not None:
+            client_context.turn_start_time = None
+            client_context.turn_first_audio_submit_time = None
+        if len(client_context.speaking_futures) > 0: # Not the empty synthesis which opens the avatar connection
+            client_context.speaking_result_ids.add(evt.result.result_id)
+            speaking_gap = client_context.sentence_started(now)
+    if first_audio_submit_time is not None:
+        recordLatency(client_id, 'tts_first_audio', (now - first_audio_submit_time) * 1000)
+        recordLatency(client_id, 'turn_first_audio', (now - turn_start_time) * 1000)
+    if speaking_gap is not None:
+        recordSpeakingGap(client_id, speaking_gap)
+
+def recordSpeakingGap(client_id: uuid.UUID, speaking_gap: float) -> None:
+    speaking_gap_ms = round(speaking_gap * 1000)
+    print(f"TTS inter-sentence gap: {speaking_gap_ms}ms")
+    recordLatency(client_id, 'tts_gap', speaking_gap_ms)
+
+# Record a latency of the current turn of the client, and send it to the browser, see emitLatency()
+def recordLatency(client_id: uuid.UUID, span: str, ms: float) -> None:
+    client_context = client_contexts.get(client_id)
+    latency_recorder.record(client_id, client_context.turn_id if client_context else 0, span, round(ms))
+
+# Send a latency to the browser, in its own event so it is not mixed into the displayed chat text
+def emitLatency(client_id: uuid.UUID, turn_id: int, span: str, ms: float) -> None:
+    if enable_websockets:
+        socketio.emit("latency", { 'turnId': turn_id, 'span': span, 'ms': ms }, room=client_id)
+
+# Build the SSML to speak the given text.
+def buildSpeakSsml(text: str, voice: str, speaker_profile_id: str, ending_silence_ms: int) -> str:
+    ending_silence = f"<break time='{ending_silence_ms}ms' />" if ending_silence_ms > 0 else ''
+    return f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
                  <voice name='{voice}'>
                      <mstts:ttsembedding speakerProfileId='{speaker_profile_id}'>
                          <mstts:leadingsilence-exact value='0'/>
                          {html.escape(text)}
+                         {ending_silence}
                      </mstts:ttsembedding>
                  </voice>
                </speak>"""
-    if ending_silence_ms > 0:
-        ssml = f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
-                     <voice name='{voice}'>
-                         <mstts:ttsembedding speakerProfileId='{speaker_profile_id}'>
-                             <mstts:leadingsilence-exact value='0'/>
-                             {html.escape(text)}
-                             <break time='{ending_silence_ms}ms' />
-                         </mstts:ttsembedding>
-                     </voice>
-                   </speak>"""
+
+# Speak the given text.
+def speakText(text: str, voice: str, speaker_profile_id: str, ending_silence_ms: int, client_id: uuid.UUID) -> str:
+    ssml = buildSpeakSsml(text, voice, speaker_profile_id, ending_silence_ms)
     return speakSsml(ssml, client_id, False)
 
 # Speak the given ssml with speech sdk
 def speakSsml(ssml: str, client_id: uuid.UUID, asynchronized: bool) -> str:
     global client_contexts
-    speech_synthesizer = client_contexts[client_id]['speech_synthesizer']
-    speech_sythesis_result = speech_synthesizer.start_speaking_ssml_async(ssml).get() if asynchronized else speech_synthesizer.speak_ssml_async(ssml).get()
+    speech_synthesizer = client_contexts[client_id].speech_synthesizer
+    speech_sythesis_result = runBlocking((speech_synthesizer.start_speaking_ssml_async(ssml) if asynchronized else speech_synthesizer.speak_ssml_async(ssml)).get)
+    return checkSpeechSynthesisResult(speech_sythesis_result)
+
+# Raise if the speech synthesis failed, and return the result ID
+def checkSpeechSynthesisResult(speech_sythesis_result) -> str:
+    import azure.cognitiveservices.speech as speechsdk
     if speech_sythesis_result.reason == speechsdk.ResultReason.Canceled:
         cancellation_details = speech_sythesis_result.cancellation_details
         print(f"Speech synthesis canceled: {cancellation_details.reason}")
@@ -947,48 +1473,120 @@ def speakSsml(ssml: str, client_id: uuid.UUID, asynchronized: bool) -> str:
 def stopSpeakingInternal(client_id: uuid.UUID, skipClearingSpokenTextQueue: bool) -> None:
     global client_contexts
     client_context = client_contexts[client_id]
-    client_context['is_speaking'] = False
-    if not skipClearingSpokenTextQueue:
-        spoken_text_queue = client_context['spoken_text_queue']
-        spoken_text_queue.clear()
-    avatar_connection = client_context['speech_synthesizer_connection']
+    speaking_in_flight = client_context.speaking_in_flight
+    stop_start_time = time.perf_counter()
+    with client_context.speaking_condition:
+        was_speaking = client_context.is_speaking
+        if speech_scheduler:
+            if skipClearingSpokenTextQueue:
+                # Put the submitted but not yet spoken sentences back, the speaking one is repeated by continueSpeaking
+                speech_scheduler.enqueue_front(client_id, speaking_in_flight[1:])
+            else:
+                speech_scheduler.clear(client_id)
+        has_pending_sentences = len(speaking_in_flight) > 1
+        client_context.speaking_stopped(keep_speaking_text=True) # Repeated by continueSpeaking after a reconnection
+    speech_synthesizer = client_context.speech_synthesizer
+    if speech_synthesizer and has_pending_sentences:
+        runBlocking(speech_synthesizer.stop_speaking_async().get) # Drop the sentences queued behind the speaking one
+    avatar_connection = client_context.speech_synthesizer_connection
     if avatar_connection:
-        avatar_connection.send_message_async('synthesis.control', '{"action":"stop"}').get()
+        runBlocking(avatar_connection.send_message_async('synthesis.control', '{"action":"stop"}').get)
+    if was_speaking:
+        recordLatency(client_id, 'stop', (time.perf_counter() - stop_start_time) * 1000) # Barge-in, until the avatar is told to stop
 
 # Disconnect avatar internal function
 def disconnectAvatarInternal(client_id: uuid.UUID, isReconnecting: bool) -> None:
     global client_contexts
     client_context = client_contexts[client_id]
     stopSpeakingInternal(client_id, isReconnecting)
-    time.sleep(2) # Wait for the speaking thread to stop
-    avatar_connection = client_context['speech_synthesizer_connection']
+    # Wait for the speaking step in progress to return, instead of a fixed delay
+    if speech_scheduler and not speech_scheduler.wait_idle(client_id, teardown_timeout_seconds):
+        print(f"Speaking did not stop within {teardown_timeout_seconds}s for client {client_id}.")
+    avatar_connection = client_context.speech_synthesizer_connection
     if avatar_connection:
         avatar_connection.close()
+        if not client_context.speech_synthesizer_disconnected.wait(teardown_timeout_seconds):
+            print(f"TTS Avatar service did not disconnect within {teardown_timeout_seconds}s for client {client_id}.")
+
+# Pause STT internal function, the recognizer stays connected but gets no audio until it is resumed
+def pauseSttInternal(client_id: uuid.UUID) -> None:
+    client_context = client_contexts[client_id]
+    audio_input_stream = client_context.audio_input_stream
+    if client_context.speech_recognizer is None or client_context.stt_paused_time is not None:
+        return
+    client_context.stt_paused_time = datetime.datetime.now(pytz.UTC)
+    # End the utterance in progress, 16 kHz 16 bit mono silence
+    audio_input_stream.write(bytes(16 * 2 * stt_pause_flush_ms))
+
+# Resume STT internal function
+def resumeSttInternal(client_id: uuid.UUID) -> None:
+    client_context = client_contexts[client_id]
+    # The result offsets count the audio written to the stream, so the paused time (minus the flushed silence) is not part of the STT latency
+    paused_duration = datetime.datetime.now(pytz.UTC) - client_context.stt_paused_time
+    client_context.stt_start_time += paused_duration - datetime.timedelta(milliseconds=stt_pause_flush_ms)
+    client_context.stt_paused_time = None
 
 # Disconnect STT internal function
 def disconnectSttInternal(client_id: uuid.UUID) -> None:
     global client_contexts
     client_context = client_contexts[client_id]
-    speech_recognizer = client_context['speech_recognizer']
-    audio_input_stream = client_context['audio_input_stream']
+    speech_recognizer, audio_input_stream = client_context.disconnect_stt()
     if speech_recognizer:
-        speech_recognizer.stop_continuous_recognition()
+        import azure.cognitiveservices.speech as speechsdk
+        runBlocking(speech_recognizer.stop_continuous_recognition)
         connection = speechsdk.Connection.from_recognizer(speech_recognizer)
         connection.close()
-        client_context['speech_recognizer'] = None
     if audio_input_stream:
         audio_input_stream.close()
-        client_context['audio_input_stream'] = None
 
-# Start the speech token refresh thread
-speechTokenRefereshThread = threading.Thread(target=refreshSpeechToken)
-speechTokenRefereshThread.daemon = True
-speechTokenRefereshThread.start()
-
-# Start the ICE token refresh thread
-iceTokenRefreshThread = threading.Thread(target=refreshIceToken)
-iceTokenRefreshThread.daemon = True
-iceTokenRefreshThread.start()
+# Get the path of a token file shared by the worker processes, specific to the speech resource.
+# The directory is under the shared temp directory, so another local user could create it first: it is only used if
+# it is a real directory (not a symbolic link) owned by the current user with mode 0700, otherwise each process fetches its own tokens.
+def getTokenCachePath(token_name: str) -> str:
+    if not token_cache_dir:
+        return None
+    try:
+        os.makedirs(token_cache_dir, mode=0o700, exist_ok=True)
+        token_cache_dir_stat = os.lstat(token_cache_dir)
+    except OSError as e:
+        logger.warning(f"Token cache directory {token_cache_dir} is not usable, the tokens are not shared between processes: {e}")
+        return None
+    if not stat.S_ISDIR(token_cache_dir_stat.st_mode) or token_cache_dir_stat.st_uid != os.getuid() or stat.S_IMODE(token_cache_dir_stat.st_mode) != 0o700:
+        logger.warning(f"Token cache directory {token_cache_dir} is not a directory owned by this user with mode 0700, the tokens are not shared between processes")
+        return None
+    speech_resource_hash = hashlib.sha256(f'{speech_region}|{speech_private_endpoint}|{speech_key}'.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(token_cache_dir, f'{token_name}_{speech_resource_hash}.json')
+
+# Fail at startup rather than on the first audio of a client, the VAD model is loaded lazily
+if enable_vad and vad_backend_name == 'onnx' and not vad_torch_fallback and not os.path.exists(vad_onnx_model_path):
+    raise FileNotFoundError(f"VAD is enabled but the VAD ONNX model is not found at {vad_onnx_model_path}, download silero_vad.onnx from the silero-vad repository (see README), or disable enable_vad")
+
+if socketio_message_queue and not session_store_path:
+    logger.warning("Several workers share the Socket.IO rooms, but the sessions are kept in memory (session_store_path is None), so /chat_session only finds the session if it reaches the worker of /process_input")
+
+# Start the speech token and ICE token refresh threads
+speech_token_provider = TokenProvider('speech token', fetchSpeechToken, cache_path=getTokenCachePath('speech_token'))
+speech_token_provider.start()
+ice_token_provider = TokenProvider('ICE token', fetchIceToken, cache_path=getTokenCachePath('ice_token'))
+ice_token_provider.start()
+
+# Record the latency of the voice turns
+latency_recorder = LatencyRecorder(on_record=emitLatency)
+
+# Start the release of the idle client contexts
+from client_eviction import ClientEvictor
+client_evictor = ClientEvictor(
+    client_contexts,
+    release=releaseClientInternal,
+    last_active=ClientContext.last_active_time,
+    idle_seconds=client_idle_timeout_seconds,
+    interval_seconds=client_eviction_interval_seconds,
+    deep_modules=('client_context', 'chat_history', 'audio_ring_buffer', 'vad_iterator'))
+client_evictor.start()
+
+# Development server, production runs under gunicorn: gunicorn -c gunicorn.conf.py
+if __name__ == "__main__":
+    socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
 
 # if __name__ == "__main__":
 #     uvicorn.run("app:app", host="127.0.0.1", port=5000, reload=True)
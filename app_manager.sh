@@ -29,7 +29,7 @@ if [ "$action" == "configure" ]; then
     if ! pip install -r requirements.txt; then
         exit 1
     fi
-elif [ "$action" == "run" ]; then
+elif [ "$action" == "run" ] || [ "$action" == "serve" ]; then
 
     # Load environment variables from .env file
     ENV_FILE=".env/.env.dev" 
@@ -46,9 +46,14 @@ elif [ "$action" == "run" ]; then
     else
         echo "Environment file $ENV_FILE not found. You can create one to set environment variables or manually set secrets in environment variables."
     fi
-    python -m flask run -h 0.0.0.0 -p 5000
+    if [ "$action" == "serve" ]; then
+        # Production server, see gunicorn.conf.py for the concurrency mode (SOCKETIO_ASYNC_MODE)
+        gunicorn -c gunicorn.conf.py
+    else
+        python -m flask run -h 0.0.0.0 -p 5000
+    fi
 else
     echo -e "\e[31mInvalid action: $action\e[0m"
-    echo "Usage: $0 configure or $0 run"
+    echo "Usage: $0 configure, $0 run (development server) or $0 serve (production server)"
     exit 1
 fi
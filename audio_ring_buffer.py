@@ -0,0 +1,74 @@
+import numpy as np
+
+class AudioRingBuffer:
+    def __init__(
+        self,
+        window_samples: int = 512,
+        capacity_windows: int = 16,
+    ):
+        """
+        Preallocated buffer of 16 bit PCM audio, which hands out fixed size windows for VAD
+
+        Incoming chunks are copied into a preallocated byte array, and every complete window is returned as
+        an int16 view on that array (np.frombuffer semantics, no copy). When the write position reaches the
+        end of the array, the unread tail (less than one window in the steady state) is moved to the front,
+        so a window never wraps around and can always be handed out as a contiguous view.
+
+        Parameters
+        ----------
+        window_samples: int (default - 512)
+            Number of samples per window, silero VAD expects 512 samples for 16000 sampling rate
+
+        capacity_windows: int (default - 16)
+            Capacity of the buffer in windows, the buffer grows if a single chunk does not fit
+        """
+
+        self.window_bytes = window_samples * 2
+        self._buffer = np.zeros(capacity_windows * self.window_bytes, dtype=np.uint8)
+        self._read_pos = 0
+        self._write_pos = 0
+
+    def __len__(self) -> int:
+        return self._write_pos - self._read_pos
+
+    def write(self, chunk: bytes) -> None:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        size = len(data)
+        if self._write_pos + size > len(self._buffer):
+            self._compact()
+            if self._write_pos + size > len(self._buffer):
+                self._grow(self._write_pos + size)
+        self._buffer[self._write_pos:self._write_pos + size] = data
+        self._write_pos += size
+
+    def windows(self):
+        """
+        Yield every complete window as an int16 view, in order. A view is only valid until the next write,
+        so it must be consumed (e.g. converted to float) before writing more audio.
+        """
+        while self._write_pos - self._read_pos >= self.window_bytes:
+            window = self._buffer[self._read_pos:self._read_pos + self.window_bytes].view(np.int16)
+            self._read_pos += self.window_bytes
+            yield window
+        if self._read_pos == self._write_pos:
+            self._read_pos = 0
+            self._write_pos = 0
+
+    def clear(self) -> None:
+        self._read_pos = 0
+        self._write_pos = 0
+
+    def _compact(self) -> None:
+        unread = self._write_pos - self._read_pos
+        if unread > 0 and self._read_pos > 0:
+            self._buffer[:unread] = self._buffer[self._read_pos:self._write_pos]
+        self._read_pos = 0
+        self._write_pos = unread
+
+    def _grow(self, min_size: int) -> None:
+        capacity = len(self._buffer)
+        while capacity < min_size:
+            capacity *= 2
+        buffer = np.zeros(capacity, dtype=np.uint8)
+        buffer[:self._write_pos] = self._buffer[:self._write_pos]
+        self._buffer = buffer
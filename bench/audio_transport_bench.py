@@ -0,0 +1,78 @@
+"""
+Compare the two microphone audio transports of the `api.audio` path.
+
+- base64: `socket.emit('message', { clientId, path: 'api.audio', audioChunk: <base64> })`
+- binary: `socket.emit('audio', clientId, <ArrayBuffer>)`
+
+The packets are built the way the Socket.IO v5 protocol frames them on the wire, so the
+reported bytes/sec is what each trainee stream costs on the websocket. The server side CPU
+per stream is the time spent turning a received packet back into PCM bytes.
+
+Usage: python bench/audio_transport_bench.py [--seconds 60] [--frame-samples 128]
+"""
+import argparse
+import base64
+import json
+import os
+import time
+import uuid
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+
+
+def encode_base64_packet(client_id: str, pcm: bytes) -> str:
+    # '4' = engine.io message, '2' = socket.io event
+    return '42' + json.dumps(['message', { 'clientId': client_id, 'path': 'api.audio', 'audioChunk': base64.b64encode(pcm).decode('ascii') }], separators=(',', ':'))
+
+
+def encode_binary_packet(client_id: str, pcm: bytes) -> tuple:
+    # '5' = socket.io binary event, followed by the attachment count and one raw binary frame
+    header = '451-' + json.dumps(['audio', client_id, { '_placeholder': True, 'num': 0 }], separators=(',', ':'))
+    return header, pcm
+
+
+def decode_base64_packet(packet: str) -> bytes:
+    message = json.loads(packet[2:])[1]
+    return base64.b64decode(message['audioChunk'])
+
+
+def decode_binary_packet(header: str, attachment: bytes) -> bytes:
+    json.loads(header[header.index('-') + 1:])
+    return attachment
+
+
+def run(seconds: int, frame_samples: int) -> None:
+    client_id = str(uuid.uuid4())
+    frames = SAMPLE_RATE * seconds // frame_samples
+    pcm = os.urandom(frame_samples * BYTES_PER_SAMPLE)
+
+    base64_packets = [ encode_base64_packet(client_id, pcm) for _ in range(frames) ]
+    binary_packets = [ encode_binary_packet(client_id, pcm) for _ in range(frames) ]
+
+    base64_bytes = sum(len(packet) for packet in base64_packets)
+    binary_bytes = sum(len(header) + len(attachment) for header, attachment in binary_packets)
+
+    start = time.process_time()
+    for packet in base64_packets:
+        decode_base64_packet(packet)
+    base64_cpu = time.process_time() - start
+
+    start = time.process_time()
+    for header, attachment in binary_packets:
+        decode_binary_packet(header, attachment)
+    binary_cpu = time.process_time() - start
+
+    print(f'{seconds}s of 16 kHz PCM per stream, {frame_samples} samples per frame, {frames} frames')
+    print(f'{"transport":<10} {"bytes/sec":>12} {"cpu ms/stream-sec":>18}')
+    for name, total_bytes, cpu in (('base64', base64_bytes, base64_cpu), ('binary', binary_bytes, binary_cpu)):
+        print(f'{name:<10} {total_bytes / seconds:>12.0f} {cpu * 1000 / seconds:>18.3f}')
+    print(f'wire bytes saved: {(1 - binary_bytes / base64_bytes) * 100:.1f}%')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=60)
+    parser.add_argument('--frame-samples', type=int, default=128, help='AudioWorklet render quantum is 128 samples')
+    args = parser.parse_args()
+    run(args.seconds, args.frame_samples)
@@ -0,0 +1,68 @@
+"""
+Avatar connect latency with and without the pool of pre-built speech synthesizers.
+
+The app is driven through the Flask test client, with the speech service replaced by bench/fake_speechsdk.py.
+For each run a client connects the avatar of a scenario and is released. With the pool, the synthesizer of
+the scenario is warmed first, as chat_session does while the page loads, so connectAvatar only pays for the
+connection handshake. The pool stats (hit rate, connect time by hit / miss) are printed at the end.
+
+Usage: python bench/avatar_connect_bench.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import fake_speechsdk
+fake_speechsdk.install()
+import app
+
+AVATAR_KEY = None # The synthesizer pool key of the standard voices
+
+
+def initialize_client():
+    """A client of scenario 1, as chat_session creates it"""
+    with app.app.test_request_context():
+        return app.initializeClient(app.buildScenarioProfile(1))
+
+
+def connect_and_release(client) -> float:
+    client_id = initialize_client()
+    start = time.perf_counter()
+    response = client.post('/api/connectAvatar', data='local-sdp', headers={ 'ClientId': str(client_id) })
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'connectAvatar failed: {response.get_data(as_text=True)}')
+    client.post('/api/releaseClient', data=json.dumps({ 'clientId': str(client_id) }))
+    return elapsed_ms
+
+
+def run(runs: int) -> None:
+    app.ice_token_provider.set(json.dumps({ 'Urls': [ 'turn:relay.example.com:3478' ], 'Username': 'user', 'Password': 'password' }), 60 * 60)
+    client = app.app.test_client()
+
+    print(f'fake service latencies: {fake_speechsdk.LATENCY}')
+    print(f'{"synthesizer pool":<18} {"median ms":>10} {"max ms":>8}')
+    pool_size = app.avatar_pool_size
+    for enabled in (False, True):
+        app.avatar_pool_size = pool_size if enabled else 0
+        latencies = []
+        for _ in range(runs):
+            if enabled:
+                app.getAvatarSynthesizerPool().warm(AVATAR_KEY)
+                time.sleep(0.5) # The page load, while the pool is warmed
+            latencies.append(connect_and_release(client))
+        print(f'{"enabled" if enabled else "disabled":<18} {statistics.median(latencies):>10.0f} {max(latencies):>8.0f}')
+    print(f'pool stats: {app.avatar_synthesizer_pool.stats()}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    run(args.runs)
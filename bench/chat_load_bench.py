@@ -0,0 +1,157 @@
+"""
+Concurrent chat sessions per worker process, with the blocking chat client and with the chat engine.
+
+--sessions chat replies are streamed at the same time from the local mock OpenAI server (bench/mock_openai_server.py,
+started in a separate process, so its threads are not counted), in three modes:
+  - sync: the blocking AzureOpenAI client with one thread per session, as handleUserQuery did before the engine
+  - engine+threads: ChatEngine.stream() with one consumer thread per session, as handleUserQuery does under Flask threads
+  - engine+async: ChatEngine.astream() consumed on the engine loop, with no thread per session
+For each mode it prints the first token latency (p50/p95), the time to stream all the replies, and the peak number
+of threads of the process. The first token latency should stay flat up to --max-concurrency sessions; beyond that
+the engine queues the extra sessions instead of opening more connections.
+
+Requires the openai package. Usage: python bench/chat_load_bench.py [--sessions 200] [--max-concurrency 256]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from chat_engine import ChatEngine
+
+API_VERSION = '2025-01-01-preview'
+MESSAGES = [ { 'role': 'user', 'content': 'Hello' } ]
+
+
+class ThreadCounter:
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(0.01):
+            self.peak = max(self.peak, threading.active_count())
+
+    def stop(self) -> int:
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+def consume(chunks, start_time: float, first_token_latencies: list) -> None:
+    first = True
+    for chunk in chunks:
+        if first and len(chunk.choices) > 0 and chunk.choices[0].delta.content:
+            first_token_latencies.append((time.perf_counter() - start_time) * 1000)
+            first = False
+
+
+def run_threads(sessions: int, stream) -> list:
+    first_token_latencies = []
+    def session():
+        start_time = time.perf_counter()
+        consume(stream(), start_time, first_token_latencies)
+    threads = [ threading.Thread(target=session) for _ in range(sessions) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return first_token_latencies
+
+
+def run_sync(endpoint: str, sessions: int, max_concurrency: int) -> list:
+    import httpx
+    from openai import AzureOpenAI
+    client = AzureOpenAI(azure_endpoint=endpoint, api_version=API_VERSION, api_key='mock',
+                         http_client=httpx.Client(limits=httpx.Limits(max_connections=sessions)))
+    return run_threads(sessions, lambda: client.chat.completions.create(model='mock', messages=MESSAGES, stream=True))
+
+
+def create_engine(endpoint: str, max_concurrency: int) -> ChatEngine:
+    import httpx
+    from openai import AsyncAzureOpenAI
+    return ChatEngine(
+        lambda: AsyncAzureOpenAI(azure_endpoint=endpoint, api_version=API_VERSION, api_key='mock',
+                                 http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=max_concurrency))),
+        max_concurrency=max_concurrency)
+
+
+def run_engine_threads(endpoint: str, sessions: int, max_concurrency: int) -> list:
+    engine = create_engine(endpoint, max_concurrency)
+    return run_threads(sessions, lambda: engine.stream(model='mock', messages=MESSAGES))
+
+
+def run_engine_async(endpoint: str, sessions: int, max_concurrency: int) -> list:
+    engine = create_engine(endpoint, max_concurrency)
+    first_token_latencies = []
+    async def session():
+        start_time = time.perf_counter()
+        first = True
+        async for chunk in engine.astream(model='mock', messages=MESSAGES):
+            if first and len(chunk.choices) > 0 and chunk.choices[0].delta.content:
+                first_token_latencies.append((time.perf_counter() - start_time) * 1000)
+                first = False
+    async def run_all():
+        await asyncio.gather(*[ session() for _ in range(sessions) ])
+    asyncio.run_coroutine_threadsafe(run_all(), engine.loop).result()
+    return first_token_latencies
+
+
+def percentile(values: list, p: float) -> float:
+    return statistics.quantiles(values, n=100)[p - 1] if len(values) > 1 else (values[0] if values else 0)
+
+
+def start_mock_server(first_token_ms: float, token_ms: float, tokens: int):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = subprocess.Popen([ sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_openai_server.py'),
+                                '--port', str(port), '--first-token-ms', str(first_token_ms), '--token-ms', str(token_ms), '--tokens', str(tokens) ])
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server, port
+        except OSError:
+            if time.time() > deadline:
+                server.kill()
+                raise
+            time.sleep(0.05)
+
+
+def run(sessions: int, max_concurrency: int, first_token_ms: float, token_ms: float, tokens: int) -> None:
+    server, port = start_mock_server(first_token_ms, token_ms, tokens)
+    try:
+        endpoint = f'http://127.0.0.1:{port}'
+        print(f'{sessions} sessions, engine max concurrency {max_concurrency}, mock first token {first_token_ms:.0f}ms, {tokens} tokens every {token_ms:.0f}ms')
+        print(f'{"mode":<16} {"TTFT p50 ms":>12} {"TTFT p95 ms":>12} {"total s":>8} {"peak threads":>13}')
+        for name, run_mode in (('sync', run_sync), ('engine+threads', run_engine_threads), ('engine+async', run_engine_async)):
+            threads_before = threading.active_count()
+            counter = ThreadCounter()
+            start_time = time.perf_counter()
+            latencies = run_mode(endpoint, sessions, max_concurrency)
+            total_seconds = time.perf_counter() - start_time
+            peak_threads = counter.stop() - threads_before
+            print(f'{name:<16} {percentile(latencies, 50):>12.0f} {percentile(latencies, 95):>12.0f} {total_seconds:>8.1f} {peak_threads:>13}')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--max-concurrency', type=int, default=256)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--token-ms', type=float, default=20)
+    parser.add_argument('--tokens', type=int, default=60)
+    args = parser.parse_args()
+    run(args.sessions, args.max_concurrency, args.first_token_ms, args.token_ms, args.tokens)
@@ -0,0 +1,122 @@
+"""
+Memory of the client contexts under churn, with and without the release of idle clients (client_eviction.py).
+
+New clients arrive at --rate per second for --seconds, like /chat_session renders. Each one chats for a few turns,
+then goes away: a --released fraction calls /api/releaseClient, the others just close the tab (or reload the page)
+and leave their context behind. The clients are real ClientContext objects in app.client_contexts, with a chat
+history, a VAD buffer, and an avatar connection and a speech recognizer of bench/fake_speechsdk.py, which hold
+--sdk-kb of stand-in native memory. The clients are released by app.releaseClientInternal(), both for
+/api/releaseClient and by the evictor, like in the app. Every second it prints the live contexts, their approximate
+size (ClientEvictor.stats()) and the RSS of the process. With eviction (idle timeout --idle-seconds) the live
+contexts and the RSS should level off, without it they grow with the number of clients.
+
+Requires flask, flask_socketio and the packages of utils.py.
+
+Usage: python bench/client_eviction_soak.py [--seconds 20] [--rate 50] [--idle-seconds 2] [--released 0.3]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import fake_speechsdk
+fake_speechsdk.install()
+import app
+from audio_ring_buffer import AudioRingBuffer
+from chat_history import ChatHistory
+from client_context import ClientContext
+from client_eviction import ClientEvictor
+
+TURN = 'Could you tell me when the shuttle to the airport leaves tomorrow morning, and whether I need to book it?'
+
+# Only the memory is measured: the SDK objects are built without the service latencies, they are still closed with them
+fake_speechsdk.LATENCY['synthesizer_init_ms'] = 0
+fake_speechsdk.LATENCY['recognizer_init_ms'] = 0
+
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Peak, on platforms without /proc
+
+
+def create_client(scenario_profile: dict, sdk_kb: int) -> uuid.UUID:
+    """A client context after a few turns, with its avatar and STT connections, added to app.client_contexts"""
+    client_id = uuid.uuid4()
+    client_context = ClientContext(client_id, scenario_profile, app.azure_openai_deployment_name)
+    chat_history = ChatHistory(max_prompt_tokens=6000)
+    chat_history.reset('You are role-playing as a hotel guest. ' * 20)
+    for i in range(random.randint(2, 10)):
+        chat_history.add_user_message(f'{TURN} ({i})')
+        chat_history.prompt_messages()
+        chat_history.add_message('assistant', TURN * 2)
+    client_context.chat_history = chat_history
+    client_context.vad_audio_buffer = AudioRingBuffer(window_samples=512)
+
+    speech_synthesizer = fake_speechsdk.SpeechSynthesizer()
+    speech_synthesizer.native = bytearray(sdk_kb * 1024)
+    connection = fake_speechsdk.Connection.from_speech_synthesizer(speech_synthesizer)
+    connection.disconnected.connect(lambda evt: client_context.avatar_disconnected(disconnected))
+    disconnected = client_context.connect_avatar(speech_synthesizer, connection)
+    audio_input_stream = fake_speechsdk.PushAudioInputStream()
+    speech_recognizer = fake_speechsdk.SpeechRecognizer(audio_config=fake_speechsdk.AudioConfig(stream=audio_input_stream))
+    speech_recognizer.native = bytearray(sdk_kb // 2 * 1024)
+    client_context.connect_stt(audio_input_stream, speech_recognizer, time.time())
+    app.client_contexts[client_id] = client_context
+    return client_id
+
+
+def run_soak(seconds: float, rate: float, idle_seconds: float, released: float, sdk_kb: int, evict: bool) -> None:
+    scenario_profile = app.buildScenarioProfile(1)
+    evictor = ClientEvictor(app.client_contexts, release=app.releaseClientInternal, last_active=ClientContext.last_active_time,
+                            idle_seconds=idle_seconds, interval_seconds=min(idle_seconds / 4, 1),
+                            deep_modules=('client_context', 'chat_history', 'audio_ring_buffer', 'vad_iterator'))
+    if evict:
+        evictor.start()
+
+    print(f'{"eviction on" if evict else "eviction off"}: {rate:.0f} clients/s, {released:.0%} released by the page, idle timeout {idle_seconds:.0f}s')
+    print(f'{"time s":>7} {"clients":>8} {"live":>6} {"approx MB":>10} {"RSS MB":>8}')
+    start_time = time.time()
+    next_report = start_time + 1
+    clients = 0
+    while time.time() - start_time < seconds:
+        client_id = create_client(scenario_profile, sdk_kb)
+        clients += 1
+        if random.random() < released: # /api/releaseClient
+            threading.Thread(target=app.releaseClientInternal, args=(client_id,), daemon=True).start()
+        time.sleep(1 / rate)
+        if time.time() >= next_report:
+            stats = evictor.stats()
+            print(f'{time.time() - start_time:>7.0f} {clients:>8} {stats["liveContexts"]:>6} {stats["approxBytes"] / 2 ** 20:>10.1f} {rss_mb():>8.1f}')
+            next_report += 1
+    stats = evictor.stats()
+    print(f'evicted {stats["evicted"]}, failures {stats["evictionFailures"]}\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--rate', type=float, default=50, help='New clients per second')
+    parser.add_argument('--idle-seconds', type=float, default=2)
+    parser.add_argument('--released', type=float, default=0.3, help='Fraction of the clients released by the page')
+    parser.add_argument('--sdk-kb', type=int, default=256, help='Native memory of a speech SDK object, in KB')
+    parser.add_argument('--mode', choices=[ 'on', 'off', 'both' ], default='both')
+    args = parser.parse_args()
+    for evict in ((False, True) if args.mode == 'both' else (args.mode == 'on',)):
+        # One process per mode, so the RSS of a run doesn't include the memory left by the other one
+        process = multiprocessing.Process(target=run_soak, args=(args.seconds, args.rate, args.idle_seconds, args.released, args.sdk_kb, evict))
+        process.start()
+        process.join()
@@ -0,0 +1,223 @@
+"""
+End to end load of the app: --trainees simulated trainees go through a training session at the same time.
+
+The real Flask / Socket.IO app is driven through the Flask and Socket.IO test clients, with the speech service
+replaced by bench/fake_speechsdk.py and Azure OpenAI by bench/mock_openai_server.py (started in a separate process).
+Each trainee posts the form (/process_input), loads the chat page (/chat_session), connects the avatar and the
+Socket.IO connection, then takes --turns typed chat turns and --voice-turns spoken turns (audio pushed in 20 ms
+chunks at real time pace to connectSTT's recognizer), waiting for the avatar to finish speaking after each turn,
+and finally releases the client (/api/releaseClient).
+
+It reports the session and turn throughput, p50 / p99 of each stage as seen by the trainee, p50 / p99 of the spans
+measured by the app (the "latency" events, see metrics.py), and the RSS of the process (start, peak and end).
+
+Requires flask, flask_socketio, openai and the packages of utils.py.
+Usage: python bench/e2e_bench.py [--trainees 20] [--turns 3] [--voice-turns 1] [--first-token-ms 300] [--tokens 40]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import fake_speechsdk
+fake_speechsdk.install()
+import app
+from chat_load_bench import percentile, start_mock_server
+from client_eviction_soak import rss_mb
+
+FORM = {
+    'user_input_1': 'Jane Doe',
+    'user_input_2': 'S1234567A',
+    'user_input_3': 'Diploma in Hospitality and Tourism Management',
+    'user_input_4': '2025-06-30',
+    'user_select': 'scenario_1',
+}
+QUERIES = [
+    'Good morning, I would like to check in please.',
+    'Could you tell me what time breakfast is served?',
+    'Is there a shuttle to the airport tomorrow morning?',
+    'Thank you, that is all for now.',
+]
+AUDIO_CHUNK_MS = 20
+CLIENT_ID_REGEX = re.compile(r'id="clientId" value="([^"]+)"')
+
+
+class Results:
+    def __init__(self):
+        self.stages = {} # Stage -> latencies in ms, as seen by the trainee
+        self.spans = {} # Span -> latencies in ms, measured by the app
+        self.turns = 0
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, ms: float) -> None:
+        with self._lock:
+            self.stages.setdefault(stage, []).append(ms)
+
+    def add_span(self, span: str, ms: float) -> None:
+        with self._lock:
+            self.spans.setdefault(span, []).append(ms)
+
+    def add_turn(self) -> None:
+        with self._lock:
+            self.turns += 1
+
+    def add_error(self, error: str) -> None:
+        with self._lock:
+            self.errors.append(error)
+
+
+class RssSampler:
+    def __init__(self):
+        self.start = rss_mb()
+        self.peak = self.start
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(0.1):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return rss_mb()
+
+
+def timed(results: Results, stage: str, request, expected_status: int = 200):
+    start = time.perf_counter()
+    response = request()
+    results.add(stage, (time.perf_counter() - start) * 1000)
+    if response.status_code != expected_status:
+        raise RuntimeError(f'{stage} failed with status {response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+
+def collect_latency_events(socket_client, results: Results) -> list:
+    """Record the latency events received so far, and return their spans"""
+    spans = []
+    for event in socket_client.get_received():
+        if event['name'] == 'latency':
+            latency = event['args'][0]
+            results.add_span(latency['span'], latency['ms'])
+            spans.append(latency['span'])
+    return spans
+
+
+def wait_for_span(socket_client, results: Results, span: str, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if span in collect_latency_events(socket_client, results):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def run_trainee(index: int, turns: int, voice_turns: int, turn_timeout: float, results: Results) -> None:
+    flask_client = app.app.test_client()
+    try:
+        timed(results, 'process_input', lambda: flask_client.post('/process_input', data=FORM), 302)
+        page = timed(results, 'chat_session', lambda: flask_client.get('/chat_session')).get_data(as_text=True)
+        client_id = CLIENT_ID_REGEX.search(page).group(1)
+        headers = { 'ClientId': client_id }
+        timed(results, 'connectAvatar', lambda: flask_client.post('/api/connectAvatar', data='local-sdp', headers=headers))
+        start = time.perf_counter()
+        socket_client = app.socketio.test_client(app.app, query_string=f'clientId={client_id}', flask_test_client=flask_client)
+        results.add('socket connect', (time.perf_counter() - start) * 1000)
+        client_context = app.client_contexts[uuid.UUID(client_id)]
+
+        for turn in range(turns):
+            start = time.perf_counter()
+            # The handler streams the whole reply before returning, the sentences are spoken meanwhile
+            socket_client.emit('message', { 'clientId': client_id, 'path': 'api.chat', 'userQuery': QUERIES[(index + turn) % len(QUERIES)] })
+            results.add('chat reply', (time.perf_counter() - start) * 1000)
+            if not client_context.wait_speaking_stopped(turn_timeout):
+                raise RuntimeError(f'avatar still speaking after {turn_timeout}s')
+            results.add('chat turn', (time.perf_counter() - start) * 1000)
+            collect_latency_events(socket_client, results)
+            results.add_turn()
+
+        if voice_turns > 0:
+            timed(results, 'connectSTT', lambda: flask_client.post('/api/connectSTT', headers=headers))
+        for turn in range(voice_turns):
+            audio_chunk = bytes(32 * AUDIO_CHUNK_MS)
+            for _ in range(fake_speechsdk.UTTERANCE_MS // AUDIO_CHUNK_MS):
+                socket_client.emit('audio', client_id, audio_chunk)
+                time.sleep(AUDIO_CHUNK_MS / 1000)
+            start = time.perf_counter()
+            if not wait_for_span(socket_client, results, 'turn_first_audio', turn_timeout):
+                raise RuntimeError(f'no avatar audio {turn_timeout}s after the end of the utterance')
+            results.add('voice turn first audio', (time.perf_counter() - start) * 1000)
+            if not client_context.wait_speaking_stopped(turn_timeout):
+                raise RuntimeError(f'avatar still speaking after {turn_timeout}s')
+            results.add('voice turn', (time.perf_counter() - start) * 1000)
+            collect_latency_events(socket_client, results)
+            results.add_turn()
+
+        socket_client.disconnect()
+        timed(results, 'releaseClient', lambda: flask_client.post('/api/releaseClient', data=json.dumps({ 'clientId': client_id })))
+    except Exception as e:
+        results.add_error(f'trainee {index}: {e}')
+
+
+def print_table(title: str, latencies: dict) -> None:
+    print(f'{title:<26} {"count":>6} {"p50 ms":>9} {"p99 ms":>9}')
+    for name, values in latencies.items():
+        print(f'{name:<26} {len(values):>6} {percentile(values, 50):>9.0f} {percentile(values, 99):>9.0f}')
+    print()
+
+
+def run(trainees: int, turns: int, voice_turns: int, ramp_seconds: float, turn_timeout: float, first_token_ms: float, token_ms: float, tokens: int) -> None:
+    server, port = start_mock_server(first_token_ms, token_ms, tokens)
+    try:
+        app.azure_openai_endpoint = f'http://127.0.0.1:{port}'
+        app.azure_openai_api_key = 'bench'
+        app.ice_token_provider.set(json.dumps({ 'Urls': [ 'turn:relay.example.com:3478' ], 'Username': 'user', 'Password': 'password' }), 60 * 60)
+        print(f'{trainees} trainees, {turns} chat + {voice_turns} voice turns each, mock first token {first_token_ms:.0f}ms, {tokens} tokens every {token_ms:.0f}ms')
+        print(f'fake service latencies: {fake_speechsdk.LATENCY}\n')
+
+        results = Results()
+        rss = RssSampler()
+        start_time = time.perf_counter()
+        threads = []
+        for index in range(trainees):
+            thread = threading.Thread(target=run_trainee, args=(index, turns, voice_turns, turn_timeout, results), daemon=True)
+            thread.start()
+            threads.append(thread)
+            time.sleep(ramp_seconds / trainees)
+        for thread in threads:
+            thread.join()
+        total_seconds = time.perf_counter() - start_time
+        rss_end = rss.stop()
+
+        print_table('stage (trainee side)', results.stages)
+        print_table('span (app side)', dict(sorted(results.spans.items())))
+        sessions = trainees - len(results.errors)
+        print(f'{sessions} sessions and {results.turns} turns in {total_seconds:.1f}s: {sessions / total_seconds:.2f} sessions/s, {results.turns / total_seconds:.2f} turns/s')
+        print(f'RSS MB: start {rss.start:.1f}, peak {rss.peak:.1f}, end {rss_end:.1f}, live client contexts at the end: {len(app.client_contexts)}')
+        for error in results.errors:
+            print(f'error: {error}')
+    finally:
+        server.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trainees', type=int, default=20)
+    parser.add_argument('--turns', type=int, default=3, help='Typed chat turns per trainee')
+    parser.add_argument('--voice-turns', type=int, default=1, help='Spoken turns per trainee')
+    parser.add_argument('--ramp-seconds', type=float, default=2, help='Time over which the trainees start')
+    parser.add_argument('--turn-timeout', type=float, default=60)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--token-ms', type=float, default=20)
+    parser.add_argument('--tokens', type=int, default=40)
+    args = parser.parse_args()
+    run(args.trainees, args.turns, args.voice_turns, args.ramp_seconds, args.turn_timeout, args.first_token_ms, args.token_ms, args.tokens)
@@ -0,0 +1,53 @@
+"""
+The app served by gunicorn with gunicorn.conf.py, as in production, with the speech service replaced by
+bench/fake_speechsdk.py and Azure OpenAI by --openai-endpoint (e.g. bench/mock_openai_server.py). The concurrency
+mode is SOCKETIO_ASYNC_MODE, as in production.
+
+Requires gunicorn. Usage: SOCKETIO_ASYNC_MODE=threading python bench/fake_server.py [--port 5001] [--openai-endpoint http://127.0.0.1:8765]
+"""
+import argparse
+import json
+import os
+import runpy
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+from gunicorn.app.base import BaseApplication
+
+ICE_TOKEN = { 'Urls': [ 'turn:relay.example.com:3478' ], 'Username': 'user', 'Password': 'password' }
+
+
+class FakeServiceApplication(BaseApplication):
+    def __init__(self, port: int, openai_endpoint: str):
+        self.port = port
+        self.openai_endpoint = openai_endpoint
+        super().__init__()
+
+    def load_config(self) -> None:
+        config = runpy.run_path(os.path.join(ROOT_DIR, 'gunicorn.conf.py'))
+        for name, value in config.items():
+            if name in self.cfg.settings and value is not None:
+                self.cfg.set(name, value)
+        self.cfg.set('bind', f'127.0.0.1:{self.port}')
+        self.cfg.set('accesslog', None)
+
+    def load(self):
+        # Imported in the worker, after the eventlet / gevent workers patched the standard library
+        import fake_speechsdk
+        fake_speechsdk.install()
+        import app
+        app.azure_openai_endpoint = self.openai_endpoint
+        app.azure_openai_api_key = 'bench'
+        app.ice_token_provider.set(json.dumps(ICE_TOKEN), 60 * 60)
+        return app.app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--openai-endpoint', default='http://127.0.0.1:8765')
+    args = parser.parse_args()
+    FakeServiceApplication(args.port, args.openai_endpoint).run()
@@ -0,0 +1,302 @@
+"""
+Minimal stand-in for azure.cognitiveservices.speech, to benchmark the app without the speech service.
+
+It implements the part of the SDK used by app.py, with the service latencies in LATENCY: the avatar connection
+handshake, the round trip of a synthesis request, the speaking time of the synthesized text and the time to close
+a connection. Synthesis requests of a synthesizer are served one at a time in order, like on the service, so a
+request submitted while the previous one is speaking starts without a round trip. A started recognizer recognizes
+RECOGNIZED_TEXT every UTTERANCE_MS of audio pushed to its input stream, recognition_ms after the end of the audio.
+
+Usage (before importing app):
+    import fake_speechsdk
+    fake_speechsdk.install()
+"""
+import enum
+import importlib
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+
+LATENCY = {
+    'synthesizer_init_ms': 60, # SpeechSynthesizer construction (native objects, endpoint and credential setup)
+    'connect_ms': 300, # Avatar connection handshake, the speak_text_async('') of connectAvatar
+    'request_rtt_ms': 150, # From a synthesis request to the first audio
+    'chars_per_second': 15, # Speaking speed
+    'close_ms': 50, # From Connection.close() to the disconnected event
+    'recognizer_init_ms': 40, # SpeechRecognizer construction
+    'recognizer_connect_ms': 250, # start_continuous_recognition(), the connection handshake
+    'recognizer_stop_ms': 50, # stop_continuous_recognition()
+    'recognition_ms': 300, # From the end of an utterance to the final recognition result
+}
+
+UTTERANCE_MS = 1500 # Audio of one utterance, 16 kHz 16 bit mono
+RECOGNIZED_TEXT = 'Hello, I would like to check in, I have a reservation under the name of Tan.'
+
+
+class ResultReason(enum.Enum):
+    SynthesizingAudioStarted = 9
+    SynthesizingAudioCompleted = 10
+    RecognizingSpeech = 2
+    RecognizedSpeech = 3
+    Canceled = 1
+
+
+class CancellationReason(enum.Enum):
+    Error = 1
+    EndOfStream = 2
+    CancelledByUser = 3
+
+
+class EventSignal:
+    def __init__(self):
+        self._callbacks = []
+
+    def connect(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def fire(self, evt=None) -> None:
+        for callback in self._callbacks:
+            callback(evt)
+
+
+class ResultFuture:
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+
+    def set(self, result) -> None:
+        self._result = result
+        self._event.set()
+
+    def get(self):
+        self._event.wait()
+        return self._result
+
+
+class CancellationDetails:
+    def __init__(self, result=None, reason=CancellationReason.CancelledByUser, error_details=''):
+        self.reason = reason
+        self.error_details = error_details
+
+
+class SpeechSynthesisResult:
+    def __init__(self, reason: ResultReason, cancellation_details: CancellationDetails = None, result_id: str = None):
+        self.result_id = result_id or uuid.uuid4().hex
+        self.reason = reason
+        self.cancellation_details = cancellation_details
+
+
+def _completed_future(result) -> ResultFuture:
+    future = ResultFuture()
+    future.set(result)
+    return future
+
+
+class PropertyCollection:
+    def __init__(self):
+        self._properties = {}
+
+    def get_property_by_name(self, name: str) -> str:
+        return self._properties.get(name, '')
+
+    def set_property_by_name(self, name: str, value: str) -> None:
+        self._properties[name] = value
+
+
+class SpeechConfig:
+    def __init__(self, subscription: str = None, region: str = None, endpoint: str = None):
+        self.subscription = subscription
+        self.region = region
+        self.endpoint = endpoint
+        self.endpoint_id = None
+        self.authorization_token = None
+        self.speech_recognition_language = None
+
+
+class SpeechSynthesizer:
+    def __init__(self, speech_config: SpeechConfig = None, audio_config=None):
+        time.sleep(LATENCY['synthesizer_init_ms'] / 1000)
+        self.authorization_token = speech_config.authorization_token if speech_config else None
+        self.properties = PropertyCollection()
+        self.properties.set_property_by_name('SpeechSDKInternal-ExtraTurnStartMessage', '{"webrtc": {"connectionString": "fake-remote-sdp"}}')
+        self.synthesis_started = EventSignal()
+        self.synthesis_completed = EventSignal()
+        self.synthesis_canceled = EventSignal()
+        self.connection = None
+        self._condition = threading.Condition()
+        self._requests = [] # (text, future, submit_time, result_id)
+        self._speaking = None
+        self._stop = threading.Event()
+        self._connected = False
+        self._closed = False # Connection closed, the request thread exits
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def speak_text_async(self, text: str) -> ResultFuture:
+        if not self._connected:
+            time.sleep(LATENCY['connect_ms'] / 1000)
+            self._connected = True
+            if self.connection:
+                self.connection.connected.fire()
+        return self._submit(text)
+
+    def speak_ssml_async(self, ssml: str) -> ResultFuture:
+        return self._submit(re.sub(r'<[^>]+>', '', ssml).strip())
+
+    def start_speaking_ssml_async(self, ssml: str) -> ResultFuture:
+        self.speak_ssml_async(ssml)
+        return _completed_future(SpeechSynthesisResult(ResultReason.SynthesizingAudioCompleted))
+
+    def stop_speaking_async(self) -> ResultFuture:
+        with self._condition:
+            cancelled = [ (future, result_id) for _, future, _, result_id in self._requests ]
+            self._requests.clear()
+            self._stop.set()
+            self._condition.notify()
+        for future, result_id in cancelled:
+            self._finish(future, SpeechSynthesisResult(ResultReason.Canceled, CancellationDetails(), result_id))
+        return _completed_future(None)
+
+    def _submit(self, text: str) -> ResultFuture:
+        future = ResultFuture()
+        with self._condition:
+            self._requests.append((text, future, time.perf_counter(), uuid.uuid4().hex))
+            self._condition.notify()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._requests) == 0 and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                text, future, submit_time, result_id = self._requests.pop(0)
+                self._stop.clear()
+            # The round trip overlaps with the previous request when the request was submitted ahead
+            delay = submit_time + LATENCY['request_rtt_ms'] / 1000 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.synthesis_started.fire(types.SimpleNamespace(result=SpeechSynthesisResult(ResultReason.SynthesizingAudioStarted, result_id=result_id)))
+            stopped = self._stop.wait(len(text) / LATENCY['chars_per_second'])
+            if stopped:
+                self._finish(future, SpeechSynthesisResult(ResultReason.Canceled, CancellationDetails(), result_id))
+            else:
+                self._finish(future, SpeechSynthesisResult(ResultReason.SynthesizingAudioCompleted, result_id=result_id))
+
+    def _finish(self, future: ResultFuture, result: SpeechSynthesisResult) -> None:
+        """Set the result of a request, and fire its synthesis_completed or synthesis_canceled event"""
+        future.set(result)
+        if result.reason == ResultReason.Canceled:
+            self.synthesis_canceled.fire(types.SimpleNamespace(result=result))
+        else:
+            self.synthesis_completed.fire(types.SimpleNamespace(result=result))
+
+
+class Connection:
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.connected = EventSignal()
+        self.disconnected = EventSignal()
+        self.message_received = EventSignal()
+
+    @classmethod
+    def from_speech_synthesizer(cls, speech_synthesizer: SpeechSynthesizer) -> 'Connection':
+        connection = cls(speech_synthesizer)
+        speech_synthesizer.connection = connection
+        return connection
+
+    @classmethod
+    def from_recognizer(cls, speech_recognizer) -> 'Connection':
+        return cls(speech_recognizer)
+
+    def set_message_property(self, path: str, property_name: str, property_value: str) -> None:
+        pass
+
+    def send_message_async(self, path: str, payload: str) -> ResultFuture:
+        if path == 'synthesis.control' and isinstance(self.owner, SpeechSynthesizer):
+            self.owner._stop.set()
+        return _completed_future(None)
+
+    def close(self) -> None:
+        if isinstance(self.owner, SpeechSynthesizer):
+            with self.owner._condition:
+                self.owner._closed = True
+                self.owner._condition.notify()
+        def closed():
+            time.sleep(LATENCY['close_ms'] / 1000)
+            self.disconnected.fire()
+        threading.Thread(target=closed, daemon=True).start()
+
+
+class SpeechRecognizer:
+    def __init__(self, speech_config: SpeechConfig = None, audio_config=None):
+        time.sleep(LATENCY['recognizer_init_ms'] / 1000)
+        self.authorization_token = speech_config.authorization_token if speech_config else None
+        self.session_started = EventSignal()
+        self.session_stopped = EventSignal()
+        self.recognizing = EventSignal()
+        self.recognized = EventSignal()
+        self.canceled = EventSignal()
+        self._started = False
+        if audio_config and audio_config.stream:
+            audio_config.stream.recognizer = self
+
+    def start_continuous_recognition(self) -> None:
+        time.sleep(LATENCY['recognizer_connect_ms'] / 1000)
+        self._started = True
+        self.session_started.fire(types.SimpleNamespace(session_id=uuid.uuid4().hex))
+
+    def stop_continuous_recognition(self) -> None:
+        time.sleep(LATENCY['recognizer_stop_ms'] / 1000)
+        self._started = False
+        self.session_stopped.fire()
+
+    def _recognize(self, offset_ms: float, duration_ms: float) -> None:
+        """Recognize an utterance which just ended, on a thread of its own like the SDK callbacks"""
+        if not self._started:
+            return
+        def recognize():
+            self.recognizing.fire(types.SimpleNamespace(result=types.SimpleNamespace(reason=ResultReason.RecognizingSpeech, text=RECOGNIZED_TEXT)))
+            time.sleep(LATENCY['recognition_ms'] / 1000)
+            result = types.SimpleNamespace(reason=ResultReason.RecognizedSpeech, text=RECOGNIZED_TEXT,
+                                           offset=int(offset_ms * 10000), duration=int(duration_ms * 10000)) # In 100 ns ticks
+            self.recognized.fire(types.SimpleNamespace(result=result))
+        threading.Thread(target=recognize, daemon=True).start()
+
+
+class PushAudioInputStream:
+    def __init__(self, stream_format=None):
+        self.recognizer = None
+        self._written_ms = 0.0
+        self._utterance_start_ms = 0.0
+
+    def write(self, buffer: bytes) -> None:
+        self._written_ms += len(buffer) / 32 # 16 kHz 16 bit mono
+        if self.recognizer and self._written_ms - self._utterance_start_ms >= UTTERANCE_MS:
+            self.recognizer._recognize(self._utterance_start_ms, self._written_ms - self._utterance_start_ms)
+            self._utterance_start_ms = self._written_ms
+
+    def close(self) -> None:
+        self.recognizer = None
+
+
+class AudioConfig:
+    def __init__(self, stream=None, use_default_microphone: bool = False):
+        self.stream = stream
+
+
+def install() -> None:
+    """Register this module as azure.cognitiveservices.speech"""
+    speechsdk = sys.modules[__name__]
+    speechsdk.audio = types.SimpleNamespace(PushAudioInputStream=PushAudioInputStream, AudioConfig=AudioConfig)
+    for name in ('azure', 'azure.cognitiveservices'):
+        try:
+            importlib.import_module(name) # Keep the other azure packages importable, e.g. azure.storage.blob
+        except ImportError:
+            sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules['azure.cognitiveservices.speech'] = speechsdk
+    sys.modules['azure'].cognitiveservices = sys.modules['azure.cognitiveservices']
+    sys.modules['azure.cognitiveservices'].speech = speechsdk
@@ -0,0 +1,85 @@
+"""
+Local stand-in for the Azure OpenAI chat completions API, streaming a canned reply as server-sent events.
+
+It answers any POST to .../chat/completions with chat.completion.chunk events, one token every --token-ms
+after a first token delay of --first-token-ms, then `data: [DONE]`. Point the OpenAI clients at it with
+azure_endpoint=http://127.0.0.1:<port> and any API key.
+
+Usage: python bench/mock_openai_server.py [--port 8765] [--first-token-ms 300] [--token-ms 20] [--tokens 60]
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = 'Sure. Let me walk you through it step by step, so nothing is missed. First, check the account. Then, confirm the address! Finally, we are done; thank you.'
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    first_token_ms = 300
+    token_ms = 20
+    tokens = 60
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.split('?')[0].endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = REPLY.split(' ')
+        time.sleep(self.first_token_ms / 1000)
+        try:
+            for i in range(self.tokens):
+                if i > 0:
+                    time.sleep(self.token_ms / 1000)
+                self._write_event(json.dumps(self._chunk(words[i % len(words)] + ' ')))
+            self._write_event('[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client closed the stream early
+
+    def _chunk(self, content: str) -> dict:
+        return {
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': 'mock',
+            'choices': [ { 'index': 0, 'delta': { 'role': 'assistant', 'content': content }, 'finish_reason': None } ],
+        }
+
+    def _write_event(self, data: str) -> None:
+        payload = f'data: {data}\n\n'.encode('utf-8')
+        self.wfile.write(f'{len(payload):x}\r\n'.encode('ascii') + payload + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start(port: int = 0, first_token_ms: float = 300, token_ms: float = 20, tokens: int = 60) -> ThreadingHTTPServer:
+    """Start the server on a background thread, and return it. server.server_address[1] is the port."""
+    handler = type('Handler', (MockOpenAIHandler,), { 'first_token_ms': first_token_ms, 'token_ms': token_ms, 'tokens': tokens })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--token-ms', type=float, default=20)
+    parser.add_argument('--tokens', type=int, default=60)
+    args = parser.parse_args()
+    server = start(args.port, args.first_token_ms, args.token_ms, args.tokens)
+    print(f'Mock OpenAI server on http://127.0.0.1:{server.server_address[1]}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,95 @@
+"""
+Replay benchmark of the sentence segmentation between the chat stream and TTS.
+
+Token streams (the content of every streamed chunk, with its arrival time in ms since the chat request) are
+replayed through SentenceSegmenter and through the token based splitting handleUserQuery used before, which
+only ended a sentence on a chunk of 1-2 characters starting with a punctuation, or on a newline chunk.
+Reported per stream are the time to the first spoken sentence, the number of sentences and the longest one.
+The sample streams in bench/data/token_streams.json cover one token per chunk, multi-token chunks (as sent
+when the content filter buffers the stream), decimals, abbreviations, lists, CJK and a long unpunctuated
+sentence. Recordings in the same format can be passed with --streams. The sentences of a stream with an
+"expected" list are checked against it (e.g. a reply ending in 'No.'), and the benchmark exits with 1 on a mismatch.
+
+Usage: python bench/sentence_segmenter_bench.py [--streams bench/data/token_streams.json] [--max-chars 200]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+from sentence_segmenter import DEFAULT_PUNCTUATIONS, SentenceSegmenter
+
+
+def replay_legacy(chunks: list) -> list:
+    """Return the (time_ms, sentence) sent to TTS by the previous token based splitting"""
+    sentences = []
+    spoken_sentence = ''
+    for time_ms, token in chunks:
+        if token == '\n' or token == '\n\n':
+            sentences.append((time_ms, spoken_sentence.strip()))
+            spoken_sentence = ''
+            continue
+        token = token.replace('\n', '')
+        spoken_sentence += token
+        if (len(token) == 1 or len(token) == 2) and any(token.startswith(p) for p in DEFAULT_PUNCTUATIONS):
+            sentences.append((time_ms, spoken_sentence.strip()))
+            spoken_sentence = ''
+    if spoken_sentence != '':
+        sentences.append((chunks[-1][0], spoken_sentence.strip()))
+    return [ (time_ms, sentence) for time_ms, sentence in sentences if sentence ]
+
+
+def replay_segmenter(chunks: list, max_chars: int) -> list:
+    """Return the (time_ms, sentence) sent to TTS by SentenceSegmenter"""
+    segmenter = SentenceSegmenter(max_chars=max_chars)
+    sentences = []
+    for time_ms, token in chunks:
+        sentences += [ (time_ms, sentence) for sentence in segmenter.feed(token) ]
+    sentences += [ (chunks[-1][0], sentence) for sentence in segmenter.flush() ]
+    return sentences
+
+
+def run(streams_path: str, max_chars: int, verbose: bool) -> list:
+    with open(streams_path, encoding='utf-8') as f:
+        streams = json.load(f)
+    print(f'{"stream":<36} {"first sentence ms":>22} {"sentences":>12} {"longest chars":>15}')
+    print(f'{"":<36} {"legacy":>10} {"segmenter":>11} {"legacy":>5} {"new":>6} {"legacy":>7} {"new":>7}')
+    mismatches = []
+    for stream in streams:
+        chunks = stream['chunks']
+        legacy = replay_legacy(chunks)
+        segmented = replay_segmenter(chunks, max_chars)
+        print(f'{stream["name"]:<36} {legacy[0][0]:>10.0f} {segmented[0][0]:>11.0f} {len(legacy):>5} {len(segmented):>6} '
+              f'{max(len(s) for _, s in legacy):>7} {max(len(s) for _, s in segmented):>7}')
+        if verbose:
+            for name, sentences in (('legacy', legacy), ('segmenter', segmented)):
+                for time_ms, sentence in sentences:
+                    print(f'    {name:<10} {time_ms:>7.0f}  {sentence}')
+        if 'expected' in stream and [ sentence for _, sentence in segmented ] != stream['expected']:
+            mismatches.append(stream['name'])
+
+    # CPU cost of the segmentation, per streamed chunk
+    all_chunks = [ chunk for stream in streams for chunk in stream['chunks'] ]
+    repeat = 200
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for stream in streams:
+            replay_segmenter(stream['chunks'], max_chars)
+    elapsed = time.perf_counter() - start
+    print(f'\nsegmenter cost: {elapsed / (repeat * len(all_chunks)) * 1e6:.2f} us per chunk')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', default=os.path.join(BENCH_DIR, 'data', 'token_streams.json'))
+    parser.add_argument('--max-chars', type=int, default=200)
+    parser.add_argument('--verbose', action='store_true', help='Print the sentences sent to TTS')
+    args = parser.parse_args()
+    mismatches = run(args.streams, args.max_chars, args.verbose)
+    if mismatches:
+        print(f'unexpected sentences in: {", ".join(mismatches)} (see --verbose)')
+        sys.exit(1)
@@ -0,0 +1,64 @@
+"""
+Size of the session cookie sent in the headers of every request, with the session data in the signed cookie (before)
+and with the server side session store, which leaves only the session id in the cookie (after).
+
+The cookie values are signed by the Flask session interface, like the app does, from the trainee details of the form
+and the scenario profile written by chat_session (system prompt, avatar, search index and background image SAS URL).
+--requests is the number of requests of a training session which carry the cookie (the /api/* calls, the Socket.IO
+handshake and polling requests), to show the bytes saved per session.
+
+Requires flask and the packages of utils.py. Usage: python bench/session_cookie_bench.py [--scenario 1] [--requests 200]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from flask import Flask
+from session_store import SessionStore
+from utils import load_scenario_profile, load_background_image
+
+FORM = {
+    'name': 'Jane Doe',
+    'student_id': 'S1234567A',
+    'diploma': 'Diploma in Hospitality and Tourism Management',
+    'date': '2025-06-30',
+}
+
+
+def cookie_header_bytes(app: Flask, session_data: dict) -> int:
+    value = app.session_interface.get_signing_serializer(app).dumps(session_data)
+    return len(f'Cookie: {app.config["SESSION_COOKIE_NAME"]}={value}\r\n'.encode('utf-8'))
+
+
+def run(scenario_num: int, requests: int) -> None:
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    avatar_name, avatar_character, avatar_style, tts_voice, cognitive_search_index_name, system_prompt = load_scenario_profile(scenario_num, 'scenario-index')
+    background_image_url = load_background_image(scenario_num, None, None, None)
+    form = dict(FORM, scenario=f'scenario_{scenario_num}', scenario_num=scenario_num)
+    cookie_session = dict(
+        form,
+        avatar_name=avatar_name,
+        avatar_character=avatar_character,
+        avatar_style=avatar_style,
+        tts_voice=tts_voice,
+        background_image_url=background_image_url,
+        system_prompt=system_prompt,
+        cognitive_search_index_name=cognitive_search_index_name,
+    )
+    sid = SessionStore().create(form)
+    before = cookie_header_bytes(app, cookie_session)
+    after = cookie_header_bytes(app, { 'sid': sid })
+    print(f'{"session":<22} {"cookie header bytes":>20} {f"bytes / {requests} requests":>22}')
+    print(f'{"signed cookie":<22} {before:>20} {before * requests:>22}')
+    print(f'{"server side store":<22} {after:>20} {after * requests:>22}')
+    print(f'Saved {before - after} bytes per request ({(before - after) * requests / 1024:.1f} KiB per session)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    run(args.scenario, args.requests)
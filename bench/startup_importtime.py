@@ -0,0 +1,61 @@
+"""
+Startup import profile of the app, as paid by every worker on cold start and autoscale-out.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter and reports the total import time and
+the top-level packages sorted by their cumulative import time. Then it simulates the first use of each
+lazily imported subsystem (avatar/STT, chat, VAD) and reports the extra import time it costs.
+
+Usage: python bench/startup_importtime.py [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Modules imported on the first use of each subsystem
+SUBSYSTEMS = {
+    'connectAvatar / connectSTT': 'import azure.cognitiveservices.speech',
+    'chat': 'import openai',
+    'VAD frame': 'import vad_backend, vad_engine, vad_iterator, audio_ring_buffer',
+}
+
+
+def import_profile(code: str) -> list:
+    """Return the (cumulative_us, depth, module) entries of `python -X importtime -c code`"""
+    result = subprocess.run([ sys.executable, '-X', 'importtime', '-c', code ], cwd=REPO_DIR, capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        cumulative_us = int(fields[1])
+        module = fields[2].rstrip()
+        depth = (len(module) - len(module.lstrip())) // 2
+        entries.append((cumulative_us, depth, module.strip()))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else f'exit code {result.returncode}')
+    return entries
+
+
+def top_level_imports(code: str) -> dict:
+    return { module: cumulative_us for cumulative_us, depth, module in import_profile(code) if depth == 0 }
+
+
+def run(top: int) -> None:
+    app_imports = top_level_imports('import app')
+    print(f'import app: {sum(app_imports.values()) / 1000:.0f} ms')
+    for module, cumulative_us in sorted(app_imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f'  {cumulative_us / 1000:>8.1f} ms  {module}')
+    print()
+    for subsystem, code in SUBSYSTEMS.items():
+        extra_imports = { module: us for module, us in top_level_imports(f'import app; {code}').items() if module not in app_imports }
+        print(f'first use of {subsystem}: +{sum(extra_imports.values()) / 1000:.0f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    run(args.top)
@@ -0,0 +1,73 @@
+"""
+Microphone toggle latency: connectSTT / disconnectSTT repeated by one client, push-to-talk style.
+
+The app is driven through the Flask test client, with the speech service replaced by bench/fake_speechsdk.py.
+The first connectSTT of the client connects a recognizer (from the recognizer pool), the following ones resume
+it, as disconnectSTT only pauses it. Reported are the latency of the first connect and of the resumes, and the
+STT session counters of /api/getPoolStats, including the number of recognizers constructed.
+
+Usage: python bench/stt_toggle_bench.py [--toggles 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import fake_speechsdk
+fake_speechsdk.install()
+import app
+from utils import load_scenario_profile
+
+
+def initialize_client():
+    """A client of scenario 1, as chat_session creates it"""
+    avatar_name, avatar_character, avatar_style, tts_voice, cognitive_search_index_name, system_prompt = load_scenario_profile(1, app.cognitive_search_index_base_name)
+    scenario_profile = {
+        'scenario_num': 1,
+        'avatar_character': avatar_character,
+        'avatar_style': avatar_style,
+        'tts_voice': tts_voice,
+        'cognitive_search_index_name': cognitive_search_index_name,
+        'system_prompt': system_prompt
+    }
+    with app.app.test_request_context():
+        return app.initializeClient(scenario_profile)
+
+
+def timed_post(client, path: str, client_id) -> float:
+    start = time.perf_counter()
+    response = client.post(path, headers={ 'ClientId': str(client_id) })
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} failed: {response.get_data(as_text=True)}')
+    return elapsed_ms
+
+
+def run(toggles: int) -> None:
+    client = app.app.test_client()
+    client_id = initialize_client()
+    app.getSttRecognizerPool().warm(app.getSttEndpoint())
+    time.sleep(0.5) # The page load, while the pool is warmed
+    connect_ms = [ timed_post(client, '/api/connectSTT', client_id) ]
+    disconnect_ms = []
+    for _ in range(toggles):
+        disconnect_ms.append(timed_post(client, '/api/disconnectSTT', client_id))
+        connect_ms.append(timed_post(client, '/api/connectSTT', client_id))
+
+    print(f'fake service latencies: {fake_speechsdk.LATENCY}')
+    print(f'first connectSTT:  {connect_ms[0]:.1f} ms')
+    print(f'resume connectSTT: median {statistics.median(connect_ms[1:]):.1f} ms, max {max(connect_ms[1:]):.1f} ms')
+    print(f'disconnectSTT:     median {statistics.median(disconnect_ms):.1f} ms, max {max(disconnect_ms):.1f} ms')
+    print(f'pool stats: {json.loads(client.get("/api/getPoolStats").get_data(as_text=True))}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--toggles', type=int, default=20)
+    args = parser.parse_args()
+    run(args.toggles)
@@ -0,0 +1,78 @@
+"""
+Latency of the avatar connect, reconnect (while speaking) and client release routes.
+
+The app is driven through the Flask test client, with the speech service replaced by bench/fake_speechsdk.py,
+so the measured time is the time the app itself spends on top of the (fake) service latencies: the
+connection handshake, and the time to stop the speaking and close the connection on teardown.
+Before the teardown waited on the speaking worker and on the disconnected event, disconnectAvatarInternal
+slept 2 s, so connect and reconnect took at least 2 s, and release at least 4 s.
+
+Usage: python bench/teardown_latency_bench.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import fake_speechsdk
+fake_speechsdk.install()
+import app
+from utils import load_scenario_profile
+
+SENTENCES = [ 'Welcome to the Grand Hotel!', 'Your room is on the 3rd floor.', 'Breakfast is served from 7:30 to 10:30.' ]
+
+
+def initialize_client():
+    """A client of scenario 1, as chat_session creates it"""
+    avatar_name, avatar_character, avatar_style, tts_voice, cognitive_search_index_name, system_prompt = load_scenario_profile(1, app.cognitive_search_index_base_name)
+    scenario_profile = {
+        'scenario_num': 1,
+        'avatar_character': avatar_character,
+        'avatar_style': avatar_style,
+        'tts_voice': tts_voice,
+        'cognitive_search_index_name': cognitive_search_index_name,
+        'system_prompt': system_prompt
+    }
+    with app.app.test_request_context():
+        return app.initializeClient(scenario_profile)
+
+
+def timed_post(client, path: str, **kwargs) -> float:
+    start = time.perf_counter()
+    response = client.post(path, **kwargs)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'{path} failed: {response.get_data(as_text=True)}')
+    return elapsed_ms
+
+
+def run(runs: int) -> None:
+    app.ice_token_provider.set(json.dumps({ 'Urls': [ 'turn:relay.example.com:3478' ], 'Username': 'user', 'Password': 'password' }), 60 * 60)
+    client = app.app.test_client()
+    results = { 'connect': [], 'reconnect while speaking': [], 'release': [] }
+    for _ in range(runs):
+        client_id = initialize_client()
+        headers = { 'ClientId': str(client_id) }
+        results['connect'].append(timed_post(client, '/api/connectAvatar', data='local-sdp', headers=headers))
+        for sentence in SENTENCES:
+            app.speakWithQueue(sentence, 0, client_id)
+        time.sleep(0.5) # Let the first sentence start speaking
+        results['reconnect while speaking'].append(timed_post(client, '/api/connectAvatar', data='local-sdp', headers={ **headers, 'Reconnect': 'true' }))
+        results['release'].append(timed_post(client, '/api/releaseClient', data=json.dumps({ 'clientId': str(client_id) })))
+
+    print(f'fake service latencies: {fake_speechsdk.LATENCY}')
+    print(f'{"route":<26} {"median ms":>10} {"max ms":>8}')
+    for route, latencies in results.items():
+        print(f'{route:<26} {statistics.median(latencies):>10.0f} {max(latencies):>8.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    run(args.runs)
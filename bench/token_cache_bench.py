@@ -0,0 +1,75 @@
+"""
+Token fetches across worker processes, with and without the token file shared by the processes of a host.
+
+--workers processes (like gunicorn workers) each run a TokenProvider for --seconds, with a fake token lifetime of
+--lifetime seconds, and call get() in a loop like the request paths do. Every fetch (the issueToken call in the
+app) is appended to a log file. With the shared cache there should be one fetch per refresh interval
+(lifetime x 0.9) for the whole host, however many workers there are; without it, one per interval per worker.
+
+Usage: python bench/token_cache_bench.py [--workers 8] [--seconds 10] [--lifetime 2]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from token_provider import TokenProvider
+
+
+def worker(fetch_log_path: str, cache_path: str, seconds: float, lifetime: float, results) -> None:
+    def fetch():
+        with open(fetch_log_path, 'a') as f:
+            f.write(f'{os.getpid()} {time.time()}\n')
+        return f'token-{time.time()}', lifetime
+
+    provider = TokenProvider('bench token', fetch, cache_path=cache_path)
+    provider.start()
+    gets = 0
+    tokens = set()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        tokens.add(provider.get(timeout=lifetime))
+        gets += 1
+        time.sleep(0.001)
+    results.put((gets, len(tokens)))
+
+
+def run_workers(workers: int, seconds: float, lifetime: float, shared: bool) -> dict:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fetch_log_path = os.path.join(temp_dir, 'fetches.log')
+        cache_path = os.path.join(temp_dir, 'token.json') if shared else None
+        results = multiprocessing.Queue()
+        processes = [ multiprocessing.Process(target=worker, args=(fetch_log_path, cache_path, seconds, lifetime, results)) for _ in range(workers) ]
+        for process in processes:
+            process.start()
+        worker_results = [ results.get() for _ in processes ]
+        for process in processes:
+            process.join()
+        with open(fetch_log_path) as f:
+            fetches = len(f.readlines())
+    return {
+        'fetches': fetches,
+        'gets': sum(gets for gets, _ in worker_results),
+        'distinct_tokens': max(tokens for _, tokens in worker_results),
+    }
+
+
+def run(workers: int, seconds: float, lifetime: float) -> None:
+    intervals = int(seconds // (lifetime * 0.9)) + 1 # Including the first fetch at start
+    print(f'{workers} workers, {seconds:.0f}s, refresh every {lifetime * 0.9:.1f}s -> {intervals} refresh intervals')
+    print(f'{"token cache":<12} {"fetches":>8} {"fetches/interval":>17} {"get() calls":>12} {"tokens/worker":>14}')
+    for shared in (False, True):
+        result = run_workers(workers, seconds, lifetime, shared)
+        print(f'{"shared" if shared else "per worker":<12} {result["fetches"]:>8} {result["fetches"] / intervals:>17.1f} {result["gets"]:>12} {result["distinct_tokens"]:>14}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--lifetime', type=float, default=2, help='Fake token lifetime in seconds')
+    args = parser.parse_args()
+    run(args.workers, args.seconds, args.lifetime)
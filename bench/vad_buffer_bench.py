@@ -0,0 +1,62 @@
+"""
+Microbenchmark of the VAD audio buffer, the list based buffer it replaced vs AudioRingBuffer.
+
+Both variants are fed with the same stream of 128 samples chunks (AudioWorklet render quantum) and turn it
+into 512 samples int16 windows. Reported are windows/sec per core (process time) and the number of windows
+produced; the list variant drops the bytes past the first window whenever a chunk completes more than one.
+
+Usage: python bench/vad_buffer_bench.py [--seconds 600] [--chunk-samples 128]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from audio_ring_buffer import AudioRingBuffer
+
+WINDOW_BYTES = 1024
+
+
+def run_list(chunks: list) -> int:
+    windows = 0
+    audio_buffer = []
+    for chunk in chunks:
+        audio_buffer.extend(chunk)
+        if len(audio_buffer) >= WINDOW_BYTES:
+            window = np.frombuffer(bytes(audio_buffer[:WINDOW_BYTES]), dtype=np.int16)
+            audio_buffer.clear()
+            windows += 1
+    return windows
+
+
+def run_ring(chunks: list) -> int:
+    windows = 0
+    audio_buffer = AudioRingBuffer(window_samples=WINDOW_BYTES // 2)
+    for chunk in chunks:
+        audio_buffer.write(chunk)
+        for window in audio_buffer.windows():
+            windows += 1
+    return windows
+
+
+def run(seconds: int, chunk_samples: int) -> None:
+    chunk_count = 16000 * seconds // chunk_samples
+    chunks = [ os.urandom(chunk_samples * 2) for _ in range(chunk_count) ]
+    expected_windows = chunk_count * chunk_samples * 2 // WINDOW_BYTES
+    print(f'{seconds}s of audio, {chunk_count} chunks of {chunk_samples} samples, {expected_windows} complete windows')
+    print(f'{"buffer":<8} {"windows":>10} {"windows/sec/core":>18}')
+    for name, runner in (('list', run_list), ('ring', run_ring)):
+        start = time.process_time()
+        windows = runner(chunks)
+        elapsed = time.process_time() - start
+        print(f'{name:<8} {windows:>10} {windows / elapsed:>18.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=600)
+    parser.add_argument('--chunk-samples', type=int, default=128)
+    args = parser.parse_args()
+    run(args.seconds, args.chunk_samples)
@@ -0,0 +1,86 @@
+"""
+Streaming memory benchmark of VADIterator over a long session.
+
+A scripted speech probability pattern (short turns, plus one long monologue) is fed window by window for
+--minutes of 16 kHz audio, and every minute the bytes held by the pre-roll and utterance buffers are
+reported, together with the process RSS. The list based buffers VADIterator used before are replayed
+alongside for comparison. The audio is only kept with --max-utterance-ms, the app only uses the end of speech.
+
+Usage: python bench/vad_memory_bench.py [--minutes 10] [--max-utterance-ms 0]
+"""
+import argparse
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vad_iterator import VADIterator
+
+WINDOW_SAMPLES = 512
+WINDOWS_PER_SECOND = 16000 / WINDOW_SAMPLES
+
+
+class ListBufferVAD:
+    # The previous buffering of VADIterator: deepcopy of the pre-roll on trigger, unbounded utterance list
+    def __init__(self, pad_windows: int):
+        self.pad_windows = pad_windows
+        self.triggered = False
+        self.buffer = []
+        self.start_pad_buffer = []
+
+    def process(self, x, is_speech: bool):
+        if is_speech and not self.triggered:
+            self.triggered = True
+            self.buffer = [ t.copy() for t in self.start_pad_buffer ]
+            self.buffer.append(x)
+            return
+        if not is_speech and self.triggered:
+            self.triggered = False
+            self.buffer = []
+            return
+        if self.triggered:
+            self.buffer.append(x)
+        self.start_pad_buffer.append(x)
+        self.start_pad_buffer = self.start_pad_buffer[-self.pad_windows:]
+
+    def held_bytes(self) -> int:
+        return sum(t.nbytes for t in self.buffer + self.start_pad_buffer)
+
+
+def speech_probability(second: float) -> float:
+    # 4 minutes of 5 s turns with 3 s pauses, then a 4 minutes monologue, then turns again
+    if 240 <= second < 480:
+        return 0.9
+    return 0.9 if second % 8 < 5 else 0.05
+
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except OSError:
+        return float('nan')
+
+
+def run(minutes: int, max_utterance_ms: int) -> None:
+    vad_iterator = VADIterator(backend=None, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=150, speech_pad_ms=100, max_utterance_ms=max_utterance_ms)
+    list_vad = ListBufferVAD(pad_windows=int(1600 // WINDOW_SAMPLES))
+    windows_per_minute = int(WINDOWS_PER_SECOND * 60)
+    print(f'{"minute":>6} {"ring buffers KB":>16} {"list buffers KB":>16} {"rss MB":>8}')
+    for minute in range(minutes):
+        for i in range(windows_per_minute):
+            second = (minute * windows_per_minute + i) / WINDOWS_PER_SECOND
+            prob = speech_probability(second)
+            x = np.random.rand(WINDOW_SAMPLES).astype(np.float32) - 0.5
+            vad_iterator.process(x, prob)
+            list_vad.process(x, prob >= 0.5)
+        ring_bytes = vad_iterator.buffer.nbytes + vad_iterator.start_pad_buffer.nbytes
+        print(f'{minute + 1:>6} {ring_bytes / 1024:>16.1f} {list_vad.held_bytes() / 1024:>16.1f} {rss_mb():>8.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--minutes', type=int, default=10)
+    parser.add_argument('--max-utterance-ms', type=int, default=0, help='Utterance buffer of VADIterator, 0 to not keep the audio')
+    args = parser.parse_args()
+    run(args.minutes, args.max_utterance_ms)
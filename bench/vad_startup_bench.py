@@ -0,0 +1,61 @@
+"""
+Startup time and memory of the VAD backends, as paid by every gunicorn worker at boot.
+
+Each backend is loaded in a fresh interpreter, which then runs one 512 samples window through the model.
+Reported are the time to import and load the backend, the first inference time and the RSS of the process.
+The torch backend needs network access for torch.hub unless the model is already in the hub cache.
+
+Usage: python bench/vad_startup_bench.py [--onnx-model-path models/silero_vad.onnx] [--runs 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import numpy as np
+from vad_backend import OnnxVADBackend, TorchVADBackend
+backend = OnnxVADBackend(sys.argv[2]) if sys.argv[1] == 'onnx' else TorchVADBackend()
+loaded = time.perf_counter()
+state, context = backend.initial_state(1)
+backend.infer(np.zeros((1, 512), dtype=np.float32), state, context)
+inferred = time.perf_counter()
+rss_kb = 0
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+print(json.dumps({ 'load_ms': (loaded - start) * 1000, 'first_infer_ms': (inferred - loaded) * 1000, 'rss_mb': rss_kb / 1024 }))
+"""
+
+
+def measure(backend: str, onnx_model_path: str) -> dict:
+    output = subprocess.run([ sys.executable, '-c', CHILD_SCRIPT, backend, onnx_model_path ], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(onnx_model_path: str, runs: int) -> None:
+    print(f'{"backend":<8} {"load ms":>10} {"first infer ms":>15} {"rss MB":>8}')
+    for backend in ('onnx', 'torch'):
+        try:
+            results = [ measure(backend, onnx_model_path) for _ in range(runs) ]
+        except subprocess.CalledProcessError as e:
+            print(f'{backend:<8} failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}')
+            continue
+        load_ms = min(r['load_ms'] for r in results)
+        first_infer_ms = min(r['first_infer_ms'] for r in results)
+        rss_mb = max(r['rss_mb'] for r in results)
+        print(f'{backend:<8} {load_ms:>10.0f} {first_infer_ms:>15.1f} {rss_mb:>8.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--onnx-model-path', default=os.path.join('models', 'silero_vad.onnx'))
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    run(args.onnx_model_path, args.runs)
@@ -0,0 +1,183 @@
+"""
+Concurrent WebSocket clients per worker, in each concurrency mode (SOCKETIO_ASYNC_MODE, see gunicorn.conf.py).
+
+For each mode, one gunicorn worker runs the app with the local stand-ins (bench/fake_server.py, with the speech service
+of bench/fake_speechsdk.py and the OpenAI server of bench/mock_openai_server.py, in separate processes). --clients
+trainees open a session (/process_input, /chat_session, /api/connectAvatar) and a Socket.IO WebSocket connection, then
+all send a chat message at the same time, and wait for the first reply chunk and for the avatar to start speaking (the
+turn_first_audio latency event). Reported per mode: the connected clients, the turns which reached the first audio
+within --timeout, p50 / p99 of the time to the first chunk and to the first audio, and the threads and RSS of the worker.
+A mode whose event loop stalls on the blocking speech SDK calls shows it as a growing time to the first audio.
+
+Requires gunicorn, requests and python-socketio with websocket-client, and eventlet / gevent for those modes (skipped
+if not installed). Usage: python bench/ws_capacity_bench.py [--clients 100] [--modes threading,eventlet,gevent] [--timeout 60]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+import requests
+import socketio
+from chat_load_bench import percentile, start_mock_server
+
+FORM = {
+    'user_input_1': 'Jane Doe',
+    'user_input_2': 'S1234567A',
+    'user_input_3': 'Diploma in Hospitality and Tourism Management',
+    'user_input_4': '2025-06-30',
+    'user_select': 'scenario_1',
+}
+CLIENT_ID_REGEX = re.compile(r'id="clientId" value="([^"]+)"')
+
+
+class Trainee:
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.sio = socketio.Client(reconnection=False)
+        self.client_id = None
+        self.connected = False
+        self.first_chunk_ms = None
+        self.first_audio_ms = None
+        self.error = None
+        self._sent_time = None
+        self._first_audio = threading.Event()
+        self.sio.on('response', self._on_response)
+        self.sio.on('latency', self._on_latency)
+
+    def connect(self) -> None:
+        try:
+            self.http.post(f'{self.url}/process_input', data=FORM, allow_redirects=False, timeout=self.timeout).raise_for_status()
+            page = self.http.get(f'{self.url}/chat_session', timeout=self.timeout)
+            page.raise_for_status()
+            self.client_id = CLIENT_ID_REGEX.search(page.text).group(1)
+            self.http.post(f'{self.url}/api/connectAvatar', data='local-sdp', headers={ 'ClientId': self.client_id }, timeout=self.timeout).raise_for_status()
+            self.sio.connect(f'{self.url}?clientId={self.client_id}', transports=[ 'websocket' ], wait_timeout=self.timeout)
+            self.connected = True
+        except Exception as e:
+            self.error = f'connect: {e}'
+
+    def chat(self) -> None:
+        if not self.connected:
+            return
+        self._sent_time = time.perf_counter()
+        self.sio.emit('message', { 'clientId': self.client_id, 'path': 'api.chat', 'userQuery': 'Good morning, I would like to check in please.' })
+        if not self._first_audio.wait(self.timeout):
+            self.error = f'no first audio within {self.timeout}s'
+
+    def release(self) -> None:
+        try:
+            if self.connected:
+                self.sio.disconnect()
+            if self.client_id:
+                self.http.post(f'{self.url}/api/releaseClient', data=json.dumps({ 'clientId': self.client_id }), timeout=self.timeout)
+        except Exception:
+            pass
+
+    def _on_response(self, data) -> None:
+        if self._sent_time is not None and self.first_chunk_ms is None and data.get('path') == 'api.chat' and data.get('chatResponse'):
+            self.first_chunk_ms = (time.perf_counter() - self._sent_time) * 1000
+
+    def _on_latency(self, data) -> None:
+        if self._sent_time is not None and data.get('span') == 'turn_first_audio' and not self._first_audio.is_set():
+            self.first_audio_ms = (time.perf_counter() - self._sent_time) * 1000
+            self._first_audio.set()
+
+
+def worker_stats(master_pid: int) -> tuple:
+    """Threads and RSS MB of the gunicorn worker of the master process (Linux /proc)"""
+    for pid in os.listdir('/proc'):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except (OSError, ValueError):
+            continue
+        if status.get('PPid', '').strip() == str(master_pid):
+            return int(status['Threads']), int(status['VmRSS'].split()[0]) / 1024
+    return 0, 0.0
+
+
+def start_server(mode: str, openai_port: int):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=mode, GUNICORN_WORKERS='1')
+    server = subprocess.Popen([ sys.executable, os.path.join(BENCH_DIR, 'fake_server.py'), '--port', str(port), '--openai-endpoint', f'http://127.0.0.1:{openai_port}' ],
+                              env=env, cwd=os.path.join(BENCH_DIR, '..'), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while True:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/api/getPoolStats', timeout=1)
+            return server, f'http://127.0.0.1:{port}'
+        except requests.RequestException:
+            if time.time() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError(f'The {mode} server did not start')
+            time.sleep(0.2)
+
+
+def run_mode(mode: str, clients: int, timeout: float, openai_port: int) -> None:
+    server, url = start_server(mode, openai_port)
+    try:
+        trainees = [ Trainee(url, timeout) for _ in range(clients) ]
+        threads = [ threading.Thread(target=trainee.connect, daemon=True) for trainee in trainees ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        threads = [ threading.Thread(target=trainee.chat, daemon=True) for trainee in trainees ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        worker_threads, worker_rss_mb = worker_stats(server.pid)
+        for trainee in trainees:
+            trainee.release()
+
+        connected = sum(trainee.connected for trainee in trainees)
+        first_chunk_ms = [ trainee.first_chunk_ms for trainee in trainees if trainee.first_chunk_ms is not None ]
+        first_audio_ms = [ trainee.first_audio_ms for trainee in trainees if trainee.first_audio_ms is not None ]
+        print(f'{mode:<10} {connected:>9} {len(first_audio_ms):>7} {percentile(first_chunk_ms, 50):>10.0f} {percentile(first_chunk_ms, 99):>10.0f} '
+              f'{percentile(first_audio_ms, 50):>10.0f} {percentile(first_audio_ms, 99):>10.0f} {worker_threads:>8} {worker_rss_mb:>8.1f}')
+        errors = [ trainee.error for trainee in trainees if trainee.error ]
+        if errors:
+            print(f'{"":<10} {len(errors)} errors, e.g. {errors[0]}')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(clients: int, modes: list, timeout: float, first_token_ms: float, token_ms: float, tokens: int) -> None:
+    openai_server, openai_port = start_mock_server(first_token_ms, token_ms, tokens)
+    try:
+        print(f'{clients} clients per worker, mock first token {first_token_ms:.0f}ms, {tokens} tokens every {token_ms:.0f}ms')
+        print(f'{"mode":<10} {"connected":>9} {"turns":>7} {"chunk p50":>10} {"chunk p99":>10} {"audio p50":>10} {"audio p99":>10} {"threads":>8} {"RSS MB":>8}')
+        for mode in modes:
+            if mode != 'threading' and importlib.util.find_spec(mode) is None:
+                print(f'{mode:<10} skipped, {mode} is not installed')
+                continue
+            run_mode(mode, clients, timeout, openai_port)
+    finally:
+        openai_server.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--modes', default='threading,eventlet,gevent')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--token-ms', type=float, default=20)
+    parser.add_argument('--tokens', type=int, default=40)
+    args = parser.parse_args()
+    run(args.clients, args.modes.split(','), args.timeout, args.first_token_ms, args.token_ms, args.tokens)
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_END = object() # End of a stream
+
+class _StreamError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class ChatEngine:
+    def __init__(
+        self,
+        client_factory,
+        max_concurrency: int = 32,
+        max_buffered_chunks: int = 64,
+    ):
+        """
+        Streams chat completions on one asyncio event loop, shared by all the clients of the process
+
+        The completions are streamed with an async client (AsyncAzureOpenAI) on an event loop thread, so the
+        HTTP streams of all the replies are read by one thread, instead of one blocked thread per reply.
+        At most max_concurrency completions are streamed at the same time, more wait for a slot. Each stream
+        buffers at most max_buffered_chunks chunks for its consumer: once the buffer is full, reading from the
+        HTTP stream pauses until the consumer catches up (e.g. while it waits on a full TTS queue).
+
+        Parameters
+        ----------
+        client_factory: callable
+            `client_factory()` returning the async OpenAI client, called once on the event loop thread
+
+        max_concurrency: int (default - 32)
+            Maximum number of completions streamed at the same time
+
+        max_buffered_chunks: int (default - 64)
+            Maximum number of chunks read ahead of the consumer, per stream
+        """
+
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.max_buffered_chunks = max_buffered_chunks
+        self._client = None
+        self._semaphore = None
+        self._active_streams = 0
+        self._waiting_streams = 0
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='ChatEngine')
+        self._thread.daemon = True
+        self._thread.start()
+
+    async def astream(self, **kwargs):
+        """
+        Async generator of the chunks of a streamed chat completion, to be iterated on the engine loop.
+        kwargs are the arguments of `chat.completions.create()`, without stream.
+        """
+        if self._client is None:
+            self._client = self.client_factory()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._waiting_streams += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting_streams -= 1
+        self._active_streams += 1
+        response = None
+        try:
+            response = await self._client.chat.completions.create(stream=True, **kwargs)
+            async for chunk in response:
+                yield chunk
+        finally:
+            if response is not None:
+                await response.close() # Release the HTTP connection of a stream closed early
+            self._active_streams -= 1
+            self._semaphore.release()
+
+    def stream(self, **kwargs):
+        """
+        Generator of the chunks of a streamed chat completion, for consumers on other threads, e.g. a Flask
+        streaming response. The completion is read on the engine loop, through a bounded buffer.
+        Errors of the completion (e.g. rate limits) are raised here. Closing the generator cancels the completion.
+        """
+        queue, task = asyncio.run_coroutine_threadsafe(self._start_stream(kwargs), self.loop).result()
+        try:
+            while True:
+                item = asyncio.run_coroutine_threadsafe(queue.get(), self.loop).result()
+                if item is _END:
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.error
+                yield item
+        finally:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    def stats(self) -> dict:
+        return { 'activeStreams': self._active_streams, 'waitingStreams': self._waiting_streams, 'maxConcurrency': self.max_concurrency }
+
+    async def _start_stream(self, kwargs: dict):
+        queue = asyncio.Queue(maxsize=self.max_buffered_chunks)
+        task = self.loop.create_task(self._produce(queue, kwargs))
+        return queue, task
+
+    async def _produce(self, queue: asyncio.Queue, kwargs: dict) -> None:
+        chunks = self.astream(**kwargs)
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk) # Waits while the buffer is full
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_StreamError(e))
+            return
+        finally:
+            await chunks.aclose()
+        await queue.put(_END)
@@ -0,0 +1,162 @@
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_TURN_STATS = 100 # Number of turns whose token counts are kept
+MESSAGE_OVERHEAD_TOKENS = 4 # Tokens of the role and the separators of a chat message
+SUMMARY_PREFIX = 'Summary of the earlier conversation: '
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Number of tokens of a text, with tiktoken if it is installed, otherwise estimated (about 4 characters per token)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding('o200k_base')
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def count_message_tokens(message: dict) -> int:
+    return count_tokens(message.get('content') or '') + MESSAGE_OVERHEAD_TOKENS
+
+
+class ChatHistory:
+    def __init__(
+        self,
+        max_prompt_tokens: int = 6000,
+        summarize=None,
+    ):
+        """
+        Chat history of a client, which keeps the prompt within a token budget
+
+        The history is a system prompt followed by turns, a turn being a user message and the messages which
+        answer it. `prompt_messages()` returns the system prompt and the latest turns which fit in
+        max_prompt_tokens, so the prompt doesn't grow with the length of the session. The current turn is
+        always kept. Empty messages (e.g. the tool message of an 'on your data' reply without citations) are
+        not kept.
+
+        The turns which fall out of the budget are forgotten, or if summarize is set, folded into a running
+        summary by `fold()`, which is sent after the system prompt.
+
+        Parameters
+        ----------
+        max_prompt_tokens: int (default - 6000)
+            Token budget of the prompt (system prompt, summary and turns), 0 for no limit
+
+        summarize: callable (default - None)
+            `summarize(summary, messages) -> str`, which returns the previous summary (or '') updated with the
+            given messages. Called by `fold()`, e.g. from a background thread, as it is a chat completion itself.
+        """
+
+        self.max_prompt_tokens = max_prompt_tokens
+        self.summarize = summarize
+        self._system_message = None
+        self._summary = ''
+        self._turns = [] # List of [ messages, tokens ]
+        self._windowed_out_turns = 0 # Number of leading turns out of the prompt, not folded yet
+        self._turn_stats = collections.deque(maxlen=MAX_TURN_STATS) # Per turn { 'promptTokens', 'estimatedPromptTokens', 'droppedTurns' }
+        self._lock = threading.Lock()
+
+    def reset(self, system_prompt: str) -> None:
+        """Start a new conversation with the given system prompt"""
+        with self._lock:
+            self._system_message = { 'role': 'system', 'content': system_prompt }
+            self._summary = ''
+            self._turns.clear()
+            self._windowed_out_turns = 0
+            self._turn_stats.clear()
+
+    def add_user_message(self, content: str) -> None:
+        """Start a new turn with the user message"""
+        with self._lock:
+            self._turns.append([ [], 0 ])
+            self._append({ 'role': 'user', 'content': content })
+
+    def add_message(self, role: str, content: str) -> None:
+        """Add a message to the current turn, e.g. the assistant reply. Empty messages are dropped."""
+        if not content:
+            return
+        with self._lock:
+            if len(self._turns) == 0:
+                self._turns.append([ [], 0 ])
+            self._append({ 'role': role, 'content': content })
+
+    def prompt_messages(self) -> list:
+        """The messages to send for the current turn, and record their estimated token count"""
+        with self._lock:
+            head = self._head_messages()
+            tokens = sum(count_message_tokens(message) for message in head)
+            first_turn = len(self._turns)
+            for i in range(len(self._turns) - 1, -1, -1):
+                turn_tokens = self._turns[i][1]
+                if self.max_prompt_tokens > 0 and tokens + turn_tokens > self.max_prompt_tokens and i < len(self._turns) - 1:
+                    break
+                tokens += turn_tokens
+                first_turn = i
+            self._turn_stats.append({ 'promptTokens': None, 'estimatedPromptTokens': tokens, 'droppedTurns': first_turn })
+            self._windowed_out_turns = first_turn
+            if self.summarize is None:
+                del self._turns[:first_turn]
+                self._windowed_out_turns = first_turn = 0
+            messages = list(head)
+            for turn_messages, _ in self._turns[first_turn:]:
+                messages.extend(turn_messages)
+            return messages
+
+    def record_prompt_tokens(self, prompt_tokens: int) -> None:
+        """Record the prompt token count reported by the service (the usage of the completion) for the current turn"""
+        with self._lock:
+            if len(self._turn_stats) > 0:
+                self._turn_stats[-1]['promptTokens'] = prompt_tokens
+
+    def needs_fold(self) -> bool:
+        """Whether some turns fell out of the prompt of the current turn, and can be folded into the summary"""
+        with self._lock:
+            return self.summarize is not None and self._windowed_out_turns > 0
+
+    def fold(self) -> None:
+        """Fold the turns which fell out of the budget into the summary. Blocks on summarize()."""
+        with self._lock:
+            if self.summarize is None:
+                return
+            folded = self._turns[:self._windowed_out_turns]
+            summary = self._summary
+        if len(folded) == 0:
+            return
+        try:
+            summary = self.summarize(summary, [ message for turn_messages, _ in folded for message in turn_messages ])
+        except Exception as e:
+            logger.warning(f"Failed to summarize the chat history: {e}")
+            return
+        with self._lock:
+            if len(self._turns) < len(folded) or any(turn is not folded_turn for turn, folded_turn in zip(self._turns, folded)):
+                return # Reset or folded by another thread while summarizing
+            del self._turns[:len(folded)]
+            self._windowed_out_turns = max(self._windowed_out_turns - len(folded), 0)
+            self._summary = summary
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'turns': len(self._turns),
+                'summaryTokens': count_tokens(self._summary) if self._summary else 0,
+                'turnStats': list(self._turn_stats),
+            }
+
+    def _append(self, message: dict) -> None:
+        turn = self._turns[-1]
+        turn[0].append(message)
+        turn[1] += count_message_tokens(message)
+
+    def _head_messages(self) -> list:
+        messages = [ self._system_message ] if self._system_message else []
+        if self._summary:
+            messages.append({ 'role': 'system', 'content': SUMMARY_PREFIX + self._summary })
+        return messages
@@ -0,0 +1,252 @@
+import collections
+import threading
+import time
+
+class ClientContext:
+    __slots__ = (
+        # Scenario of the client
+        'client_id', 'session_id', 'scenario_num', 'avatar_character', 'avatar_style', 'system_prompt',
+        'azure_openai_deployment_name', 'cognitive_search_index_name', 'tts_voice', 'custom_voice_endpoint_id',
+        'personal_voice_speaker_profile_id',
+        # Speech recognition
+        'audio_input_stream', 'speech_recognizer', 'stt_start_time', 'stt_paused_time', 'stt_canceled',
+        'vad_audio_buffer', 'vad_iterator',
+        # Avatar connection
+        'speech_synthesizer', 'speech_synthesizer_connection', 'speech_synthesizer_connected',
+        'speech_synthesizer_disconnected',
+        # Chat
+        'chat_initiated', 'chat_history', 'data_sources', 'reply_lock',
+        # Speaking state, guarded by speaking_condition
+        'is_speaking', 'speaking_text', 'speaking_in_flight', 'speaking_futures', 'speaking_condition',
+        'speaking_submit_times', 'speaking_started_count', 'speaking_ended_count', 'speaking_start_times',
+        'speaking_end_times', 'speaking_result_ids', 'last_speak_time',
+        # Latency of the current turn, see metrics.py
+        'turn_id', 'turn_start_time', 'turn_first_audio_submit_time',
+        # Lifecycle
+        'last_activity_time', 'socket_connections', 'released', 'lock',
+    )
+
+    def __init__(
+        self,
+        client_id,
+        scenario_profile: dict,
+        azure_openai_deployment_name: str,
+        session_id: str = None,
+    ):
+        """
+        State of a client (a chat page), from /chat_session until it is released
+
+        The connections of the client are attached and detached with the lifecycle methods (`connect_avatar()`,
+        `avatar_disconnected()`, `connect_stt()`, `disconnect_stt()`, `release()`), which update the related
+        fields together under `lock`. The speaking state (is_speaking, speaking_text, speaking_in_flight,
+        speaking_futures) is shared by the request threads and the speech scheduler workers, and is only read
+        and written while holding `speaking_condition`, which is notified when the speaking stops.
+
+        Parameters
+        ----------
+        client_id: uuid.UUID
+            Id of the client
+
+        scenario_profile: dict
+            scenario_num, avatar_character, avatar_style, tts_voice, cognitive_search_index_name and system_prompt
+
+        azure_openai_deployment_name: str
+            Azure OpenAI deployment of the chat
+
+        session_id: str (default - None)
+            Server side session of the browser, kept while the client exists
+        """
+
+        self.client_id = client_id
+        self.session_id = session_id
+        self.scenario_num = scenario_profile['scenario_num'] # Scenario number, for the background image
+        self.avatar_character = scenario_profile['avatar_character']
+        self.avatar_style = scenario_profile['avatar_style']
+        self.system_prompt = scenario_profile['system_prompt']
+        self.azure_openai_deployment_name = azure_openai_deployment_name
+        self.cognitive_search_index_name = scenario_profile['cognitive_search_index_name']
+        self.tts_voice = scenario_profile['tts_voice']
+        self.custom_voice_endpoint_id = None # Endpoint ID (deployment ID) for custom voice
+        self.personal_voice_speaker_profile_id = None # Speaker profile ID for personal voice
+
+        self.audio_input_stream = None # Audio input stream for speech recognition
+        self.speech_recognizer = None # Speech recognizer for user speech
+        self.stt_start_time = None # The time the recognition started, shifted by the paused time
+        self.stt_paused_time = None # The time the recognizer was paused (microphone stopped), None if not paused
+        self.stt_canceled = False # Flag to indicate if the recognizer connection was canceled, e.g. closed by the service
+        self.vad_audio_buffer = None # Audio input buffer for VAD, created on the first VAD frame
+        self.vad_iterator = None # VAD state of this client, created on the first VAD frame
+
+        self.speech_synthesizer = None # Speech synthesizer for avatar
+        self.speech_synthesizer_connection = None # Speech synthesizer connection for avatar
+        self.speech_synthesizer_connected = False # Flag to indicate if the speech synthesizer is connected
+        self.speech_synthesizer_disconnected = None # Event set when the speech synthesizer connection is closed
+
+        self.chat_initiated = False # Flag to indicate if the chat context is initiated
+        self.chat_history = None # Chat history (messages), created when the chat context is initialized
+        self.data_sources = [] # Data sources for 'on your data' scenario
+        self.reply_lock = threading.Lock() # Held while replying to a recognized utterance, so the replies don't overlap
+
+        self.is_speaking = False # Flag to indicate if the avatar is speaking
+        self.speaking_text = None # The text that the avatar is speaking
+        self.speaking_in_flight = [] # The (text, ending_silence_ms) submitted to the avatar connection, the first one is speaking
+        self.speaking_futures = [] # The synthesis result futures of speaking_in_flight
+        self.speaking_submit_times = [] # The time.perf_counter() each of speaking_in_flight was submitted
+        self.speaking_condition = threading.Condition() # Guards the speaking state, notified when the speaking stops
+        self.speaking_started_count = 0 # Number of sentences which started to synthesize since the speaking started
+        self.speaking_ended_count = 0 # Number of sentences which finished since the speaking started
+        self.speaking_start_times = collections.deque() # (sentence index, start time) waiting for the end of the previous sentence, see sentence_started()
+        self.speaking_end_times = collections.deque() # (sentence index, end time) waiting for the start of the next sentence, see sentence_ended()
+        self.speaking_result_ids = set() # Result ids of the sentences of speaking_in_flight which started to synthesize
+        self.last_speak_time = None # The last time the avatar spoke
+
+        self.turn_id = 0 # Number of the current turn (user query), sent with its latencies
+        self.turn_start_time = None # The time.perf_counter() the current turn started
+        self.turn_first_audio_submit_time = None # The time the first sentence of the turn was submitted, None once it started
+
+        self.last_activity_time = time.time() # The last time the client sent a request or a socket message, see touch()
+        self.socket_connections = 0 # Number of open WebSocket connections of the client, which keep it active
+        self.released = False
+        self.lock = threading.Lock() # Guards the connection fields in the lifecycle methods
+
+    def __repr__(self) -> str:
+        return f'ClientContext({self.client_id}, scenario {self.scenario_num}, avatar connected: {self.speech_synthesizer_connected}, speaking: {self.is_speaking})'
+
+    def touch(self) -> None:
+        """Record an activity of the client, so it is not released as idle"""
+        self.last_activity_time = time.time()
+
+    def last_active_time(self) -> float:
+        """The last time the client was active: a request, a socket message, or the avatar speaking. Now while its WebSocket is open."""
+        if self.socket_connections > 0:
+            return time.time() # The page is open, a closed tab disconnects (or misses the Socket.IO pings)
+        last_speak_time = self.last_speak_time
+        return max(self.last_activity_time, last_speak_time.timestamp() if last_speak_time else 0)
+
+    def socket_connected(self) -> None:
+        with self.lock:
+            self.socket_connections += 1
+            self.last_activity_time = time.time()
+
+    def socket_disconnected(self) -> None:
+        with self.lock:
+            self.socket_connections = max(self.socket_connections - 1, 0)
+            self.last_activity_time = time.time()
+
+    def start_turn(self) -> int:
+        """Start a new turn (user query), whose first audio is then measured, and return its number"""
+        with self.speaking_condition:
+            self.turn_id += 1
+            self.turn_start_time = time.perf_counter()
+            self.turn_first_audio_submit_time = None
+            return self.turn_id
+
+    def start_speaking(self) -> None:
+        with self.speaking_condition:
+            self.is_speaking = True
+
+    def speaking_stopped(self, keep_speaking_text: bool = False) -> None:
+        """
+        Reset the speaking state. Call with speaking_condition held. With keep_speaking_text, the sentence which was
+        speaking is kept in speaking_text, so it can be repeated after a reconnection.
+        """
+        self.is_speaking = False
+        if not keep_speaking_text:
+            self.speaking_text = None
+        self.speaking_started_count = 0
+        self.speaking_ended_count = 0
+        self.speaking_start_times.clear()
+        self.speaking_end_times.clear()
+        self.speaking_result_ids.clear()
+        self.speaking_in_flight.clear()
+        self.speaking_futures.clear()
+        self.speaking_submit_times.clear()
+        self.turn_start_time = None # The first audio of an interrupted turn is not measured
+        self.turn_first_audio_submit_time = None
+        self.speaking_condition.notify_all()
+
+    def sentence_started(self, now: float) -> float:
+        """
+        Record the start of the synthesis of the next sentence. Call with speaking_condition held. Returns the silence in
+        seconds since the end of the previous sentence, if it already ended, otherwise None (see sentence_ended()).
+        """
+        index = self.speaking_started_count
+        self.speaking_started_count += 1
+        while self.speaking_end_times and self.speaking_end_times[0][0] < index - 1:
+            self.speaking_end_times.popleft() # Ended without a next sentence queued, not measured
+        if self.speaking_end_times and self.speaking_end_times[0][0] == index - 1:
+            return max(now - self.speaking_end_times.popleft()[1], 0)
+        if index > 0:
+            self.speaking_start_times.append((index, now))
+        return None
+
+    def sentence_ended(self, now: float, followed: bool) -> float:
+        """
+        Record the end of the speaking sentence, followed if another sentence is already queued. Call with
+        speaking_condition held. The sentences end in the order they start, so the end of a sentence is paired with
+        the start of the next one: returns 0 if the next sentence already started (no silence), otherwise None.
+        """
+        index = self.speaking_ended_count
+        self.speaking_ended_count += 1
+        while self.speaking_start_times and self.speaking_start_times[0][0] < index + 1:
+            self.speaking_start_times.popleft()
+        if self.speaking_start_times and self.speaking_start_times[0][0] == index + 1:
+            return max(self.speaking_start_times.popleft()[1] - now, 0)
+        if followed:
+            self.speaking_end_times.append((index, now))
+        return None
+
+    def wait_speaking_stopped(self, timeout: float) -> bool:
+        """Wait until the avatar is not speaking. Returns False on timeout."""
+        with self.speaking_condition:
+            return self.speaking_condition.wait_for(lambda: not self.is_speaking, timeout)
+
+    def connect_avatar(self, speech_synthesizer, connection) -> threading.Event:
+        """Attach the avatar connection, and return the event set once it is disconnected"""
+        with self.lock:
+            self.speech_synthesizer = speech_synthesizer
+            self.speech_synthesizer_connection = connection
+            self.speech_synthesizer_connected = True
+            self.speech_synthesizer_disconnected = threading.Event()
+            return self.speech_synthesizer_disconnected
+
+    def avatar_disconnected(self, disconnected: threading.Event) -> None:
+        """Detach the avatar connection, when the connection whose disconnected event is given is closed"""
+        with self.lock:
+            if self.speech_synthesizer_disconnected is disconnected:
+                self.speech_synthesizer_connection = None
+                self.speech_synthesizer_connected = False
+        disconnected.set()
+
+    def connect_stt(self, audio_input_stream, speech_recognizer, start_time) -> None:
+        """Attach a started speech recognizer and its audio stream"""
+        with self.lock:
+            self.audio_input_stream = audio_input_stream
+            self.speech_recognizer = speech_recognizer
+            self.stt_start_time = start_time
+            self.stt_paused_time = None
+            self.stt_canceled = False
+
+    def disconnect_stt(self):
+        """Detach the speech recognizer and its audio stream, and return them (None if not connected) to be closed"""
+        with self.lock:
+            speech_recognizer, audio_input_stream = self.speech_recognizer, self.audio_input_stream
+            self.speech_recognizer = None
+            self.audio_input_stream = None
+            self.stt_paused_time = None
+            return speech_recognizer, audio_input_stream
+
+    def release(self) -> None:
+        """Drop the references to the connections, buffers and chat history, once they are closed"""
+        with self.lock:
+            self.released = True
+            self.speech_synthesizer = None
+            self.speech_synthesizer_connection = None
+            self.speech_synthesizer_connected = False
+            self.speech_recognizer = None
+            self.audio_input_stream = None
+            self.vad_audio_buffer = None
+            self.vad_iterator = None
+            self.chat_history = None
+        with self.speaking_condition:
+            self.speaking_stopped()
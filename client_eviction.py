@@ -0,0 +1,150 @@
+import collections
+import concurrent.futures
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_CONTAINER_TYPES = (dict, list, tuple, set, frozenset, collections.deque)
+
+def approximate_size(obj, deep_modules: tuple = (), _seen: set = None) -> int:
+    """
+    Approximate memory of an object in bytes: sys.getsizeof() of the object, of the items of containers, and of the
+    attributes of objects whose class is defined in one of deep_modules (e.g. the chat history). Other objects, e.g.
+    the speech SDK objects, only count their Python wrapper, not their native memory. Shared objects are counted once.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(key, deep_modules, _seen) + approximate_size(value, deep_modules, _seen) for key, value in list(obj.items()))
+    elif isinstance(obj, _CONTAINER_TYPES):
+        size += sum(approximate_size(item, deep_modules, _seen) for item in list(obj))
+    elif type(obj).__module__ in deep_modules:
+        if hasattr(obj, '__dict__'):
+            size += approximate_size(vars(obj), deep_modules, _seen)
+        for slot in getattr(type(obj), '__slots__', ()):
+            size += approximate_size(getattr(obj, slot, None), deep_modules, _seen)
+    return size
+
+
+class ClientEvictor:
+    def __init__(
+        self,
+        contexts: dict,
+        release,
+        last_active,
+        idle_seconds: float = 30 * 60,
+        interval_seconds: float = 60,
+        release_workers: int = 4,
+        deep_modules: tuple = (),
+    ):
+        """
+        Releases the client contexts which have been idle for too long, in a background thread
+
+        Client contexts are only released when the page calls /api/releaseClient, which doesn't happen when the
+        browser crashes or the page is reloaded, so their synthesizer, recognizer and chat history would be kept
+        forever. Every interval_seconds, the contexts idle for longer than idle_seconds are released with
+        `release(client_id)`, on a small pool of threads, as closing the speech SDK connections can take a while.
+
+        Parameters
+        ----------
+        contexts: dict
+            The client contexts, client id -> ClientContext
+
+        release: callable
+            `release(client_id)`, which closes the resources of the client and removes its context
+
+        last_active: callable
+            `last_active(context) -> float`, the time.time() of the last activity of the client
+
+        idle_seconds: float (default - 30 minutes)
+            Time without activity after which a client is released
+
+        interval_seconds: float (default - 60)
+            Time between two sweeps of the client contexts
+
+        release_workers: int (default - 4)
+            Number of threads releasing clients
+
+        deep_modules: tuple (default - ())
+            Modules of the classes whose attributes are counted by stats(), see approximate_size()
+        """
+
+        self.contexts = contexts
+        self.release = release
+        self.last_active = last_active
+        self.idle_seconds = idle_seconds
+        self.interval_seconds = interval_seconds
+        self.deep_modules = deep_modules
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=release_workers, thread_name_prefix='ClientEvictor-release')
+        self._releasing = set() # Client ids being released
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._failed = 0
+        self._thread = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ClientEvictor')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def sweep(self) -> list:
+        """Submit the release of the idle clients, and return their ids"""
+        now = time.time()
+        idle_client_ids = []
+        for client_id, context in list(self.contexts.items()):
+            try:
+                idle = now - self.last_active(context) > self.idle_seconds
+            except Exception:
+                continue # Context being initialized
+            with self._lock:
+                if idle and client_id not in self._releasing:
+                    self._releasing.add(client_id)
+                    idle_client_ids.append(client_id)
+        for client_id in idle_client_ids:
+            self._executor.submit(self._release, client_id)
+        return idle_client_ids
+
+    def stats(self) -> dict:
+        contexts = list(self.contexts.values())
+        approx_bytes = sum(approximate_size(context, self.deep_modules) for context in contexts)
+        with self._lock:
+            return {
+                'liveContexts': len(contexts),
+                'approxBytes': approx_bytes,
+                'releasing': len(self._releasing),
+                'evicted': self._evicted,
+                'evictionFailures': self._failed,
+            }
+
+    def _release(self, client_id) -> None:
+        try:
+            self.release(client_id)
+            logger.info(f"Released idle client {client_id}")
+            evicted = True
+        except Exception as e:
+            logger.warning(f"Failed to release idle client {client_id}: {e}")
+            self.contexts.pop(client_id, None) # Don't keep a broken context forever
+            evicted = False
+        with self._lock:
+            self._releasing.discard(client_id)
+            if evicted:
+                self._evicted += 1
+            else:
+                self._failed += 1
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Client eviction sweep failed")
@@ -0,0 +1,28 @@
+# Gunicorn configuration of the production server: gunicorn -c gunicorn.conf.py
+#
+# The concurrency mode is chosen with SOCKETIO_ASYNC_MODE, read by app.py for the Socket.IO server as well, so the
+# worker class always matches it:
+#   - threading (default, supported): gthread workers, one thread per request and per WebSocket connection. The speech
+#     SDK callbacks, the speaking workers and the chat engine loop run on native threads, as in development.
+#   - eventlet / gevent: green thread workers, for comparison (see bench/ws_capacity_bench.py). The blocking speech SDK
+#     calls run on the native thread pool of the event loop, see runBlocking() in app.py.
+#
+# The client contexts live in the memory of a worker process, so all the requests and the WebSocket connection of a
+# client must reach the same worker. The workers of one master are not routed by client, so keep one worker here and
+# scale out with several single worker servers (GUNICORN_BIND on separate ports) behind a load balancer routing by the
+# client id, sharing the Socket.IO rooms through SOCKETIO_MESSAGE_QUEUE, see "Scaling out" in README.md.
+import os
+
+async_mode = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+
+wsgi_app = 'app:app'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = { 'threading': 'gthread', 'eventlet': 'eventlet', 'gevent': 'gevent' }[async_mode]
+threads = int(os.environ.get('GUNICORN_THREADS', 200)) # gthread only, each open WebSocket connection holds a thread
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000)) # eventlet / gevent only
+timeout = 120 # Worker heartbeat, a long chat reply or avatar session doesn't block it
+graceful_timeout = 30
+keepalive = 5
+preload_app = False # The app starts its token refresh and client eviction threads at import, in each worker
+accesslog = '-'
@@ -0,0 +1,147 @@
+"""
+Local stand-in for the Redis message queue of the Socket.IO server, to share the rooms between the worker processes
+of a host without a Redis server, e.g. on a development machine or in the benchmarks.
+
+A broker process relays the messages published by each worker to all the workers. The messages are pickled, like
+with the Redis message queue, and every frame received from the broker is passed to pickle.loads() by the workers:
+anyone who can connect to the broker port can run code in every worker. The broker must only listen on an interface
+which no untrusted user or host can reach (the default is 127.0.0.1, on a host without untrusted local users), and
+must never be exposed through a firewall, port forward or container port mapping.
+
+Usage: python message_queue.py [--host 127.0.0.1] [--port 5556], and SOCKETIO_MESSAGE_QUEUE=tcp://127.0.0.1:5556
+"""
+import argparse
+import logging
+import pickle
+import socket
+import socketserver
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct('!I') # Length of the pickled message
+_SUBSCRIBE = b'S' # First byte sent by a listening connection, the publishing connections send _PUBLISH
+_PUBLISH = b'P'
+
+
+def _read_frame(stream) -> bytes:
+    header = stream.read(_FRAME_HEADER.size)
+    if len(header) < _FRAME_HEADER.size:
+        return None
+    return stream.read(_FRAME_HEADER.unpack(header)[0])
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        broker = self.server
+        if self.rfile.read(1) == _SUBSCRIBE:
+            with broker.lock:
+                broker.subscribers[self.wfile] = threading.Lock()
+        try:
+            while True:
+                frame = _read_frame(self.rfile)
+                if frame is None:
+                    break
+                broker.broadcast(_FRAME_HEADER.pack(len(frame)) + frame)
+        finally:
+            with broker.lock:
+                broker.subscribers.pop(self.wfile, None)
+
+
+class Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 5556):
+        """Relays every message received from a connection to all the connections, including the sender"""
+        super().__init__((host, port), _BrokerHandler)
+        self.subscribers = {} # Subscriber connection file -> lock serializing the frames written to it
+        self.lock = threading.Lock()
+
+    def broadcast(self, frame: bytes) -> None:
+        # Called by the handler thread of each publishing connection, so the frames written to a subscriber are
+        # serialized by its lock, otherwise two frames could interleave and corrupt the stream
+        with self.lock:
+            subscribers = list(self.subscribers.items())
+        for wfile, write_lock in subscribers:
+            try:
+                with write_lock:
+                    wfile.write(frame)
+                    wfile.flush()
+            except (OSError, ValueError): # Connection closed
+                with self.lock:
+                    self.subscribers.pop(wfile, None)
+
+
+class TcpPubSubManager(socketio.PubSubManager):
+    name = 'tcp'
+
+    def __init__(self, url: str = 'tcp://127.0.0.1:5556', channel: str = 'socketio', write_only: bool = False, logger=None):
+        """
+        Socket.IO client manager publishing to and listening on a Broker, like socketio.RedisManager on Redis
+
+        Parameters
+        ----------
+        url: str (default - 'tcp://127.0.0.1:5556')
+            Address of the broker
+
+        channel: str (default - 'socketio')
+            Channel of the messages, the servers sharing the rooms use the same channel
+
+        write_only: bool (default - False)
+            Only publish, e.g. from a process which emits without serving Socket.IO clients
+        """
+
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        address = urlparse(url)
+        self.address = (address.hostname or '127.0.0.1', address.port or 5556)
+        self._publish_connection = None
+        self._publish_lock = threading.Lock()
+
+    def _publish(self, data) -> None:
+        payload = pickle.dumps({ 'channel': self.channel, 'data': data })
+        frame = _FRAME_HEADER.pack(len(payload)) + payload
+        with self._publish_lock:
+            for retry in (False, True):
+                try:
+                    if self._publish_connection is None:
+                        self._publish_connection = socket.create_connection(self.address)
+                        self._publish_connection.sendall(_PUBLISH)
+                    self._publish_connection.sendall(frame)
+                    return
+                except OSError:
+                    self._publish_connection = None # Reconnect once, e.g. after a broker restart
+                    if retry:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                with socket.create_connection(self.address) as connection:
+                    connection.sendall(_SUBSCRIBE)
+                    stream = connection.makefile('rb')
+                    while True:
+                        frame = _read_frame(stream)
+                        if frame is None:
+                            break
+                        message = pickle.loads(frame)
+                        if message['channel'] == self.channel:
+                            yield message['data']
+            except OSError as e:
+                logger.warning(f"Message queue broker {self.address} unavailable: {e}")
+            time.sleep(1) # Reconnect
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5556)
+    args = parser.parse_args()
+    broker = Broker(args.host, args.port)
+    print(f'Message queue broker on tcp://{args.host}:{args.port}')
+    broker.serve_forever()
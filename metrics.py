@@ -0,0 +1,74 @@
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS_MS = (25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000) # Upper bounds of the histogram buckets
+
+class LatencyRecorder:
+    def __init__(
+        self,
+        name: str = 'avatar_turn_latency_ms',
+        buckets_ms: tuple = DEFAULT_BUCKETS_MS,
+        on_record=None,
+    ):
+        """
+        Latency histograms of the spans of a voice turn (STT final result, LLM first token, first sentence, TTS first
+        audio, barge-in stop, ...), exported in the Prometheus text format
+
+        Each span has its own histogram, exported as one metric family with a `span` label. The histograms are
+        per process: with several worker processes, each one exports its own, and Prometheus sums them.
+
+        Parameters
+        ----------
+        name: str (default - 'avatar_turn_latency_ms')
+            Name of the metric family
+
+        buckets_ms: tuple (default - DEFAULT_BUCKETS_MS)
+            Upper bounds of the histogram buckets, in milliseconds, in increasing order
+
+        on_record: callable (default - None)
+            `on_record(client_id, turn_id, span, ms)`, called for every recorded latency, e.g. to send it to the browser
+        """
+
+        self.name = name
+        self.buckets_ms = tuple(buckets_ms)
+        self.on_record = on_record
+        self._histograms = {} # Span -> [ bucket counts (the last one is +Inf), sum, count ]
+        self._lock = threading.Lock()
+
+    def record(self, client_id, turn_id: int, span: str, ms: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(span)
+            if histogram is None:
+                histogram = self._histograms[span] = [ [ 0 ] * (len(self.buckets_ms) + 1), 0.0, 0 ]
+            histogram[0][bisect.bisect_left(self.buckets_ms, ms)] += 1
+            histogram[1] += ms
+            histogram[2] += 1
+        if self.on_record:
+            try:
+                self.on_record(client_id, turn_id, span, ms)
+            except Exception as e:
+                logger.warning(f"Failed to report the {span} latency of client {client_id}: {e}")
+
+    def summary(self) -> dict:
+        """Count and average of each span"""
+        with self._lock:
+            return { span: { 'count': count, 'avgMs': round(total / count, 1) if count else 0 } for span, (_, total, count) in self._histograms.items() }
+
+    def render(self) -> str:
+        """The histograms in the Prometheus text exposition format"""
+        lines = [
+            f'# HELP {self.name} Latency of the steps of a voice turn, in milliseconds',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            for span, (bucket_counts, total, count) in sorted(self._histograms.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets_ms + ('+Inf',), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{span="{span}",le="{upper_bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{span="{span}"}} {total:.3f}')
+                lines.append(f'{self.name}_count{{span="{span}"}} {count}')
+        return '\n'.join(lines) + '\n'
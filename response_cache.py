@@ -0,0 +1,101 @@
+import collections
+import hashlib
+import json
+import re
+import threading
+import time
+
+_PUNCTUATION_REGEX = re.compile(r'[^\w\s]')
+_WHITESPACE_REGEX = re.compile(r'\s+')
+
+def normalize_query(query: str) -> str:
+    """Query with the case, punctuation and spacing differences removed, e.g. 'How can I help you?' -> 'how can i help you'"""
+    return _WHITESPACE_REGEX.sub(' ', _PUNCTUATION_REGEX.sub(' ', query.casefold())).strip()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 60 * 60,
+    ):
+        """
+        Cache of chat replies, shared by all the clients of the process
+
+        A reply is keyed by the scenario, a hash of the prompt messages before the user query (system prompt,
+        summary and earlier turns) and the normalized user query, so it is only reused for the same question at
+        the same point of the same conversation, e.g. the opening questions of a scenario. The reply is kept as
+        the list of its tokens, so a hit is replayed through the same path as a streamed reply.
+
+        Entries are evicted when they are older than ttl_seconds, e.g. after the search index was updated, and
+        the least recently used ones once there are more than max_entries.
+
+        Parameters
+        ----------
+        max_entries: int (default - 1000)
+            Maximum number of cached replies
+
+        ttl_seconds: float (default - 3600)
+            Time after which a cached reply is not used any more
+        """
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = collections.OrderedDict() # Key -> (created_time, tokens), least recently used first
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+
+    def key(self, scenario, history_messages: list, query: str) -> tuple:
+        """Cache key of a query, with history_messages the prompt messages before the user message"""
+        history_hash = hashlib.sha256(json.dumps(history_messages, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return (scenario, history_hash, normalize_query(query))
+
+    def get(self, key: tuple) -> list:
+        """The tokens of the cached reply, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] >= self.ttl_seconds:
+                del self._entries[key]
+                self._expired += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, tokens: list) -> None:
+        """Cache the tokens of a complete reply"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), tuple(tokens))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evicted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRate': round(self._hits / lookups, 3) if lookups else 0,
+                'expired': self._expired,
+                'evicted': self._evicted,
+            }
+
+    def render(self, name: str = 'avatar_response_cache') -> str:
+        """The counters in the Prometheus text format"""
+        stats = self.stats()
+        lines = []
+        for counter in ('hits', 'misses', 'expired', 'evicted'):
+            lines.append(f'# TYPE {name}_{counter}_total counter')
+            lines.append(f'{name}_{counter}_total {stats[counter]}')
+        lines.append(f'# TYPE {name}_entries gauge')
+        lines.append(f'{name}_entries {stats["entries"]}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,152 @@
+DEFAULT_PUNCTUATIONS = [ '.', '?', '!', ':', ';', '。', '？', '！', '：', '；' ]
+CJK_PUNCTUATIONS = [ '。', '？', '！', '：', '；', '…' ] # CJK sentence punctuations are not followed by a space
+CLOSING_CHARACTERS = '"\')]}”’」』）】'
+DEFAULT_ABBREVIATIONS = [ 'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'vs', 'e.g', 'i.e', 'a.m', 'p.m', 'approx', 'dept', 'inc', 'ltd', 'mt', 'ft' ]
+NUMBER_ABBREVIATIONS = [ 'no', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec' ] # Also words ending sentences ('No.'), only abbreviations before a number, e.g. 'No. 5', 'Mar. 3'
+NAME_ABBREVIATIONS = [ 'st' ] # Only abbreviations before a capitalized word, e.g. 'St. Mary'
+UNDECIDED = -1 # The boundary depends on text which has not arrived yet
+
+class SentenceSegmenter:
+    def __init__(
+        self,
+        punctuations: list = DEFAULT_PUNCTUATIONS,
+        abbreviations: list = DEFAULT_ABBREVIATIONS,
+        number_abbreviations: list = NUMBER_ABBREVIATIONS,
+        name_abbreviations: list = NAME_ABBREVIATIONS,
+        max_chars: int = 0,
+    ):
+        """
+        Incremental sentence segmenter for streamed LLM output
+
+        Tokens are appended to a rolling text buffer, which is scanned from where the previous scan stopped.
+        A sentence ends at a newline, at a CJK sentence punctuation, or at a sentence punctuation followed by
+        a space. A punctuation at the end of the buffer ends the sentence right away when it can't be anything
+        else, so the first sentence is sent to TTS as soon as its last token arrives. It is only held back
+        until the next token when it may still be a number (e.g. '3.5', '10:30').
+        Abbreviations (e.g. 'Mr.', 'e.g.') and initials (e.g. 'J. K.') don't end a sentence. Words which are
+        also common at the end of a sentence ('No.', 'Mar.') are only abbreviations before a number or a name.
+
+        Parameters
+        ----------
+        punctuations: list
+            Punctuations that indicate the end of a sentence
+
+        abbreviations: list
+            Lower case words which are followed by a dot without ending the sentence
+
+        number_abbreviations: list
+            Lower case words which are followed by a dot without ending the sentence when a number follows
+
+        name_abbreviations: list
+            Lower case words which are followed by a dot without ending the sentence when a capitalized word follows
+
+        max_chars: int (default - 0)
+            If greater than 0, a sentence longer than max_chars is flushed at the last word boundary
+        """
+
+        self.punctuations = set(punctuations)
+        self.abbreviations = set(abbreviations)
+        self.number_abbreviations = set(number_abbreviations)
+        self.name_abbreviations = set(name_abbreviations)
+        self.max_chars = max_chars
+        self._buffer = ''
+        self._scan_pos = 0
+
+    def feed(self, text: str) -> list:
+        """Append streamed text, and return the sentences completed by it"""
+        sentences = []
+        buffer = self._buffer + text
+        i = self._scan_pos
+        while i < len(buffer):
+            c = buffer[i]
+            end = None
+            if c == '\n':
+                end = i + 1
+            elif c in self.punctuations:
+                end = self._sentence_end(buffer, i)
+                if end == UNDECIDED:
+                    break
+            if end is None:
+                i += 1
+                continue
+            self._append_sentence(sentences, buffer[:end])
+            buffer = buffer[end:]
+            i = 0
+
+        while self.max_chars > 0 and len(buffer) > self.max_chars:
+            cut = self._word_boundary(buffer)
+            self._append_sentence(sentences, buffer[:cut])
+            buffer = buffer[cut:]
+            i = max(i - cut, 0)
+
+        self._buffer = buffer
+        self._scan_pos = i
+        return sentences
+
+    def flush(self) -> list:
+        """Return the rest of the buffer as the last sentence, at the end of the stream"""
+        sentences = []
+        self._append_sentence(sentences, self._buffer)
+        self._buffer = ''
+        self._scan_pos = 0
+        return sentences
+
+    def _sentence_end(self, buffer: str, i: int) -> int:
+        # Return the end index (exclusive) of the sentence ending with the punctuation at i,
+        # None if the punctuation doesn't end a sentence, or UNDECIDED if more text is needed
+        c = buffer[i]
+        end = i + 1
+        while end < len(buffer) and buffer[end] in CLOSING_CHARACTERS:
+            end += 1
+        if c in CJK_PUNCTUATIONS:
+            return end
+
+        at_end = end == len(buffer)
+        if c in '.:':
+            if end < len(buffer) and buffer[end] == c:
+                return None # Ellipsis, the sentence ends at the last dot
+            if i > 0 and buffer[i - 1].isdigit():
+                if at_end:
+                    return UNDECIDED # Could be a decimal number or a time
+                if buffer[end].isdigit():
+                    return None
+                if c == '.' and buffer[:i].strip().isdigit():
+                    return None # Numbered list item, e.g. '1. Check in'
+            if c == '.':
+                abbreviation = self._is_abbreviation(buffer, i, end)
+                if abbreviation == UNDECIDED:
+                    return UNDECIDED
+                if abbreviation:
+                    return None
+            if not at_end and not buffer[end].isspace():
+                return None # e.g. 'example.com', 'http://'
+        return end
+
+    def _is_abbreviation(self, buffer: str, i: int, end: int):
+        # True if the dot at i ends an abbreviation, or UNDECIDED if it depends on the next word
+        start = i
+        while start > 0 and (buffer[start - 1].isalpha() or buffer[start - 1] == '.'):
+            start -= 1
+        word = buffer[start:i].lower()
+        if len(word.replace('.', '')) == 1 or word in self.abbreviations:
+            return True
+        if word in self.number_abbreviations or word in self.name_abbreviations:
+            next_word = buffer[end:].lstrip(' ')
+            if not next_word:
+                return UNDECIDED
+            return next_word[0].isdigit() if word in self.number_abbreviations else next_word[0].isupper()
+        return False
+
+    def _word_boundary(self, buffer: str) -> int:
+        # Prefer to cut after a comma, then at a space, within the first max_chars characters
+        for separators in (',，、', ' '):
+            cut = max(buffer.rfind(separator, 0, self.max_chars) for separator in separators)
+            if cut > 0:
+                return cut + 1
+        return self.max_chars
+
+    def _append_sentence(self, sentences: list, text: str) -> None:
+        # Drop the closing characters and punctuations left over from the previous sentence
+        sentence = text.strip().lstrip(CLOSING_CHARACTERS + ''.join(self.punctuations)).strip()
+        if any(c.isalnum() for c in sentence):
+            sentences.append(sentence)
@@ -0,0 +1,91 @@
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class SessionStore:
+    def __init__(
+        self,
+        path: str = None,
+        max_idle_seconds: float = 12 * 60 * 60,
+    ):
+        """
+        Server side session data, keyed by a short random session id, which is the only value kept in the cookie
+
+        The data of a browser session (e.g. the trainee details and the scenario) is kept here, so it is not
+        sent in the headers of every request and re-signed on every response. Sessions idle for longer than
+        max_idle_seconds are removed by `expire()`, except the ones still in use by a client.
+
+        Parameters
+        ----------
+        path: str (default - None)
+            SQLite file of the sessions, shared by the worker processes of a host. If None, the sessions are
+            kept in the memory of the process, which is enough with a single worker.
+
+        max_idle_seconds: float (default - 12 hours)
+            Time after the last access after which a session not in use is removed
+        """
+
+        self.path = path
+        self.max_idle_seconds = max_idle_seconds
+        self._sessions = {} # Session id -> [ data, last access time ], in memory
+        self._lock = threading.Lock()
+        self._local = threading.local() # SQLite connection per thread
+        if path:
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, accessed REAL NOT NULL)')
+
+    def create(self, data: dict) -> str:
+        """Store the data of a new session, and return its session id"""
+        sid = secrets.token_urlsafe(12)
+        now = time.time()
+        if self.path:
+            with self._connect() as conn:
+                conn.execute('INSERT INTO sessions (sid, data, accessed) VALUES (?, ?, ?)', (sid, json.dumps(data), now))
+        else:
+            with self._lock:
+                self._sessions[sid] = [ dict(data), now ]
+        return sid
+
+    def get(self, sid: str) -> dict:
+        """Return a copy of the data of a session, or None if it doesn't exist (e.g. expired)"""
+        now = time.time()
+        if self.path:
+            with self._connect() as conn:
+                row = conn.execute('SELECT data FROM sessions WHERE sid = ?', (sid,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute('UPDATE sessions SET accessed = ? WHERE sid = ?', (now, sid))
+                return json.loads(row[0])
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            entry[1] = now
+            return dict(entry[0])
+
+    def expire(self, in_use: set = ()) -> int:
+        """Remove the sessions idle for longer than max_idle_seconds, except the session ids in in_use. Returns the number removed."""
+        cutoff = time.time() - self.max_idle_seconds
+        if self.path:
+            with self._connect() as conn:
+                expired = [ sid for (sid,) in conn.execute('SELECT sid FROM sessions WHERE accessed < ?', (cutoff,)) if sid not in in_use ]
+                conn.executemany('DELETE FROM sessions WHERE sid = ?', [ (sid,) for sid in expired ])
+                return len(expired)
+        with self._lock:
+            expired = [ sid for sid, (_, accessed) in self._sessions.items() if accessed < cutoff and sid not in in_use ]
+            for sid in expired:
+                del self._sessions[sid]
+            return len(expired)
+
+    def _connect(self) -> sqlite3.Connection:
+        # The connection is used as a context manager, which commits (or rolls back) a transaction
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
@@ -0,0 +1,194 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class _ClientQueue:
+    __slots__ = ('items', 'enqueue_times', 'state', 'rescheduled', 'wait_count', 'wait_total', 'wait_max')
+
+    def __init__(self):
+        self.items = collections.deque()
+        self.enqueue_times = collections.deque()
+        self.state = SpeechScheduler.IDLE
+        self.rescheduled = False # Scheduled again while active
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class SpeechScheduler:
+    IDLE = 0 # No work, not in the ready queue
+    READY = 1 # In the ready queue, waiting for a worker
+    ACTIVE = 2 # Served by a worker
+
+    def __init__(self, process, num_workers: int = 16):
+        """
+        Shared speaking workers for all clients
+
+        Each client owns a deque of items (sentences) to speak. Clients with work wait in a ready queue, and
+        a fixed pool of workers serves them round robin: a worker takes the client at the head of the ready
+        queue, runs one `process(key)` step, and puts the client back at the tail if it has more work. A client
+        is served by at most one worker at a time, so its items are spoken in order, and a long reply can't
+        starve the other clients. A step only submits work and must not wait for it (e.g. for the audio of a
+        sentence), so a few workers serve many speaking clients; whatever completes the work schedules the client
+        again with `enqueue(key)`.
+
+        Parameters
+        ----------
+        process: callable
+            `process(key) -> bool`, one speaking step of a client, which takes its items with `popleft(key)`.
+            Returns True to run another step right away, False when the client waits for its next `enqueue()`.
+
+        num_workers: int (default - 16)
+            Number of worker threads, i.e. the number of client steps run at the same time
+        """
+
+        self.process = process
+        self._clients = {} # Client key -> _ClientQueue
+        self._ready = collections.deque() # Keys of the clients waiting for a worker
+        self._condition = threading.Condition()
+        self._workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._run, name=f'SpeechScheduler-{i}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def enqueue(self, key, item=None) -> None:
+        """Append an item to the queue of a client, and schedule the client. With no item, only schedule the client."""
+        with self._condition:
+            client_queue = self._client_queue(key)
+            if item is not None:
+                client_queue.items.append(item)
+                client_queue.enqueue_times.append(time.perf_counter())
+            self._schedule(key, client_queue)
+
+    def enqueue_front(self, key, items: list) -> None:
+        """Put items back at the front of the queue of a client, in order, e.g. to repeat them after reconnection"""
+        with self._condition:
+            client_queue = self._client_queue(key)
+            now = time.perf_counter()
+            client_queue.items.extendleft(reversed(items))
+            client_queue.enqueue_times.extendleft([ now ] * len(items))
+
+    def popleft(self, key) -> tuple:
+        """
+        Take the next item of a client, and return (item, seconds it waited in the queue), or (None, 0) if its queue is
+        empty. The wait is returned rather than reported from here, so the caller can report it once it released its locks.
+        """
+        with self._condition:
+            client_queue = self._clients.get(key)
+            if client_queue is None or len(client_queue.items) == 0:
+                return None, 0.0
+            wait = time.perf_counter() - client_queue.enqueue_times.popleft()
+            client_queue.wait_count += 1
+            client_queue.wait_total += wait
+            client_queue.wait_max = max(client_queue.wait_max, wait)
+            self._condition.notify_all() # Wake up wait_depth()
+            return client_queue.items.popleft(), wait
+
+    def clear(self, key) -> list:
+        """Drop the queued items of a client, and return them"""
+        with self._condition:
+            client_queue = self._clients.get(key)
+            if client_queue is None:
+                return []
+            items = list(client_queue.items)
+            client_queue.items.clear()
+            client_queue.enqueue_times.clear()
+            self._condition.notify_all()
+            return items
+
+    def remove(self, key) -> None:
+        """Forget a client, e.g. when the client is released. A step in progress finishes, but is not rescheduled."""
+        with self._condition:
+            self._clients.pop(key, None)
+            if key in self._ready:
+                self._ready.remove(key)
+            self._condition.notify_all()
+
+    def depth(self, key) -> int:
+        with self._condition:
+            return self._depth(key)
+
+    def stats(self, key) -> dict:
+        """Queue depth of a client, and how long its items waited in the queue before being taken"""
+        with self._condition:
+            client_queue = self._clients.get(key)
+            if client_queue is None:
+                return { 'queueDepth': 0, 'waitCount': 0, 'waitAvgMs': 0, 'waitMaxMs': 0 }
+            return {
+                'queueDepth': len(client_queue.items),
+                'waitCount': client_queue.wait_count,
+                'waitAvgMs': round(client_queue.wait_total / client_queue.wait_count * 1000) if client_queue.wait_count else 0,
+                'waitMaxMs': round(client_queue.wait_max * 1000),
+            }
+
+    def wait_idle(self, key, timeout: float) -> bool:
+        """Wait until a client has no step in progress or scheduled. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._is_idle(key), timeout)
+
+    def wait_depth(self, key, max_depth: int, timeout: float) -> bool:
+        """Wait until a client has at most max_depth queued items, e.g. to hold back a producer. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._depth(key) <= max_depth, timeout)
+
+    def ready_clients(self) -> int:
+        """Number of clients with work waiting for a free worker"""
+        with self._condition:
+            return len(self._ready)
+
+    def _client_queue(self, key) -> _ClientQueue:
+        client_queue = self._clients.get(key)
+        if client_queue is None:
+            client_queue = self._clients[key] = _ClientQueue()
+        return client_queue
+
+    def _depth(self, key) -> int:
+        client_queue = self._clients.get(key)
+        return len(client_queue.items) if client_queue else 0
+
+    def _is_idle(self, key) -> bool:
+        client_queue = self._clients.get(key)
+        return client_queue is None or client_queue.state == SpeechScheduler.IDLE
+
+    def _schedule(self, key, client_queue: _ClientQueue) -> None:
+        if client_queue.state == SpeechScheduler.IDLE:
+            client_queue.state = SpeechScheduler.READY
+            self._ready.append(key)
+            self._condition.notify()
+        elif client_queue.state == SpeechScheduler.ACTIVE:
+            client_queue.rescheduled = True # Rescheduled by its worker, once the step in progress is done
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._ready) == 0:
+                    self._condition.wait()
+                key = self._ready.popleft()
+                client_queue = self._clients.get(key)
+                if client_queue is None:
+                    continue
+                client_queue.state = SpeechScheduler.ACTIVE
+                client_queue.rescheduled = False
+
+            try:
+                has_more_work = self.process(key)
+            except Exception:
+                logger.exception(f"Speaking failed for {key}")
+                has_more_work = False
+
+            with self._condition:
+                if self._clients.get(key) is not client_queue:
+                    self._condition.notify_all()
+                    continue # Removed while speaking
+                if has_more_work or client_queue.rescheduled:
+                    client_queue.state = SpeechScheduler.READY
+                    self._ready.append(key)
+                    self._condition.notify()
+                else:
+                    client_queue.state = SpeechScheduler.IDLE
+                    self._condition.notify_all() # Wake up wait_idle()
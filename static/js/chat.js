@@ -4,6 +4,7 @@
 // Global objects
 var clientId
 var enableWebSockets
+var enableBinaryAudio
 var socket
 var audioContext
 var isFirstResponseChunk
@@ -21,9 +22,16 @@ var chatResponseReceivedTime
 var lastInteractionTime = new Date()
 var lastSpeakTime
 var isFirstRecognizingEvent = true
-var sttLatencyRegex = new RegExp(/<STTL>(\d+)<\/STTL>/)
-var firstTokenLatencyRegex = new RegExp(/<FTL>(\d+)<\/FTL>/)
-var firstSentenceLatencyRegex = new RegExp(/<FSL>(\d+)<\/FSL>/)
+var latencyLogLabels = { stt_final: 'STT latency', llm_first_sentence: 'AOAI latency' } // Server latency spans shown in the latency log
+
+// The server released this client (e.g. after being idle for long), reload the page to start a new client
+function checkClientReleased(response) {
+    if (response.status === 410) {
+        console.log(`[${(new Date()).toISOString()}] The client was released by the server, reloading the page.`)
+        window.location.reload()
+    }
+    return response
+}
 
 // Connect to avatar service
 function connectAvatar() {
@@ -93,6 +101,7 @@ function disconnectAvatar(closeSpeechRecognizer = false) {
         },
         body: ''
     })
+    .then(checkClientReleased)
 
     if (speechRecognizer !== undefined) {
         speechRecognizer.stopContinuousRecognitionAsync()
@@ -110,36 +119,19 @@ function setupWebSocket() {
         console.log('WebSocket connected.')
     })
 
+    socket.on('connect_error', function(error) {
+        if (error.message === 'released') {
+            console.log(`[${(new Date()).toISOString()}] The client was released by the server, reloading the page.`)
+            window.location.reload()
+        }
+    })
+
     socket.on('response', function(data) {
         let path = data.path
         if (path === 'api.chat') {
             lastInteractionTime = new Date()
             let chatHistoryTextArea = document.getElementById('chatHistory')
             let chunkString = data.chatResponse
-            if (sttLatencyRegex.test(chunkString)) {
-                let sttLatency = parseInt(sttLatencyRegex.exec(chunkString)[0].replace('<STTL>', '').replace('</STTL>', ''))
-                console.log(`STT latency: ${sttLatency} ms`)
-                let latencyLogTextArea = document.getElementById('latencyLog')
-                latencyLogTextArea.innerHTML += `STT latency: ${sttLatency} ms\n`
-                chunkString = chunkString.replace(sttLatencyRegex, '')
-            }
-
-            if (firstTokenLatencyRegex.test(chunkString)) {
-                let aoaiFirstTokenLatency = parseInt(firstTokenLatencyRegex.exec(chunkString)[0].replace('<FTL>', '').replace('</FTL>', ''))
-                // console.log(`AOAI first token latency: ${aoaiFirstTokenLatency} ms`)
-                chunkString = chunkString.replace(firstTokenLatencyRegex, '')
-            }
-
-            if (firstSentenceLatencyRegex.test(chunkString)) {
-                let aoaiFirstSentenceLatency = parseInt(firstSentenceLatencyRegex.exec(chunkString)[0].replace('<FSL>', '').replace('</FSL>', ''))
-                chatResponseReceivedTime = new Date()
-                console.log(`AOAI latency: ${aoaiFirstSentenceLatency} ms`)
-                let latencyLogTextArea = document.getElementById('latencyLog')
-                latencyLogTextArea.innerHTML += `AOAI latency: ${aoaiFirstSentenceLatency} ms\n`
-                latencyLogTextArea.scrollTop = latencyLogTextArea.scrollHeight
-                chunkString = chunkString.replace(firstSentenceLatencyRegex, '')
-            }
-
             chatHistoryTextArea.innerHTML += `${chunkString}`
             if (chatHistoryTextArea.innerHTML.startsWith('\n\n')) {
                 chatHistoryTextArea.innerHTML = chatHistoryTextArea.innerHTML.substring(2)
@@ -163,6 +155,21 @@ function setupWebSocket() {
             }
         }
     })
+
+    // Latency of a step of the voice turn, measured by the server (see /metrics)
+    socket.on('latency', function(data) {
+        console.log(`[turn ${data.turnId}] ${data.span} latency: ${data.ms} ms`)
+        if (data.span === 'llm_first_sentence') {
+            chatResponseReceivedTime = new Date() // Start of the TTS latency, measured until the avatar starts speaking
+        }
+
+        let label = latencyLogLabels[data.span]
+        if (label !== undefined) {
+            let latencyLogTextArea = document.getElementById('latencyLog')
+            latencyLogTextArea.innerHTML += `${label}: ${data.ms} ms\n`
+            latencyLogTextArea.scrollTop = latencyLogTextArea.scrollHeight
+        }
+    })
 }
 
 // Setup WebRTC
@@ -217,6 +224,7 @@ function setupWebRTC(iceServerUrl, iceServerUsername, iceServerCredential) {
                     },
                     body: ''
                 })
+                .then(checkClientReleased)
             }
 
             videoElement.onplaying = () => {
@@ -375,6 +383,7 @@ function connectToAvatarService(peerConnection) {
         headers: headers,
         body: localSdp
     })
+    .then(checkClientReleased)
     .then(response => {
         if (response.ok) {
             response.text().then(text => {
@@ -409,6 +418,7 @@ function handleUserQuery(userQuery) {
         },
         body: userQuery
     })
+    .then(checkClientReleased)
     .then(response => {
         if (!response.ok) {
             throw new Error(`Chat API response status: ${response.status} ${response.statusText}`)
@@ -431,30 +441,15 @@ function handleUserQuery(userQuery) {
                 // Process the chunk of data (value)
                 let chunkString = new TextDecoder().decode(value, { stream: true })
 
-                if (firstTokenLatencyRegex.test(chunkString)) {
-                    let aoaiFirstTokenLatency = parseInt(firstTokenLatencyRegex.exec(chunkString)[0].replace('<FTL>', '').replace('</FTL>', ''))
-                    // console.log(`AOAI first token latency: ${aoaiFirstTokenLatency} ms`)
-                    chunkString = chunkString.replace(firstTokenLatencyRegex, '')
-                    if (chunkString === '') {
-                        return read()
-                    }
-                }
-
-                if (firstSentenceLatencyRegex.test(chunkString)) {
-                    let aoaiFirstSentenceLatency = parseInt(firstSentenceLatencyRegex.exec(chunkString)[0].replace('<FSL>', '').replace('</FSL>', ''))
+                if (chatRequestSentTime !== undefined) {
+                    // Without WebSockets there is no latency event, the server spans are only on /metrics
                     chatResponseReceivedTime = new Date()
                     let chatLatency = chatResponseReceivedTime - chatRequestSentTime
-                    let appServiceLatency = chatLatency - aoaiFirstSentenceLatency
-                    console.log(`App service latency: ${appServiceLatency} ms`)
-                    console.log(`AOAI latency: ${aoaiFirstSentenceLatency} ms`)
+                    console.log(`Chat latency: ${chatLatency} ms`)
                     let latencyLogTextArea = document.getElementById('latencyLog')
-                    latencyLogTextArea.innerHTML += `App service latency: ${appServiceLatency} ms\n`
-                    latencyLogTextArea.innerHTML += `AOAI latency: ${aoaiFirstSentenceLatency} ms\n`
+                    latencyLogTextArea.innerHTML += `Chat latency: ${chatLatency} ms\n`
                     latencyLogTextArea.scrollTop = latencyLogTextArea.scrollHeight
-                    chunkString = chunkString.replace(firstSentenceLatencyRegex, '')
-                    if (chunkString === '') {
-                        return read()
-                    }
+                    chatRequestSentTime = undefined
                 }
 
                 chatHistoryTextArea.innerHTML += `${chunkString}`
@@ -497,6 +492,7 @@ function checkServerStatus() {
             'ClientId': clientId
         }
     })
+    .then(checkClientReleased)
     .then(response => {
         if (response.ok) {
             response.text().then(text => {
@@ -566,6 +562,7 @@ function checkHung() {
 window.onload = () => {
     clientId = document.getElementById('clientId').value
     enableWebSockets = document.getElementById('enableWebSockets').value === 'True'
+    enableBinaryAudio = document.getElementById('enableBinaryAudio').value === 'True'
 
     if (!enableWebSockets) {
         setInterval(() => {
@@ -619,6 +616,7 @@ window.stopSpeaking = () => {
         },
         body: ''
     })
+    .then(checkClientReleased)
     .then(response => {
         if (response.ok) {
             console.log('Successfully stopped speaking.')
@@ -657,6 +655,7 @@ window.clearChatHistory = () => {
         },
         body: ''
     })
+    .then(checkClientReleased)
     .then(response => {
         if (response.ok) {
             document.getElementById('chatHistory').innerHTML = ''
@@ -680,6 +679,7 @@ window.microphone = () => {
                 },
                 body: ''
             })
+            .then(checkClientReleased)
             .then(() => {
                 document.getElementById('microphone').innerHTML = 'Start Microphone'
                 document.getElementById('microphone').disabled = false
@@ -736,6 +736,7 @@ window.microphone = () => {
             },
             body: ''
         })
+        .then(checkClientReleased)
         .then(response => {
             document.getElementById('microphone').disabled = false
             if (response.ok) {
@@ -762,6 +763,12 @@ window.microphone = () => {
                                 for (let i = 0; i < audioDataFloat32.length; i++) {
                                     audioDataInt16[i] = Math.max(-0x8000, Math.min(0x7FFF, audioDataFloat32[i] * 0x7FFF))
                                 }
+                                if (enableBinaryAudio) {
+                                    // Send the PCM bytes as a binary frame, no base64 encoding needed
+                                    socket.emit('audio', clientId, audioDataInt16.buffer)
+                                    return
+                                }
+
                                 const audioDataBytes = new Uint8Array(audioDataInt16.buffer)
                                 const audioDataBase64 = btoa(String.fromCharCode(...audioDataBytes))
                                 socket.emit('message', { clientId: clientId, path: 'api.audio', audioChunk: audioDataBase64 })
@@ -908,5 +915,5 @@ window.updateLocalVideoForIdle = () => {
 }
 
 window.onbeforeunload = () => {
-    navigator.sendBeacon('/api/releaseClient', JSON.stringify({ clientId: clientId }))
+    navigator.sendBeacon(`/api/releaseClient?clientId=${clientId}`, JSON.stringify({ clientId: clientId })) // In the URL too, for the load balancer routing
 }
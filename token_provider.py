@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class TokenProvider:
+    def __init__(
+        self,
+        name: str,
+        fetch,
+        refresh_ratio: float = 0.9,
+        min_backoff_seconds: float = 1,
+        max_backoff_seconds: float = 60,
+        cache_path: str = None,
+    ):
+        """
+        Holds a token (e.g. the speech token or the ICE token), and refreshes it in a background thread
+
+        The token is refreshed proactively once refresh_ratio of its lifetime has passed, so it is renewed
+        before it expires. A failed refresh is retried with exponential backoff and full jitter, and doesn't
+        stop the refresh thread. Readers block on `get()` (or await `get_async()`) until a valid token is
+        available, instead of polling.
+
+        Parameters
+        ----------
+        name: str
+            Name of the token, for logging
+
+        fetch: callable
+            `fetch() -> (token, lifetime_seconds)`, which requests a new token, and raises on failure
+
+        refresh_ratio: float (default - 0.9)
+            Fraction of the token lifetime after which the token is refreshed
+
+        min_backoff_seconds, max_backoff_seconds: float (default - 1, 60)
+            Range of the retry delay after a failed refresh
+
+        cache_path: str (default - None)
+            File caching the token for all the processes of the host (POSIX only), e.g. the gunicorn workers.
+            The processes take turns on an flock of `cache_path + '.lock'`, and only the first one which finds
+            the cached token due for refresh fetches it, the others read it from the file. The directory must
+            only be writable by the current user, the files are not opened through symbolic links. If None,
+            every process fetches its own token.
+        """
+
+        self.name = name
+        self.fetch = fetch
+        self.refresh_ratio = refresh_ratio
+        self.min_backoff_seconds = min_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.cache_path = cache_path
+        self._token = None
+        self._expires_at = 0.0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self) -> None:
+        """Start the refresh thread, which fetches the first token right away"""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'TokenProvider-{self.name}')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def get(self, timeout: float = None) -> str:
+        """Return the token, waiting up to timeout seconds for it to be fetched. Raises TimeoutError."""
+        with self._condition:
+            if not self._condition.wait_for(self._is_valid, timeout):
+                raise TimeoutError(f"{self.name} is not available after {timeout}s")
+            return self._token
+
+    async def get_async(self, timeout: float = None) -> str:
+        """Awaitable get(), which doesn't block the event loop while waiting"""
+        with self._condition:
+            if self._is_valid():
+                return self._token
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, timeout)
+
+    def set(self, token: str, lifetime_seconds: float) -> None:
+        """Set the token, e.g. a token fetched by another process"""
+        with self._condition:
+            self._token = token
+            self._expires_at = time.monotonic() + lifetime_seconds
+            self._condition.notify_all()
+
+    def _is_valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at
+
+    def _fetch_cached(self) -> dict:
+        # Blocks until the process refreshing the token (if any) is done, so the token is fetched once per host
+        import fcntl
+        lock_fd = os.open(self.cache_path + '.lock', os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                with open(os.open(self.cache_path, os.O_RDONLY | os.O_NOFOLLOW), encoding='utf-8') as f:
+                    entry = json.load(f)
+                if time.time() < entry['refresh_at']:
+                    return entry
+            except (OSError, ValueError, KeyError):
+                pass # No cached token yet, or a corrupt cache file
+            entry = self._fetch_entry()
+            # A new file (O_EXCL, mode 0600), renamed over the cache file, so no existing file or link is written through
+            temp_fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.cache_path) + '.', suffix='.tmp', dir=os.path.dirname(self.cache_path))
+            try:
+                with open(temp_fd, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f)
+                os.replace(temp_path, self.cache_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            return entry
+        finally:
+            os.close(lock_fd) # Releases the lock
+
+    def _fetch_entry(self) -> dict:
+        token, lifetime_seconds = self.fetch()
+        now = time.time()
+        return { 'token': token, 'expires_at': now + lifetime_seconds, 'refresh_at': now + lifetime_seconds * self.refresh_ratio }
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                entry = self._fetch_cached() if self.cache_path else self._fetch_entry()
+                now = time.time()
+                self.set(entry['token'], entry['expires_at'] - now)
+                failures = 0
+                delay = max(entry['refresh_at'] - now, 0)
+            except Exception as e:
+                failures += 1
+                delay = random.uniform(self.min_backoff_seconds, min(self.max_backoff_seconds, self.min_backoff_seconds * 2 ** failures))
+                logger.warning(f"Failed to refresh the {self.name} (attempt {failures}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
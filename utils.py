@@ -1,12 +1,12 @@
 import os
 import datetime
+import functools
+import json
 import pytz
-import pyodbc
 import logging
+import threading
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
-# Use DefaultAzureCredential for non-interactive authentication
-from azure.identity import DefaultAzureCredential
+# pyodbc and azure.storage.blob are imported on first use, to keep them out of the worker startup
 logger = logging.getLogger(__name__)
 if not logger.hasHandlers():
     logging.basicConfig(
@@ -83,73 +83,73 @@ def load_env_variables():
     }
 
 
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios.json') # Scenario profiles, see load_scenarios()
+SAS_LIFETIME = datetime.timedelta(hours=1) # Validity of the background image SAS URLs
+SAS_REFRESH_BEFORE_EXPIRY = datetime.timedelta(minutes=10) # A cached SAS URL is replaced this long before it expires, so a page never gets an URL about to expire
+
+_sas_url_cache = {} # (account name, container name, blob name) -> (blob URL with SAS, refresh time)
+_sas_url_cache_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def load_scenarios(path: str = SCENARIOS_PATH) -> dict:
+    """
+    Load the scenario profiles from the JSON file once per process, and build their system prompts.
+    Returns scenario_num -> profile dict (avatar_name, avatar_character, avatar_style, tts_voice, background_blob, system_prompt).
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    scenarios = {}
+    for scenario_num, profile in data['scenarios'].items():
+        profile = dict(profile)
+        profile['system_prompt'] = data['system_prompt_template'].format(**profile)
+        scenarios[int(scenario_num)] = profile
+    logger.info(f"Loaded {len(scenarios)} scenario profiles from {path}")
+    return scenarios
+
+
+@functools.lru_cache(maxsize=None)
 def load_scenario_profile(scenario_num: int, cognitive_search_index_base_name: str):
-    if scenario_num == 1:
-        avatar_name = "Julia Tanner"
-        avatar_character = "meg"
-        avatar_style = "formal"
-        tts_voice = "en-US-EmmaMultilingualNeural"
-    elif scenario_num == 2:
-        avatar_name = "Diego Vargas"
-        avatar_character = "jeff"
-        avatar_style = "business"
-        tts_voice = "en-US-ChristopherMultilingualNeural"
-    elif scenario_num == 3:
-        avatar_name = "Alex Morton"
-        avatar_character = "max"
-        avatar_style = "casual"
-        tts_voice = "en-US-ChristopherMultilingualNeural"
-    elif scenario_num == 4:
-        avatar_name = "Clara Evans"
-        avatar_character = "lori"
-        avatar_style = "casual"
-        tts_voice = "en-US-AvaMultilingualNeural"
-    elif scenario_num == 5:
-        avatar_name = "Daniel Cho"
-        avatar_character = "jeff"
-        avatar_style = "formal"
-        tts_voice = "en-US-ChristopherMultilingualNeural"
-
-    # system_prompt = ("You are role-playing as a hotel guest in a simulated hospitality scenario. "
-    #                 "Always respond **in the voice of the guest**, based on the given background, situation, emotional state, and needs. "
-    #                 "You are **not** a hotel staff or assistant. React naturally — greet, ask questions, or raise concerns **as the guest would**. "
-    #                 "Stay in character. Do not provide explanations or step out of your role. "
-    #                 "If the retrieved context or information cannot be found, responsd with 'I don't understand'. Could you please repeat? "
-    #                 "Each of the individual point under 'Response Strategy for LLM' in the retrieved context or information should be used asked by the LLM at least once. ")
-    
-    system_prompt = (f"You are role-playing as a hotel guest ({avatar_name}) in a simulated hospitality training scenario. "
-                    "Your responses must always be **in character as the guest**, reflecting their background, situation, emotional state, and specific needs. "
-                    "You are **not** an assistant, hotel staff, or narrator. Do not provide explanations or commentary about your role. "
-                    "Stay in character and speak naturally — greet, ask questions, express emotions, or raise concerns **as the guest would**. "
-                    "If the information you need is missing or unclear — do **not** say that it cannot be found. "
-                    "Instead, always respond with: 'I don't understand. Could you please repeat?' "
-                    "Throughout the interaction, you must incorporate each item from the 'Response Strategy for LLM' at least once in a realistic and context-appropriate way. "
-                    "Remain polite but show urgency and exhaustion, as appropriate for your emotional state. "
-                    "Avoid generic or overly formal replies. Prioritize human-like, emotional, and situationally aware responses.")
-    
-    cognitive_search_index_name =f"{cognitive_search_index_base_name}-{scenario_num}"
-    return avatar_name, avatar_character, avatar_style, tts_voice, cognitive_search_index_name, system_prompt
+    scenarios = load_scenarios()
+    if scenario_num not in scenarios:
+        raise ValueError(f"Unknown scenario {scenario_num}, the scenarios are {sorted(scenarios)}")
+    profile = scenarios[scenario_num]
+    cognitive_search_index_name = f"{cognitive_search_index_base_name}-{scenario_num}"
+    return profile['avatar_name'], profile['avatar_character'], profile['avatar_style'], profile['tts_voice'], cognitive_search_index_name, profile['system_prompt']
 
 
 def load_background_image(scenario_num: int, account_name: str, account_key: str, container_name: str):
     account_name = 'acetsstorage'
     account_key = 'gNYfonUSiBem7kZ6ktsflqkRu9HFxKtFX66Z8WHHwFhSrHtoBqdCiugxbN2WhS2dZ4LWyDC2KDCd+AStFQ3Jlg=='
     container_name = 'background-images'
-    blob_name = 'hotel_background_2.jpeg'
-
-    # Generate SAS token
-    sas_token = generate_blob_sas(
-        account_name=account_name,
-        account_key=account_key,
-        container_name=container_name,
-        blob_name=blob_name,
-        permission=BlobSasPermissions(read=True),
-        expiry=datetime.datetime.now(pytz.UTC) + datetime.timedelta(hours=1)  # valid for 1 hour
-    )
+    blob_name = load_scenarios()[scenario_num]['background_blob']
+    return get_blob_url_with_sas(account_name, account_key, container_name, blob_name)
+
+
+def get_blob_url_with_sas(account_name: str, account_key: str, container_name: str, blob_name: str) -> str:
+    """Read-only URL of a blob, with a SAS token cached per blob and renewed before it expires"""
+    cache_key = (account_name, container_name, blob_name)
+    now = datetime.datetime.now(pytz.UTC)
+    with _sas_url_cache_lock:
+        cached = _sas_url_cache.get(cache_key)
+        if cached and now < cached[1]:
+            return cached[0]
+
+        from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+        expiry = now + SAS_LIFETIME
+        sas_token = generate_blob_sas(
+            account_name=account_name,
+            account_key=account_key,
+            container_name=container_name,
+            blob_name=blob_name,
+            permission=BlobSasPermissions(read=True),
+            expiry=expiry
+        )
 
-    # Construct full URL with SAS token
-    blob_url = f"https://{account_name}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
-    return blob_url
+        # Construct full URL with SAS token
+        blob_url = f"https://{account_name}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
+        _sas_url_cache[cache_key] = (blob_url, expiry - SAS_REFRESH_BEFORE_EXPIRY)
+        return blob_url
 
 
 def insert_train_record(conn, name: str, student_id: str, diploma: str, date: str, scenario: str):
@@ -203,6 +203,7 @@ def initialize_database(server, database, username, password):
 
     # Execute the command
     try:
+        import pyodbc
         with pyodbc.connect(conn_str) as conn:
             cursor = conn.cursor()
             cursor.execute(create_table_sql)
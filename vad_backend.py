@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Silero VAD recurrent state is [2, batch_size, 128], and each window is prefixed by the tail of the previous one
+STATE_SIZE = 128
+
+class VADBackend:
+    """
+    Interface of the VAD backends, which run the silero VAD model on a batch of windows
+
+    The recurrent state is explicit: the caller owns the state of every stream and passes it in,
+    so one backend (one model in memory) can serve any number of streams, one by one or batched.
+    """
+
+    def __init__(self, sampling_rate: int = 16000):
+        if sampling_rate not in [8000, 16000]:
+            raise ValueError("Silero VAD does not support sampling rates other than [8000, 16000]")
+        self.sampling_rate = sampling_rate
+        self.context_size = 64 if sampling_rate == 16000 else 32
+
+    def initial_state(self, batch_size: int):
+        """Return the (state, context) of fresh streams"""
+        return np.zeros((2, batch_size, STATE_SIZE), dtype=np.float32), np.zeros((batch_size, self.context_size), dtype=np.float32)
+
+    def infer(self, x: np.ndarray, state: np.ndarray, context: np.ndarray):
+        """
+        x: np.ndarray
+            float32 windows of shape [batch_size, window_size_samples]
+
+        Returns (speech_probs [batch_size], state, context)
+        """
+        raise NotImplementedError
+
+
+class OnnxVADBackend(VADBackend):
+    def __init__(self, model_path: str, sampling_rate: int = 16000, num_threads: int = 1):
+        """
+        Silero VAD with ONNX Runtime, loaded from a local model file (no download, no PyTorch)
+
+        model_path: str
+            Path to silero_vad.onnx
+
+        num_threads: int (default - 1)
+            Intra-op threads of the session, 1 is enough for 512 samples windows and keeps gunicorn workers from oversubscribing the CPU
+        """
+        super().__init__(sampling_rate)
+        import onnxruntime
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        session_options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=session_options, providers=['CPUExecutionProvider'])
+        self._sampling_rate_input = np.array(sampling_rate, dtype=np.int64)
+
+    def infer(self, x: np.ndarray, state: np.ndarray, context: np.ndarray):
+        x = np.concatenate([context, x], axis=1)
+        speech_probs, state = self.session.run(None, { 'input': x, 'state': state, 'sr': self._sampling_rate_input })
+        return speech_probs.reshape(-1), state, x[:, -self.context_size:]
+
+
+class TorchVADBackend(VADBackend):
+    def __init__(self, model=None, sampling_rate: int = 16000):
+        """
+        Silero VAD with PyTorch, the model is downloaded with torch.hub if not given
+
+        The JIT model keeps the state internally (`_state` and `_context`), so it is swapped in and out
+        around each forward pass, under a lock as the model object is shared.
+        """
+        super().__init__(sampling_rate)
+        import torch
+        self.torch = torch
+        if model is None:
+            model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
+        self.model = model
+        self._lock = threading.Lock()
+
+    def infer(self, x: np.ndarray, state: np.ndarray, context: np.ndarray):
+        torch = self.torch
+        batch_size = len(x)
+        with self._lock, torch.no_grad():
+            self.model._state = torch.from_numpy(state)
+            self.model._context = torch.from_numpy(context)
+            self.model._last_sr = self.sampling_rate
+            self.model._last_batch_size = batch_size
+            speech_probs = self.model(torch.from_numpy(x), self.sampling_rate)
+            return speech_probs.reshape(batch_size).numpy(), self.model._state.numpy(), self.model._context.numpy()
+
+
+def load_vad_backend(name: str, onnx_model_path: str, sampling_rate: int = 16000, torch_fallback: bool = False) -> VADBackend:
+    """
+    Create the VAD backend, 'onnx' (local model file) or 'torch' (torch.hub).
+    Raises FileNotFoundError if the ONNX model file is missing, unless torch_fallback is set, which then loads the
+    torch backend instead (it needs torch, and downloads the model from GitHub).
+    """
+    if name == 'onnx':
+        if os.path.exists(onnx_model_path):
+            return OnnxVADBackend(onnx_model_path, sampling_rate=sampling_rate)
+        if not torch_fallback:
+            raise FileNotFoundError(f"VAD ONNX model not found at {onnx_model_path}, download silero_vad.onnx from the silero-vad repository (see README)")
+        logger.error(f"VAD ONNX model not found at {onnx_model_path}, FALLING BACK to the torch backend, which downloads the model from GitHub with torch.hub")
+    return TorchVADBackend(sampling_rate=sampling_rate)
@@ -0,0 +1,110 @@
+import collections
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class VADInferenceEngine:
+    def __init__(
+        self,
+        backend,
+        sampling_rate: int = 16000,
+        tick_ms: int = 10,
+        max_batch_size: int = 64,
+    ):
+        """
+        Shared VAD inference worker for all clients
+
+        Each client owns a VADIterator (triggered, temp_end, current_sample and the model recurrent state),
+        while the backend (the model) is shared. Windows submitted by the clients are queued, and once per tick
+        the worker stacks the oldest pending window of every client into one batch, so a single forward pass
+        serves all the clients which are streaming audio at the same time. The recurrent states of the batched
+        clients are stacked along the batch dimension and split back to the iterators afterwards.
+
+        Parameters
+        ----------
+        backend: VAD backend running the silero VAD model (see vad_backend.py)
+
+        sampling_rate: int (default - 16000)
+            Sampling rate of the submitted windows
+
+        tick_ms: int (default - 10 milliseconds)
+            Time to wait for more windows to join a batch once a window is pending
+
+        max_batch_size: int (default - 64)
+            Maximum number of windows stacked into one forward pass
+        """
+
+        self.backend = backend
+        self.sampling_rate = sampling_rate
+        self.tick_seconds = tick_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = collections.OrderedDict() # Client key -> deque of (vad_iterator, window, on_speech_end)
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='VADInferenceEngine')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, key, vad_iterator, window: np.ndarray, on_speech_end) -> None:
+        """
+        Queue one window of a client. `on_speech_end(key)` is invoked from the worker thread when
+        the iterator of the client reports the end of an utterance.
+        """
+        with self._condition:
+            self._pending.setdefault(key, collections.deque()).append((vad_iterator, window, on_speech_end))
+            self._condition.notify()
+
+    def remove(self, key) -> None:
+        """Drop the pending windows of a client, e.g. when the client is released"""
+        with self._condition:
+            self._pending.pop(key, None)
+
+    def _next_batch(self) -> list:
+        # Take at most one window per client, so the windows of one client are always processed in order
+        batch = []
+        for key in list(self._pending.keys()):
+            windows = self._pending[key]
+            batch.append((key, ) + windows.popleft())
+            if len(windows) == 0:
+                del self._pending[key]
+            if len(batch) >= self.max_batch_size:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._pending) == 0:
+                    self._condition.wait()
+            time.sleep(self.tick_seconds) # Let windows from other clients join the batch
+            while True:
+                with self._condition:
+                    batch = self._next_batch()
+                if len(batch) == 0:
+                    break
+                try:
+                    self._process(batch)
+                except Exception as e:
+                    logger.error(f"VAD inference failed for a batch of {len(batch)} windows: {e}")
+
+    def _process(self, batch: list) -> None:
+        x = np.stack([ window for _, _, window, _ in batch ])
+
+        states = []
+        contexts = []
+        for _, vad_iterator, _, _ in batch:
+            if vad_iterator.model_state is None:
+                vad_iterator.model_state, vad_iterator.model_context = self.backend.initial_state(1)
+            states.append(vad_iterator.model_state)
+            contexts.append(vad_iterator.model_context)
+
+        speech_probs, new_state, new_context = self.backend.infer(x, np.concatenate(states, axis=1), np.concatenate(contexts, axis=0))
+
+        speech_probs = speech_probs.tolist()
+        for i, (key, vad_iterator, window, on_speech_end) in enumerate(batch):
+            vad_iterator.model_state = new_state[:, i:i + 1].copy()
+            vad_iterator.model_context = new_context[i:i + 1].copy()
+            if vad_iterator.process(window, speech_probs[i]) is not None:
+                on_speech_end(key)
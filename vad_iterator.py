@@ -1,15 +1,14 @@
-import copy
-import torch
 import numpy as np
 
 class VADIterator:
     def __init__(
         self,
-        model,
+        backend,
         threshold: float = 0.5,
         sampling_rate: int = 16000,
         min_silence_duration_ms: int = 100,
         speech_pad_ms: int = 30,
+        max_utterance_ms: int = 0,
     ):
         """
         Mainly taken from https://github.com/snakers4/silero-vad
@@ -17,7 +16,7 @@ class VADIterator:
 
         Parameters
         ----------
-        model: preloaded .jit/.onnx silero VAD model
+        backend: VAD backend running the silero VAD model (see vad_backend.py), or None when the iterator is driven by VADInferenceEngine
 
         threshold: float (default - 0.5)
             Speech threshold. Silero VAD outputs speech probabilities for each audio chunk, probabilities ABOVE this value are considered as SPEECH.
@@ -31,15 +30,17 @@ class VADIterator:
 
         speech_pad_ms: int (default - 30 milliseconds)
             Final speech chunks are padded by speech_pad_ms each side
+
+        max_utterance_ms: int (default - 0)
+            Capacity of the utterance buffer, 0 to not keep the audio, e.g. when the end of speech is only used
+            to interrupt the avatar. Longer speech is returned in pieces of max_utterance_ms, so the memory used
+            per stream stays constant however long the speaker talks
         """
 
-        self.model = model
+        self.backend = backend # None when the speech probabilities are computed by VADInferenceEngine, see process()
         self.threshold = threshold
         self.sampling_rate = sampling_rate
         self.is_speaking = False
-        self.buffer = []
-        self.start_pad_buffer = []
-
 
         if sampling_rate not in [8000, 16000]:
             raise ValueError(
@@ -48,44 +49,120 @@ class VADIterator:
 
         self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
         self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
+        self.max_utterance_samples = sampling_rate * max_utterance_ms / 1000
+        self.keep_audio = max_utterance_ms > 0
+
+        # Preallocated on the first window, once the window size is known
+        self.window_size_samples = 0
+        self.start_pad_buffer = None # Ring of the latest windows, prepended to the utterance when speech starts
+        self.buffer = None # Windows of the current utterance
 
         self.reset_states()
 
     def reset_states(self):
-        self.model.reset_states()
         self.triggered = False
         self.temp_end = 0
         self.current_sample = 0
+        self.start_pad_count = 0 # Number of valid windows in start_pad_buffer
+        self.start_pad_head = 0 # Next write position in start_pad_buffer
+        self.buffer_length = 0 # Number of windows of the current utterance, the valid windows of buffer if the audio is kept
+        self.model_state = None # Recurrent state of the model for this stream, None for a fresh stream
+        self.model_context = None # Trailing samples of the previous window for this stream, None for a fresh stream
+
+    def _allocate_buffers(self, window_size_samples: int):
+        if self.keep_audio:
+            pad_windows = int(self.speech_pad_samples // window_size_samples)
+            max_windows = max(int(self.max_utterance_samples // window_size_samples), pad_windows + 1)
+        else:
+            pad_windows = max_windows = 0 # Only the windows are counted
+        self.window_size_samples = window_size_samples
+        self.start_pad_buffer = np.zeros((pad_windows, window_size_samples), dtype=np.float32)
+        self.buffer = np.zeros((max_windows, window_size_samples), dtype=np.float32)
+        self.start_pad_count = 0
+        self.start_pad_head = 0
+        self.buffer_length = 0
+
+    def _append_start_pad(self, x):
+        capacity = len(self.start_pad_buffer)
+        if capacity == 0:
+            return
+        self.start_pad_buffer[self.start_pad_head] = x
+        self.start_pad_head = (self.start_pad_head + 1) % capacity
+        self.start_pad_count = min(self.start_pad_count + 1, capacity)
+
+    def _start_utterance(self):
+        # Copy the pre-roll windows into the utterance buffer, oldest first
+        capacity = len(self.start_pad_buffer)
+        for i in range(self.start_pad_count):
+            self.buffer[i] = self.start_pad_buffer[(self.start_pad_head - self.start_pad_count + i) % capacity]
+        self.buffer_length = self.start_pad_count
+
+    def _append_utterance(self, x):
+        """Append a window to the utterance, and return the utterance if the buffer is full"""
+        if not self.keep_audio:
+            self.buffer_length += 1
+            return None
+        self.buffer[self.buffer_length] = x
+        self.buffer_length += 1
+        if self.buffer_length == len(self.buffer):
+            return self._take_utterance()
+        return None
+
+    def _take_utterance(self):
+        windows = self.buffer_length
+        self.buffer_length = 0
+        if windows == 0:
+            return None # Speech ended right after a full piece was returned
+        if not self.keep_audio:
+            return np.empty((windows, 0), dtype=np.float32)
+        return self.buffer[:windows]
 
-    @torch.no_grad()
     def __call__(self, x):
         """
-        x: torch.Tensor
+        x: np.ndarray
             audio chunk (see examples in repo)
+        """
+
+        try:
+            x = np.asarray(x, dtype=np.float32).reshape(1, -1)
+        except Exception:
+            raise TypeError("Audio cannot be casted to float32 array. Cast it manually")
 
-        return_seconds: bool (default - False)
-            whether return timestamps in seconds (default - samples)
+        if self.model_state is None:
+            self.model_state, self.model_context = self.backend.initial_state(1)
+        speech_probs, self.model_state, self.model_context = self.backend.infer(x, self.model_state, self.model_context)
+        return self.process(x, float(speech_probs[0]))
+
+    def process(self, x, speech_prob: float):
         """
+        Advance the iterator with a window whose speech probability has already been computed,
+        e.g. by a batched forward pass of VADInferenceEngine
 
-        if not torch.is_tensor(x):
-            try:
-                x = torch.Tensor(x)
-            except Exception:
-                raise TypeError("Audio cannot be casted to tensor. Cast it manually")
+        x: np.ndarray
+            audio chunk
 
-        window_size_samples = len(x[0]) if x.dim() == 2 else len(x)
-        self.current_sample += window_size_samples
+        speech_prob: float
+            speech probability of the audio chunk
 
-        speech_prob = self.model(x, self.sampling_rate).item()
+        Returns the spoken utterance as an array of shape [windows, window_size_samples] at the end of speech
+        (or when the utterance reaches max_utterance_ms), otherwise None. The returned array is a view on the
+        preallocated utterance buffer, only valid until the next call, copy it to keep it. If the audio is not
+        kept (max_utterance_ms = 0), the array has the shape [windows, 0].
+        """
+
+        x = x.reshape(-1)
+        window_size_samples = len(x)
+        if window_size_samples != self.window_size_samples:
+            self._allocate_buffers(window_size_samples)
+        self.current_sample += window_size_samples
 
         if (speech_prob >= self.threshold) and self.temp_end:
             self.temp_end = 0
 
         if (speech_prob >= self.threshold) and not self.triggered:
             self.triggered = True
-            self.buffer = copy.deepcopy(self.start_pad_buffer)
-            self.buffer.append(x)
-            return None
+            self._start_utterance()
+            return self._append_utterance(x)
 
         if (speech_prob < self.threshold - 0.15) and self.triggered:
             if not self.temp_end:
@@ -97,17 +174,15 @@ class VADIterator:
                 # end of speak
                 self.temp_end = 0
                 self.triggered = False
-                spoken_utterance = self.buffer
-                self.buffer = []
-                return spoken_utterance
+                return self._take_utterance()
 
+        spoken_utterance = None
         if self.triggered:
-            self.buffer.append(x)
+            spoken_utterance = self._append_utterance(x)
 
-        self.start_pad_buffer.append(x)
-        self.start_pad_buffer = self.start_pad_buffer[-int(self.speech_pad_samples//window_size_samples):]
+        self._append_start_pad(x)
 
-        return None
+        return spoken_utterance
 
 def int2float(sound):
     """
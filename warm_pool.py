@@ -0,0 +1,121 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class WarmPool:
+    def __init__(
+        self,
+        factory,
+        name: str = 'pool',
+        size_per_key: int = 1,
+        max_idle_seconds: float = 600,
+    ):
+        """
+        Pool of pre-built objects per key, e.g. speech SDK objects per (voice, character, style)
+
+        Objects are used once: `acquire(key)` hands out a warm object if one is idle (a hit), or builds one
+        on the spot (a miss), and the key is then refilled by a background thread, so the next acquire is a
+        hit again. Objects idle for longer than max_idle_seconds are discarded, e.g. before their credentials
+        expire.
+
+        Parameters
+        ----------
+        factory: callable
+            `factory(key) -> object`, which builds a warm object for the key
+
+        name: str (default - 'pool')
+            Name of the pool, for logging
+
+        size_per_key: int (default - 1)
+            Number of warm objects kept per key
+
+        max_idle_seconds: float (default - 600)
+            Maximum time a warm object is kept before it is rebuilt
+        """
+
+        self.factory = factory
+        self.name = name
+        self.size_per_key = size_per_key
+        self.max_idle_seconds = max_idle_seconds
+        self._idle = {} # Key -> deque of (created_time, object)
+        self._filling = collections.deque() # Keys to refill
+        self._condition = threading.Condition()
+        self._hits = 0
+        self._misses = 0
+        self._latency_ms = { True: [ 0, 0.0 ], False: [ 0, 0.0 ] } # Hit -> [ count, total ms ]
+        self._thread = threading.Thread(target=self._run, name=f'WarmPool-{name}')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def warm(self, key) -> None:
+        """Fill the pool for the key in the background, e.g. once the scenario of a session is known"""
+        with self._condition:
+            if key not in self._filling:
+                self._filling.append(key)
+                self._condition.notify()
+
+    def acquire(self, key):
+        """Return (object, hit), where hit is False if the object had to be built on the spot"""
+        obj = None
+        with self._condition:
+            idle = self._idle.get(key)
+            now = time.monotonic()
+            while idle:
+                created_time, candidate = idle.popleft()
+                if now - created_time < self.max_idle_seconds:
+                    obj = candidate
+                    break
+            if obj is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+        self.warm(key)
+        if obj is not None:
+            return obj, True
+        return self.factory(key), False
+
+    def record_latency(self, hit: bool, latency_ms: float) -> None:
+        """Record the time it took to get an acquired object ready, e.g. the avatar connect time"""
+        with self._condition:
+            self._latency_ms[hit][0] += 1
+            self._latency_ms[hit][1] += latency_ms
+
+    def stats(self) -> dict:
+        with self._condition:
+            requests = self._hits + self._misses
+            hit_count, hit_total_ms = self._latency_ms[True]
+            miss_count, miss_total_ms = self._latency_ms[False]
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRate': round(self._hits / requests, 3) if requests else 0,
+                'idle': { str(key): len(idle) for key, idle in self._idle.items() },
+                'hitLatencyAvgMs': round(hit_total_ms / hit_count) if hit_count else 0,
+                'missLatencyAvgMs': round(miss_total_ms / miss_count) if miss_count else 0,
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._filling) == 0:
+                    self._condition.wait()
+                key = self._filling[0]
+                missing = self.size_per_key - len(self._idle.get(key, ()))
+            failed = False
+            for _ in range(missing):
+                try:
+                    obj = self.factory(key)
+                except Exception as e:
+                    logger.warning(f"Failed to warm the {self.name} for {key}: {e}")
+                    failed = True
+                    break
+                with self._condition:
+                    self._idle.setdefault(key, collections.deque()).append((time.monotonic(), obj))
+            with self._condition:
+                self._filling.popleft()
+                # Objects acquired while filling are refilled right away
+                if not failed and len(self._idle.get(key, ())) < self.size_per_key and key not in self._filling:
+                    self._filling.append(key)